@@ -0,0 +1,209 @@
+import wave
+import logging
+import subprocess
+from contextlib import closing
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+from moviepy.config import FFMPEG_BINARY
+from config import AUDIO_SAMPLE_RATE, AUDIO_CHUNK_SECONDS
+
+
+def _decode_cmd(
+    path: str, sample_rate: int, start: Optional[float], duration: Optional[float]
+) -> List[str]:
+    cmd = [FFMPEG_BINARY, "-v", "error"]
+    if start is not None:
+        cmd += ["-ss", f"{start:.6f}"]
+    if duration is not None:
+        cmd += ["-t", f"{duration:.6f}"]
+    cmd += ["-i", path, "-vn", "-f", "f32le", "-ac", "2", "-ar", str(sample_rate), "-"]
+    return cmd
+
+
+def decode_audio(
+    path: str,
+    sample_rate: int = AUDIO_SAMPLE_RATE,
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Decode (a cut of) an audio or video file's soundtrack in one ffmpeg pass.
+
+    Returns:
+        np.ndarray: float32 samples of shape (n, 2).
+    """
+    cmd = _decode_cmd(path, sample_rate, start, duration)
+    result = subprocess.run(cmd, capture_output=True, check=True)
+    return np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, 2)
+
+
+def iter_audio(
+    path: str,
+    chunk_samples: int,
+    sample_rate: int = AUDIO_SAMPLE_RATE,
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+) -> Iterator[np.ndarray]:
+    """
+    Like ``decode_audio``, but yields the samples ``chunk_samples`` at a time as
+    ffmpeg decodes them, so a long soundtrack is never held whole.
+
+    Yields:
+        np.ndarray: float32 samples of shape (n, 2).
+    """
+    process = subprocess.Popen(
+        _decode_cmd(path, sample_rate, start, duration),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    data = b""
+    try:
+        while True:
+            data = process.stdout.read(chunk_samples * 8)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype=np.float32).reshape(-1, 2)
+    finally:
+        if process.poll() is None and data:
+            # Closed early; the rest isn't wanted
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, process.args)
+
+
+class AudioMixer:
+    """
+    Mixes the whole soundtrack into one preallocated sample buffer.
+
+    Every source is decoded once, straight into its offset in the buffer, so
+    mixing is a single linear pass and no decoder stays open. The background is
+    ducked under the voice lines with short linear fades.
+    """
+
+    def __init__(self, duration: float, sample_rate: int = AUDIO_SAMPLE_RATE) -> None:
+        """
+        Initialize the AudioMixer.
+
+        Args:
+            duration (float): Length of the soundtrack in seconds.
+            sample_rate (int): Output sample rate.
+        """
+        self.sample_rate = sample_rate
+        self.buffer = np.zeros((int(round(duration * sample_rate)), 2), np.float32)
+        self.logger = logging.getLogger("AudioMixer")
+
+    def _place(self, samples: np.ndarray, start: float, gain: float = 1.0) -> None:
+        offset = int(round(start * self.sample_rate))
+        end = min(len(self.buffer), offset + len(samples))
+        if end <= offset:
+            return
+        if gain == 1.0:
+            self.buffer[offset:end] += samples[: end - offset]
+        else:
+            self.buffer[offset:end] += samples[: end - offset] * gain
+
+    def add(self, path: str, start: float, gain: float = 1.0) -> None:
+        """Decode an audio file and mix it in at ``start`` seconds."""
+        self._place(decode_audio(path, self.sample_rate), start, gain)
+
+    def ducking_envelope(
+        self,
+        intervals: List[Tuple[float, float]],
+        gain: float,
+        fade: float,
+        first: int = 0,
+        end: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Per-sample gain that is ``gain`` inside the intervals, 1 outside, with
+        linear fades of ``fade`` seconds just outside each interval. Covers
+        samples ``first`` to ``end`` of the buffer (all of it by default).
+        """
+        n = (len(self.buffer) if end is None else end) - first
+        envelope = np.ones(n, np.float32)
+        fade_n = max(1, int(fade * self.sample_rate))
+        ramp = np.linspace(1.0, gain, fade_n, dtype=np.float32)
+        for start, stop in intervals:
+            s = int(round(start * self.sample_rate)) - first
+            e = int(round(stop * self.sample_rate)) - first
+            if e + fade_n <= 0 or s - fade_n >= n:
+                continue
+            envelope[max(0, s) : max(0, min(n, e))] = gain
+
+            # Fade down before the line and back up after it, never undoing a
+            # neighbouring line's duck
+            lo, hi = max(0, s - fade_n), max(0, min(n, s))
+            if hi > lo:
+                offset = lo - (s - fade_n)
+                envelope[lo:hi] = np.minimum(
+                    envelope[lo:hi], ramp[offset : offset + hi - lo]
+                )
+            lo, hi = max(0, e), min(n, e + fade_n)
+            if hi > lo:
+                offset = lo - e
+                envelope[lo:hi] = np.minimum(
+                    envelope[lo:hi], ramp[::-1][offset : offset + hi - lo]
+                )
+        return envelope
+
+    def add_background(
+        self,
+        cuts: List[Tuple[str, float, float]],
+        duck_intervals: List[Tuple[float, float]],
+        volume: float = 1.0,
+        duck_gain: float = 1.0,
+        fade: float = 0.0,
+    ) -> None:
+        """
+        Mix in background footage audio, ducked under the given intervals.
+
+        Args:
+            cuts (List[Tuple[str, float, float]]): (path, start, end) cuts played
+                back to back from time 0.
+            duck_intervals (List[Tuple[float, float]]): When voices are playing.
+            volume (float): Overall background gain.
+            duck_gain (float): Extra gain applied while a voice is playing.
+            fade (float): Duck fade length in seconds.
+        """
+        # Streamed into place a chunk at a time, so no full-length copy of the
+        # background or its envelope is ever made
+        chunk = max(1, int(AUDIO_CHUNK_SECONDS * self.sample_rate))
+        position = 0
+        for path, start, end in cuts:
+            cut_end = min(
+                len(self.buffer),
+                position + int(round((end - start) * self.sample_rate)),
+            )
+            offset = position
+            with closing(
+                iter_audio(path, chunk, self.sample_rate, start, end - start)
+            ) as chunks:
+                for samples in chunks:
+                    length = min(len(samples), cut_end - offset)
+                    if length <= 0:
+                        break
+                    envelope = volume * self.ducking_envelope(
+                        duck_intervals, duck_gain, fade, offset, offset + length
+                    )
+                    self.buffer[offset : offset + length] += (
+                        samples[:length] * envelope[:, None]
+                    )
+                    offset += length
+            position = cut_end
+            if position >= len(self.buffer):
+                break
+
+    def write_wav(self, path: str) -> str:
+        """Write the mix as 16-bit PCM WAV (clipping anything out of range)."""
+        chunk = max(1, int(AUDIO_CHUNK_SECONDS * self.sample_rate))
+        with wave.open(path, "wb") as f:
+            f.setnchannels(2)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            for first in range(0, len(self.buffer), chunk):
+                block = self.buffer[first : first + chunk]
+                pcm = (np.clip(block, -1.0, 1.0) * 32767).astype("<i2")
+                f.writeframes(pcm.tobytes())
+        return path
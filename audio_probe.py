@@ -0,0 +1,191 @@
+import os
+import json
+import logging
+from typing import Optional, Tuple
+
+# Bitrates in kbps, indexed by [MPEG-1?][layer][bitrate index]
+_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates by version bits (0: MPEG-2.5, 2: MPEG-2, 3: MPEG-1)
+_SAMPLE_RATES = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000),
+}
+
+
+def _parse_header(data: bytes, pos: int) -> Optional[Tuple[int, int, int, bool, bool]]:
+    """
+    Decode the 4-byte MPEG audio frame header at ``pos``.
+
+    Returns:
+        Optional[Tuple[int, int, int, bool, bool]]: (frame length in bytes,
+            samples per frame, sample rate, MPEG-1, mono), or None if ``pos``
+            does not hold a valid header.
+    """
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = (b1 >> 3) & 3
+    layer = 4 - ((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        # Reserved values, or free-format streams whose frame size is implicit
+        return None
+
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if layer == 2 or mpeg1 else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    return length, samples, sample_rate, mpeg1, (b3 >> 6) == 3
+
+
+def _skip_id3v2(data: bytes) -> int:
+    """Offset of the first byte after a leading ID3v2 tag (0 if there is none)."""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    # Tag size is a 28-bit "syncsafe" integer (7 bits per byte)
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def mp3_duration(path: str) -> float:
+    """
+    Duration of an MP3 file in seconds, read from its frame headers without
+    decoding any audio.
+
+    A Xing/Info or VBRI header in the first frame gives the frame count
+    directly. Otherwise (e.g. edge-tts output, which is plain CBR) every frame
+    header is visited by jumping from one frame to the next.
+
+    Args:
+        path (str): The MP3 file.
+
+    Returns:
+        float: Duration in seconds.
+
+    Raises:
+        ValueError: If no MPEG audio frame is found.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    pos = _skip_id3v2(data)
+    # Find the first frame (one followed by another frame, or by the end of the
+    # file), tolerating junk between the tag and the audio
+    while True:
+        first = _parse_header(data, pos)
+        if first is not None and (
+            pos + first[0] >= len(data) or _parse_header(data, pos + first[0])
+        ):
+            break
+        pos = data.find(b"\xff", pos + 1)
+        if pos < 0:
+            raise ValueError(f"No MPEG audio frames found in {path}")
+
+    length, samples, sample_rate, mpeg1, mono = first
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    xing = pos + 4 + side_info
+    if data[xing : xing + 4] in (b"Xing", b"Info"):
+        flags = int.from_bytes(data[xing + 4 : xing + 8], "big")
+        if flags & 1:
+            frames = int.from_bytes(data[xing + 8 : xing + 12], "big")
+            return frames * samples / sample_rate
+    vbri = pos + 4 + 32
+    if data[vbri : vbri + 4] == b"VBRI":
+        frames = int.from_bytes(data[vbri + 14 : vbri + 18], "big")
+        return frames * samples / sample_rate
+
+    duration = 0.0
+    while pos + 4 <= len(data):
+        header = _parse_header(data, pos)
+        if header is None:
+            if data[pos : pos + 3] == b"TAG":
+                # ID3v1 tag at the end of the file
+                break
+            pos = data.find(b"\xff", pos + 1)
+            if pos < 0:
+                break
+            continue
+        if pos + header[0] > len(data):
+            # Truncated last frame
+            break
+        duration += header[1] / header[2]
+        pos += header[0]
+    return duration
+
+
+def duration_path(audio_path: str) -> str:
+    """
+    Returns the path of the duration sidecar kept next to an audio file.
+
+    Example:
+        Input: 'audio_assests/peter_audio_1.mp3'
+        Output: 'audio_assests/peter_audio_1.duration.json'
+    """
+    return f"{os.path.splitext(audio_path)[0]}.duration.json"
+
+
+def audio_duration(audio_path: str) -> float:
+    """
+    Duration of an audio file in seconds, without decoding it.
+
+    The result is cached in a sidecar next to the file and reused while the
+    file's size and mtime are unchanged. MP3s are measured from their frame
+    headers; anything else falls back to ffmpeg's container probe.
+
+    Args:
+        audio_path (str): The audio file.
+
+    Returns:
+        float: Duration in seconds.
+    """
+    st = os.stat(audio_path)
+    sidecar = duration_path(audio_path)
+    try:
+        with open(sidecar, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+            return cached["duration"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    try:
+        duration = mp3_duration(audio_path)
+    except ValueError:
+        # Not an MP3; let ffmpeg read the container header instead
+        from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+        duration = ffmpeg_parse_infos(audio_path)["duration"]
+
+    try:
+        with open(sidecar, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns,
+                    "duration": duration,
+                },
+                f,
+            )
+    except OSError as e:
+        logging.getLogger("AudioProbe").warning(
+            f"Could not cache duration of {audio_path}: {e}"
+        )
+    return duration
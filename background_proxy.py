@@ -0,0 +1,152 @@
+import os
+import hashlib
+import logging
+import subprocess
+from typing import Optional, Tuple
+from moviepy.config import FFMPEG_BINARY
+from config import PROXY_CACHE_DIR, PROXY_CACHE_MAX_BYTES
+from disk_cache import DiskCache
+
+
+def profile_filter(size: Optional[Tuple[int, int]], fps: int) -> str:
+    """ffmpeg video filter that brings footage to the output profile."""
+    filters = []
+    if size is not None:
+        w, h = size
+        # Fill the frame, then centre-crop the overflow
+        filters += [
+            f"scale={w}:{h}:force_original_aspect_ratio=increase",
+            f"crop={w}:{h}",
+            "setsar=1",
+        ]
+    filters += [f"fps={fps}", "format=yuv420p"]
+    return ",".join(filters)
+
+
+class BackgroundProxyCache:
+    """
+    Transcodes background footage once into a proxy that already matches the
+    output profile (size, frame rate, pixel format), so renders decode a stream
+    with nothing left to scale or drop.
+
+    Proxies are keyed by the hash of the source file's content plus the profile.
+    Source hashes are remembered per (path, size, mtime), so an unchanged source
+    is not re-read on every run. Proxies use a fixed GOP with a keyframe every
+    ``keyframe_interval`` seconds, so random start offsets and parallel render
+    parts seek cheaply.
+    """
+
+    keyframe_interval: float = 1.0
+
+    def __init__(
+        self,
+        cache_dir: str = PROXY_CACHE_DIR,
+        max_bytes: int = PROXY_CACHE_MAX_BYTES,
+        crf: int = 18,
+        preset: str = "veryfast",
+    ) -> None:
+        """
+        Initialize the BackgroundProxyCache.
+
+        Args:
+            cache_dir (str): Directory for proxies and source hashes.
+            max_bytes (int): Size bound for the proxies.
+            crf (int): x264 quality of the proxy (lower is better).
+            preset (str): x264 preset used for the one-off transcode.
+        """
+        self.crf = crf
+        self.preset = preset
+        self.proxies = DiskCache.shared(
+            os.path.join(cache_dir, "videos"),
+            max_bytes,
+            suffix=".mp4",
+            name="BackgroundProxyCache",
+        )
+        self.hashes = DiskCache.shared(
+            os.path.join(cache_dir, "hashes"),
+            max(1, max_bytes // 1024),
+            suffix=".sha256",
+            name="BackgroundProxyCache.hashes",
+        )
+        self.logger = logging.getLogger("BackgroundProxyCache")
+
+    def source_hash(self, path: str) -> str:
+        """SHA-256 of a file's content, cached against its path, size and mtime."""
+        st = os.stat(path)
+        key = DiskCache.make_key(
+            "source", os.path.abspath(path), st.st_size, st.st_mtime_ns
+        )
+        cached = self.hashes.get(key)
+        if cached is not None:
+            with open(cached, "r", encoding="utf-8") as f:
+                return f.read().strip()
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        source_hash = digest.hexdigest()
+        self.hashes.put_bytes(key, source_hash.encode())
+        return source_hash
+
+    def get(self, source_path: str, size: Optional[Tuple[int, int]], fps: int) -> str:
+        """
+        Return a proxy of ``source_path`` for the given profile, transcoding it
+        on the first request.
+
+        Args:
+            source_path (str): Original background footage.
+            size (Optional[Tuple[int, int]]): Output (width, height); None keeps
+                the source size.
+            fps (int): Output frame rate.
+
+        Returns:
+            str: Path of the cached proxy.
+        """
+        vf = profile_filter(size, fps)
+        gop = max(1, round(fps * self.keyframe_interval))
+        key = DiskCache.make_key(
+            "proxy", self.source_hash(source_path), vf, self.crf, self.preset, gop
+        )
+        cached = self.proxies.get(key)
+        if cached is not None:
+            return cached
+
+        self.logger.info(f"Building background proxy for {source_path} ({vf})...")
+        tmp_path = self.proxies.reserve(key)
+        try:
+            subprocess.run(
+                [
+                    FFMPEG_BINARY,
+                    "-y",
+                    "-loglevel",
+                    "error",
+                    "-i",
+                    source_path,
+                    "-vf",
+                    vf,
+                    "-c:v",
+                    "libx264",
+                    "-preset",
+                    self.preset,
+                    "-crf",
+                    str(self.crf),
+                    # Keyframes exactly every keyframe_interval (no scene cuts)
+                    "-g",
+                    str(gop),
+                    "-keyint_min",
+                    str(gop),
+                    "-sc_threshold",
+                    "0",
+                    "-c:a",
+                    "aac",
+                    "-movflags",
+                    "+faststart",
+                    tmp_path,
+                ],
+                check=True,
+            )
+        except Exception:
+            self.proxies.discard(tmp_path)
+            raise
+        return self.proxies.commit(key, tmp_path)
@@ -0,0 +1,421 @@
+import os
+import json
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+from build_manifest import BuildManifest
+from config import (
+    AUDIO_ASSETS_DIR,
+    BATCH_BUILDS_DIR,
+    BATCH_MAX_JOBS,
+    OUTPUT_VIDEO_PATH,
+    RENDER_WORKERS,
+    TITLE_SOUND_PATH,
+    VIDEO_TEMPLATE_PATH,
+    DialogueItem,
+)
+from utils import Utils
+
+if TYPE_CHECKING:
+    from disk_cache import DiskCache
+    from image_downloader import ImageDownloader
+    from voice_generator import VoiceGenerator
+
+SCRIPT_EXTENSIONS = (".json", ".yaml", ".yml")
+
+
+def load_script(path: str) -> Tuple[str, List[DialogueItem]]:
+    """
+    Read a script file: JSON or YAML holding either a list of dialogue items,
+    or an object with a "title" and a "dialogue" list. Without a title, the
+    file name is used.
+
+    Returns:
+        Tuple[str, List[DialogueItem]]: The video title and its dialogue.
+
+    Raises:
+        ValueError: If the file can't be parsed or doesn't match the
+            DialogueItem schema.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ValueError(f"{path}: reading YAML needs PyYAML.") from e
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    return parse_script(data, os.path.splitext(os.path.basename(path))[0], path)
+
+
+def parse_script(
+    data: Any, default_title: str, source: str = "script"
+) -> Tuple[str, List[DialogueItem]]:
+    """
+    Validate an already-parsed script (see ``load_script``).
+
+    Args:
+        data (Any): A list of dialogue items, or {"title", "dialogue"}.
+        default_title (str): Title used when the script has none.
+        source (str): Where the script came from, for error messages.
+
+    Raises:
+        ValueError: If it doesn't match the DialogueItem schema.
+    """
+    title = default_title
+    if isinstance(data, dict):
+        title = data.get("title") or title
+        data = data.get("dialogue")
+    if not isinstance(data, list) or not data:
+        raise ValueError(f"{source}: expected a non-empty list of dialogue items.")
+
+    for idx, item in enumerate(data):
+        if not isinstance(item, dict):
+            raise ValueError(f"{source}: line {idx} is not an object.")
+        for field in ("character", "sentence", "image"):
+            if not isinstance(item.get(field), str) or not item[field].strip():
+                raise ValueError(f"{source}: line {idx} has no '{field}'.")
+        if not isinstance(item.get("image_search", ""), str):
+            raise ValueError(f"{source}: line {idx} has a non-text 'image_search'.")
+    return str(title), data
+
+
+def find_scripts(source: str) -> List[str]:
+    """
+    Script files named by ``source``: a script file itself, every script in a
+    directory (sorted by name), or every entry of a ``.txt`` manifest listing
+    one script or directory per line (relative to the manifest; ``#`` starts a
+    comment).
+    """
+    if os.path.isdir(source):
+        return [
+            os.path.join(source, name)
+            for name in sorted(os.listdir(source))
+            if name.endswith(SCRIPT_EXTENSIONS)
+        ]
+    if source.endswith(".txt"):
+        base_dir = os.path.dirname(source)
+        scripts: List[str] = []
+        with open(source, "r", encoding="utf-8") as f:
+            for line in f:
+                entry = line.split("#", 1)[0].strip()
+                if entry:
+                    scripts += find_scripts(os.path.join(base_dir, entry))
+        return scripts
+    return [source]
+
+
+def build_paths(title: str, output_dir: str) -> Tuple[str, str, str]:
+    """
+    Where a script's build lives, by its title.
+
+    Returns:
+        Tuple[str, str, str]: The output video, the directory of its TTS audio,
+            and its build manifest.
+    """
+    safe_title = Utils.safe_title(title)
+    return (
+        os.path.join(output_dir, f"{safe_title}.mp4"),
+        os.path.join(AUDIO_ASSETS_DIR, safe_title),
+        os.path.join(BATCH_BUILDS_DIR, f"{safe_title}.json"),
+    )
+
+
+class SharedVoices:
+    """
+    One script's view of the batch's TTS: the VoiceGenerator interface the
+    StreamingRenderer uses, served from lines the batch synthesizes once for
+    every script. Each line is copied out of the TTS cache into the script's
+    own audio directory as soon as it is ready.
+    """
+
+    def __init__(
+        self, voice_generator: "VoiceGenerator", futures: Dict[str, Future]
+    ) -> None:
+        """
+        Initialize the SharedVoices.
+
+        Args:
+            voice_generator (VoiceGenerator): The batch's voice generator.
+            futures (Dict[str, Future]): Prefetch result for each TTS cache key.
+        """
+        self.voice_generator = voice_generator
+        self.futures = futures
+
+    def cache_key(self, text: str, voice: str) -> str:
+        return self.voice_generator.cache_key(text, voice)
+
+    def generate_batch(
+        self,
+        items: List[Tuple[str, str, int]],
+        on_done: Optional[Callable[[int, Optional[str]], None]] = None,
+        output_dir: Optional[str] = None,
+    ) -> List[Optional[str]]:
+        """Same contract as ``VoiceGenerator.generate_batch``."""
+        vg = self.voice_generator
+        waiting: Dict[Future, List[int]] = {}
+        for position, (text, speaker, _) in enumerate(items):
+            key = vg.cache_key(vg.sanitize_text(text), vg.voice_for(speaker))
+            waiting.setdefault(self.futures[key], []).append(position)
+
+        results: List[Optional[str]] = [None] * len(items)
+        for future in as_completed(waiting):
+            for position in waiting[future]:
+                text, speaker, index = items[position]
+                if future.result() is not None:
+                    results[position] = vg.materialize(
+                        text,
+                        speaker,
+                        vg.output_path_for(speaker, index, output_dir),
+                    )
+                if on_done is not None:
+                    on_done(position, results[position])
+        return results
+
+
+class SharedImages:
+    """
+    One script's view of the batch's image search: each distinct term is
+    searched once for every script, and scripts wait for the result.
+    """
+
+    def __init__(self, futures: Dict[str, Future], max_workers: int) -> None:
+        self.futures = futures
+        self.max_workers = max_workers
+
+    def search_images(self, term: str) -> List[str]:
+        return self.futures[term].result()
+
+
+class BatchRenderer:
+    """
+    Renders many scripts in one long-lived process.
+
+    Every distinct line (by TTS cache key) across all scripts is synthesized
+    once, on one event loop, in script order; every distinct image term is
+    searched once on one thread pool. A few scripts at a time then go through
+    the StreamingRenderer, all submitting segments to one pool of warm render
+    processes. Each script gets its own audio directory, build manifest and
+    output file named after its title, like OUTPUT_VIDEO_PATH.
+    """
+
+    def __init__(
+        self,
+        scripts: List[str],
+        voice_generator: "VoiceGenerator",
+        image_downloader: "ImageDownloader",
+        video_path: str = VIDEO_TEMPLATE_PATH,
+        output_dir: str = os.path.dirname(OUTPUT_VIDEO_PATH) or ".",
+        title_sound_path: str = TITLE_SOUND_PATH,
+        max_jobs: int = BATCH_MAX_JOBS,
+        render_workers: Optional[int] = RENDER_WORKERS,
+        **renderer_kwargs: Any,
+    ) -> None:
+        """
+        Initialize the BatchRenderer.
+
+        Args:
+            scripts (List[str]): Script files (see ``load_script``), in the
+                order they should be rendered.
+            voice_generator (VoiceGenerator): Synthesizes lines for every script.
+            image_downloader (ImageDownloader): Fetches images for every script.
+            video_path (str): Background clip or directory of clips.
+            output_dir (str): Where the videos are written.
+            title_sound_path (str): Sound played under each title.
+            max_jobs (int): Scripts rendered at the same time.
+            render_workers (Optional[int]): Size of the shared render pool;
+                None = one per core.
+            **renderer_kwargs: Further StreamingRenderer arguments.
+        """
+        self.scripts = scripts
+        self.voice_generator = voice_generator
+        self.image_downloader = image_downloader
+        self.video_path = video_path
+        self.output_dir = output_dir
+        self.title_sound_path = title_sound_path
+        self.max_jobs = max(1, max_jobs)
+        self.render_workers = render_workers or os.cpu_count() or 1
+        self.renderer_kwargs = renderer_kwargs
+        self.logger = logging.getLogger("BatchRenderer")
+
+    def _load(
+        self, results: Dict[str, Optional[str]]
+    ) -> List[Tuple[str, str, List[DialogueItem]]]:
+        """Parse every script, leaving out (and reporting) the invalid ones."""
+        jobs: List[Tuple[str, str, List[DialogueItem]]] = []
+        owners: Dict[str, str] = {}
+        for path in self.scripts:
+            results[path] = None
+            try:
+                title, dialogue = load_script(path)
+            except (OSError, ValueError) as e:
+                self.logger.error(f"Skipping {path}: {e}")
+                continue
+            safe_title = Utils.safe_title(title)
+            if safe_title in owners:
+                self.logger.error(
+                    f"Skipping {path}: its output {safe_title}.mp4 is already "
+                    f"written by {owners[safe_title]}."
+                )
+                continue
+            owners[safe_title] = path
+            jobs.append((path, title, dialogue))
+        return jobs
+
+    def _start_tts(
+        self, jobs: List[Tuple[str, str, List[DialogueItem]]]
+    ) -> Dict[str, Future]:
+        """Synthesize every distinct line in the background, in script order."""
+        vg = self.voice_generator
+        futures: Dict[str, Future] = {}
+        keys: List[str] = []
+        items: List[Tuple[str, str]] = []
+        for _, _, dialogue in jobs:
+            for item in dialogue:
+                key = vg.cache_key(
+                    vg.sanitize_text(item["sentence"]), vg.voice_for(item["character"])
+                )
+                if key not in futures:
+                    futures[key] = Future()
+                    keys.append(key)
+                    items.append((item["sentence"], item["character"]))
+
+        total = sum(len(dialogue) for _, _, dialogue in jobs)
+        self.logger.info(f"{len(items)} distinct lines to voice out of {total}.")
+
+        def run() -> None:
+            try:
+                vg.prefetch(
+                    items,
+                    on_done=lambda position, path: futures[keys[position]].set_result(
+                        path
+                    ),
+                )
+            except BaseException as e:
+                for future in futures.values():
+                    if not future.done():
+                        future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return futures
+
+    def _start_images(
+        self,
+        jobs: List[Tuple[str, str, List[DialogueItem]]],
+        pool: ThreadPoolExecutor,
+    ) -> Dict[str, Future]:
+        """Search every distinct image term in the background, in script order."""
+        futures: Dict[str, Future] = {}
+        for _, _, dialogue in jobs:
+            for item in dialogue:
+                term = item.get("image_search") or ""
+                if term and term not in futures:
+                    futures[term] = pool.submit(
+                        self.image_downloader.search_images, term
+                    )
+        self.logger.info(f"{len(futures)} distinct image terms to search.")
+        return futures
+
+    def _render(
+        self,
+        title: str,
+        dialogue: List[DialogueItem],
+        tts: Dict[str, Future],
+        images: Dict[str, Future],
+        render_pool: ProcessPoolExecutor,
+        segment_cache: "DiskCache",
+    ) -> str:
+        # Imported here, so parsing scripts doesn't load the media stack
+        from streaming import StreamingRenderer
+
+        output_path, audio_dir, manifest_path = build_paths(title, self.output_dir)
+        renderer = StreamingRenderer(
+            video_path=self.video_path,
+            output_path=output_path,
+            dialogue=dialogue,
+            voice_generator=SharedVoices(self.voice_generator, tts),
+            image_downloader=SharedImages(images, self.image_downloader.max_workers),
+            video_title=title,
+            title_sound_path=self.title_sound_path,
+            render_workers=self.render_workers,
+            manifest=BuildManifest(manifest_path),
+            render_pool=render_pool,
+            audio_dir=audio_dir,
+            segment_cache=segment_cache,
+            **self.renderer_kwargs,
+        )
+        start = time.monotonic()
+        renderer.run()
+        self.logger.info(f"Rendered {output_path} in {time.monotonic() - start:.1f}s.")
+        return output_path
+
+    def run(self) -> Dict[str, Optional[str]]:
+        """
+        Render every script. A script that fails doesn't stop the others.
+
+        Returns:
+            Dict[str, Optional[str]]: Output video for each script file, or
+                None where it failed.
+        """
+        results: Dict[str, Optional[str]] = {}
+        jobs = self._load(results)
+        if not jobs:
+            return results
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.logger.info(
+            f"Rendering {len(jobs)} scripts, {self.max_jobs} at a time, on "
+            f"{self.render_workers} render workers..."
+        )
+
+        image_pool = ThreadPoolExecutor(
+            max_workers=self.image_downloader.max_workers, thread_name_prefix="image"
+        )
+        render_pool = ProcessPoolExecutor(
+            max_workers=self.render_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        job_pool = ThreadPoolExecutor(
+            max_workers=self.max_jobs, thread_name_prefix="job"
+        )
+        # One cache for every job, so its size bound holds across them
+        from streaming import make_segment_cache
+
+        segment_cache = make_segment_cache()
+        try:
+            tts = self._start_tts(jobs)
+            images = self._start_images(jobs, image_pool)
+            futures = {
+                job_pool.submit(
+                    self._render,
+                    title,
+                    dialogue,
+                    tts,
+                    images,
+                    render_pool,
+                    segment_cache,
+                ): path
+                for path, title, dialogue in jobs
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    results[path] = future.result()
+                except Exception as e:
+                    self.logger.error(f"Failed to render {path}: {e}")
+        finally:
+            job_pool.shutdown(wait=True, cancel_futures=True)
+            image_pool.shutdown(wait=False, cancel_futures=True)
+            render_pool.shutdown(wait=True, cancel_futures=True)
+
+        done = sum(1 for output in results.values() if output)
+        self.logger.info(f"Batch finished: {done}/{len(results)} videos rendered.")
+        return results
@@ -0,0 +1,180 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from config import BUILD_MANIFEST_PATH, CHECKPOINT_INTERVAL
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """
+    What the last build of the script used and produced, line by line, so the
+    next build only redoes the lines whose inputs changed.
+
+    For every line and kind of output (``"audio"``, ``"image"``) it keeps the key
+    of the inputs and the paths and SHA-256 of the files produced from them. An
+    output is reused only while its inputs key matches and its files are still
+    there, unmodified. Rendered segments are kept in a content-addressed cache
+    under a key of everything they depend on. The manifest remembers which
+    background cut each segment was rendered over, so an unchanged line keeps its
+    footage (and its cache entry) when earlier lines change length. The
+    background chain itself is kept too.
+
+    While a build runs, its records are checkpointed on top of the previous
+    build's every few seconds, so a build that crashes or is killed resumes from
+    whatever it had finished.
+    """
+
+    version = 1
+
+    def __init__(
+        self,
+        path: str = BUILD_MANIFEST_PATH,
+        checkpoint_interval: float = CHECKPOINT_INTERVAL,
+    ) -> None:
+        """
+        Initialize the BuildManifest from the last saved build, if any.
+
+        Args:
+            path (str): JSON file holding the manifest.
+            checkpoint_interval (float): Least number of seconds between two
+                checkpoints, unless one is forced.
+        """
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self._last_checkpoint = 0.0
+        self.logger = logging.getLogger("BuildManifest")
+        self._lock = threading.Lock()
+        self._hashes: Dict[Tuple[str, int, int], str] = {}
+
+        data: Dict[str, Any] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if data.get("version") != self.version:
+            data = {}
+        self.background: List[List[Any]] = data.get("background", [])
+        self._lines: List[Dict[str, Any]] = data.get("lines", [])
+        self._segments: Dict[str, Dict[str, Any]] = data.get("segments", {})
+        self._new_lines: Dict[int, Dict[str, Any]] = {}
+        self._new_segments: Dict[str, Dict[str, Any]] = {}
+
+    def sha256(self, path: str) -> str:
+        """File hash, computed once per build for each version of the file."""
+        st = os.stat(path)
+        key = (path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            cached = self._hashes.get(key)
+        if cached is None:
+            cached = file_sha256(path)
+            with self._lock:
+                self._hashes[key] = cached
+        return cached
+
+    def outputs(self, idx: int, kind: str, inputs: str) -> Optional[List[str]]:
+        """
+        Files produced for line ``idx`` by the last build, if they can be reused.
+
+        Returns:
+            Optional[List[str]]: The paths, or None if the inputs changed or any
+                file is missing or modified.
+        """
+        if idx >= len(self._lines):
+            return None
+        entry = self._lines[idx].get(kind)
+        if not entry or entry["inputs"] != inputs:
+            return None
+        for path, sha256 in entry["outputs"]:
+            if not os.path.exists(path) or self.sha256(path) != sha256:
+                return None
+        return [path for path, _ in entry["outputs"]]
+
+    def record(self, idx: int, kind: str, inputs: str, paths: List[str]) -> None:
+        """Record the files produced for line ``idx`` from ``inputs``."""
+        entry = {
+            "inputs": inputs,
+            "outputs": [[path, self.sha256(path)] for path in paths],
+        }
+        with self._lock:
+            self._new_lines.setdefault(idx, {})[kind] = entry
+
+    def footage(self, line_key: str) -> Optional[List[List[Any]]]:
+        """Background cuts the segment for ``line_key`` was last rendered over."""
+        entry = self._segments.get(line_key)
+        return entry["footage"] if entry else None
+
+    def record_segment(
+        self, line_key: str, segment_key: str, footage: List[List[Any]]
+    ) -> None:
+        with self._lock:
+            self._new_segments[line_key] = {"key": segment_key, "footage": footage}
+
+    def _write(self, data: Dict[str, Any]) -> None:
+        """Atomically replace the manifest file with ``data``."""
+        manifest_dir = os.path.dirname(self.path) or "."
+        os.makedirs(manifest_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=manifest_dir, prefix=".tmp-", suffix=".json"
+        )
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def checkpoint(self, force: bool = False) -> None:
+        """
+        Write this build's records so far over the previous build's, keeping the
+        previous records of lines this build hasn't reached yet. Does nothing if
+        the last checkpoint is more recent than ``checkpoint_interval``, unless
+        ``force`` is set.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_checkpoint < self.checkpoint_interval:
+                return
+            self._last_checkpoint = now
+            n_lines = max(len(self._lines), max(self._new_lines, default=-1) + 1)
+            lines = []
+            for idx in range(n_lines):
+                entry = dict(self._lines[idx]) if idx < len(self._lines) else {}
+                entry.update(self._new_lines.get(idx, {}))
+                lines.append(entry)
+            data = {
+                "version": self.version,
+                "background": self.background,
+                "lines": lines,
+                "segments": {**self._segments, **self._new_segments},
+            }
+        try:
+            self._write(data)
+        except OSError as e:
+            self.logger.warning(f"Could not checkpoint the build manifest: {e}")
+
+    def save(self, n_lines: int) -> None:
+        """
+        Write this build's records, replacing the previous build's. Entries for
+        lines and segments that are no longer part of the script are dropped.
+        """
+        with self._lock:
+            data = {
+                "version": self.version,
+                "background": self.background,
+                "lines": [self._new_lines.get(idx, {}) for idx in range(n_lines)],
+                "segments": self._new_segments,
+            }
+        self._write(data)
+        self._lines = data["lines"]
+        self._segments = data["segments"]
@@ -0,0 +1,173 @@
+import string
+import logging
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+import PIL.Image
+from moviepy import TextClip, VideoClip
+from config import (
+    CAPTION_CACHE_DIR,
+    CAPTION_CACHE_MAX_BYTES,
+    CAPTION_MAX_WORKERS,
+)
+from disk_cache import DiskCache
+from tracing import tracer
+
+
+def save_rgba_png(clip: VideoClip, out_path: str) -> None:
+    """Save a clip's first frame, with its mask as the alpha channel, as a PNG."""
+    rgb = clip.get_frame(0)[..., :3]
+    if clip.mask is not None:
+        alpha = np.round(clip.mask.get_frame(0) * 255)
+    else:
+        alpha = np.full(rgb.shape[:2], 255)
+    rgba = np.dstack([rgb, alpha]).astype(np.uint8)
+    PIL.Image.fromarray(rgba, "RGBA").save(out_path, format="PNG")
+
+
+def _rasterize_caption(text: str, style: Dict[str, Any], out_path: str) -> None:
+    """
+    Render one caption with TextClip and save it as an RGBA PNG.
+    Module-level so it can run in a worker process.
+    """
+    clip = TextClip(text=text, **style)
+    save_rgba_png(clip, out_path)
+    clip.close()
+
+
+class CaptionRenderer:
+    """
+    Pre-renders subtitle captions to PNG rasters in a process pool.
+
+    Rasters are cached on disk keyed by the wrapped text and every style
+    parameter (font, size, colors, stroke, box size), so re-renders of an
+    unchanged script cost nothing.
+    """
+
+    def __init__(
+        self,
+        box_size: Tuple[int, int],
+        font: Optional[str] = None,
+        font_size: int = 50,
+        color: str = "white",
+        stroke_color: str = "black",
+        stroke_width: float = 4.0,
+        cache_dir: str = CAPTION_CACHE_DIR,
+        cache_max_bytes: int = CAPTION_CACHE_MAX_BYTES,
+        max_workers: Optional[int] = CAPTION_MAX_WORKERS,
+    ) -> None:
+        """
+        Initialize the CaptionRenderer.
+
+        Args:
+            box_size (Tuple[int, int]): (width, height) of the caption box in pixels.
+            font (Optional[str]): Path to a font file; None uses the TextClip default.
+            font_size (int): Font size in points.
+            color (str): Text fill color.
+            stroke_color (str): Outline color.
+            stroke_width (float): Outline width.
+            cache_dir (str): Directory for cached rasters.
+            cache_max_bytes (int): Size bound for the raster cache.
+            max_workers (Optional[int]): Worker processes; None uses every core,
+                1 renders in this process.
+        """
+        self.box_size = box_size
+        self.max_workers = max_workers
+        self.style: Dict[str, Any] = {
+            "font": font,
+            "font_size": font_size,
+            "color": color,
+            "stroke_color": stroke_color,
+            "stroke_width": stroke_width,
+            "vertical_align": "center",
+            "text_align": "center",
+            "horizontal_align": "center",
+            "method": "caption",
+            "size": box_size,
+        }
+        self.cache = DiskCache.shared(
+            cache_dir, cache_max_bytes, suffix=".png", name="CaptionRenderer.cache"
+        )
+        self.logger = logging.getLogger("CaptionRenderer")
+
+    def prepare_text(self, text: str) -> str:
+        """Strip unsupported characters (and markdown asterisks) and wrap at word boundaries."""
+        text = "".join(
+            c
+            for c in text
+            if (c.isalnum() or c in string.punctuation or c.isspace()) and c != "*"
+        )
+
+        # Approximate character width based on font size (rough estimate)
+        chars_per_line = int(self.box_size[0] / 30)  # ~30 pixels per char at size 50
+        return textwrap.fill(text, width=chars_per_line, break_long_words=False)
+
+    def cache_key(self, wrapped_text: str) -> str:
+        return DiskCache.make_key("caption", wrapped_text, self.style)
+
+    def _store(self, key: str, tmp_path: str, render: Callable[[], Any]) -> None:
+        """Commit the raster at ``tmp_path`` once ``render`` returns, or discard it."""
+        try:
+            render()
+            self.cache.commit(key, tmp_path)
+        except Exception as e:
+            self.logger.error(f"Failed to render caption: {e}")
+            self.cache.discard(tmp_path)
+
+    def render_many(self, texts: List[str]) -> List[Optional[str]]:
+        """
+        Rasterize every caption that isn't cached yet, in parallel. A single
+        caption, or every caption with ``max_workers=1``, is rendered in this
+        process rather than starting a pool.
+
+        Args:
+            texts (List[str]): Raw subtitle sentences.
+
+        Returns:
+            List[Optional[str]]: PNG path per input text, in order; None for empty
+                texts or captions that failed to render.
+        """
+        keys: List[Optional[str]] = []
+        missing: Dict[str, str] = {}
+        for text in texts:
+            wrapped = self.prepare_text(text) if text else ""
+            if not wrapped.strip():
+                keys.append(None)
+                continue
+            key = self.cache_key(wrapped)
+            keys.append(key)
+            if key not in missing and self.cache.get(key) is None:
+                missing[key] = wrapped
+
+        if missing:
+            self.logger.info(
+                f"Rendering {len(missing)} captions "
+                f"({len(texts) - len(missing)} cached)..."
+            )
+            with tracer.span("caption raster", cat="render", captions=len(missing)):
+                if self.max_workers == 1 or len(missing) == 1:
+                    for key, wrapped in missing.items():
+                        tmp_path = self.cache.reserve(key)
+                        self._store(
+                            key,
+                            tmp_path,
+                            lambda: _rasterize_caption(wrapped, self.style, tmp_path),
+                        )
+                else:
+                    with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                        jobs = {}
+                        for key, wrapped in missing.items():
+                            tmp_path = self.cache.reserve(key)
+                            future = pool.submit(
+                                _rasterize_caption, wrapped, self.style, tmp_path
+                            )
+                            jobs[future] = (key, tmp_path)
+
+                        for future, (key, tmp_path) in jobs.items():
+                            self._store(key, tmp_path, future.result)
+
+        return [
+            self.cache.path_for(key) if key and self.cache.contains(key) else None
+            for key in keys
+        ]
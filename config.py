@@ -1,4 +1,4 @@
-from typing import List, TypedDict
+from typing import List, Optional, Tuple, TypedDict
 
 
 class DialogueItem(TypedDict):
@@ -13,7 +13,7 @@ VIDEO_TITLE: str = "Chapter 7: CPU Scheduling"
 TITLE_SOUND_PATH: str = "image_assests/title_sound.mp3"
 
 # File Paths
-VIDEO_TEMPLATE_PATH: str = "video_assests/minecraft_background.mp4"
+VIDEO_TEMPLATE_PATH: str = "video_assests"  # A background clip, or a directory of clips
 safe_title = (
     VIDEO_TITLE.replace(" ", "_").replace(":", "_").replace("/", "_").replace("\\", "_")
 )
@@ -23,6 +23,86 @@ IMAGE_ASSETS_DIR: str = "image_assests"
 DOWNLOADED_IMAGES_DIR: str = "downloaded_images"
 RUNTIME_LOGS_DIR: str = "runtime_logs"
 
+# TTS Settings
+TTS_MAX_CONCURRENCY: int = 8
+TTS_REQUEST_TIMEOUT: float = 30.0
+TTS_MAX_RETRIES: int = 3
+TTS_RATE: str = "+0%"
+TTS_VOLUME: str = "+0%"
+TTS_PITCH: str = "+0Hz"
+
+# Image Download Settings
+IMAGE_MAX_WORKERS: int = 8
+IMAGE_MAX_CONNECTIONS_PER_HOST: int = 4
+IMAGE_REQUEST_TIMEOUT: float = 10.0
+IMAGE_HEDGE_CANDIDATES: int = 3
+IMAGE_TERM_LATENCY_BUDGET: float = 4.0
+IMAGE_MAX_DOWNLOAD_BYTES: int = 20 * 1024 * 1024
+IMAGE_SEARCH_MAX_RETRIES: int = 2
+CONTEXT_IMAGE_HEIGHT: int = 600
+
+# Retry Settings
+RETRY_BACKOFF_BASE: float = 0.5  # First retry waits up to this long (seconds)
+RETRY_BACKOFF_CAP: float = 30.0  # Longest wait between two attempts
+RENDER_MAX_RETRIES: int = 2  # Extra attempts for a segment that fails to render
+SKIP_FAILED_LINES: bool = False  # Publish the video without lines that still fail
+CHECKPOINT_INTERVAL: float = 2.0  # Seconds between build manifest checkpoints
+
+# Cache Settings
+CACHE_DIR: str = "cache"
+TTS_CACHE_DIR: str = f"{CACHE_DIR}/tts"
+TTS_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+TTS_WORDS_CACHE_DIR: str = f"{CACHE_DIR}/tts_words"
+IMAGE_CACHE_DIR: str = f"{CACHE_DIR}/images"
+IMAGE_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024  # Every image store together
+IMAGE_SEARCH_CACHE_TTL: float = 7 * 24 * 60 * 60
+CAPTION_CACHE_DIR: str = f"{CACHE_DIR}/captions"
+CAPTION_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+PROXY_CACHE_DIR: str = f"{CACHE_DIR}/proxies"
+PROXY_CACHE_MAX_BYTES: int = 4 * 1024 * 1024 * 1024
+BACKGROUND_INDEX_PATH: str = f"{CACHE_DIR}/footage_index.json"
+SEGMENT_CACHE_DIR: str = f"{CACHE_DIR}/segments"
+SEGMENT_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+BUILD_MANIFEST_PATH: str = f"{CACHE_DIR}/build_manifest.json"
+
+# Render Settings
+SUBTITLE_MODE: str = "word"  # "word" (karaoke highlight) or "sentence"
+COMPOSITOR: str = "segment"  # "segment" (pre-flattened overlays) or "layered"
+OUTPUT_FPS: int = 24
+OUTPUT_SIZE: Optional[Tuple[int, int]] = None  # (width, height); None = background size
+BACKGROUND_PROXY: bool = True  # Transcode backgrounds once to the output profile
+BACKGROUND_MIN_OFFSET: float = 10.0  # Skip clip intros when the clip is long enough
+RENDER_WORKERS: Optional[int] = None  # None = one per CPU core; 1 = single process
+BACKGROUND_CLIPS_OPEN: int = 8  # Background clips each process keeps open
+RENDER_BACKEND: str = "moviepy"  # "moviepy" (reference), "pipeline" or "ffmpeg"
+PIPELINE_RING_FRAMES: int = 48  # Frames buffered in shared memory by the pipeline
+ASSET_MEMORY_BUDGET: int = 256 * 1024 * 1024  # Decoded images kept in RAM
+STREAMING: bool = True  # Render segments while TTS and images are still arriving
+STREAM_QUEUE_SIZE: int = 16  # Items buffered between pipeline stages
+
+# Batch Settings
+BATCH_MAX_JOBS: int = 2  # Scripts rendered at once, sharing the render workers
+BATCH_BUILDS_DIR: str = f"{CACHE_DIR}/builds"  # One build manifest per script
+
+# Service Settings
+SERVICE_HOST: str = "127.0.0.1"  # The job API only listens locally
+SERVICE_PORT: int = 8765
+SERVICE_SOCKET: Optional[str] = None  # Serve on this Unix socket instead of TCP
+SERVICE_KEEP_FINISHED_JOBS: int = 1000  # Older finished jobs are forgotten
+
+# Tracing Settings
+TRACE_DIR: str = f"{RUNTIME_LOGS_DIR}/traces"  # One Chrome-trace JSON per run
+TRACE_MAX_EVENTS: int = 200_000  # Events kept per run; later ones are only counted
+TRACE_COUNTER_INTERVAL: float = 0.1  # Seconds between trace samples of one counter
+
+# Audio Settings
+AUDIO_SAMPLE_RATE: int = 44100
+AUDIO_CHUNK_SECONDS: float = 10.0  # Mixed and written this much at a time
+BACKGROUND_VOLUME: float = 1.0
+BACKGROUND_DUCK_GAIN: float = 0.5  # Background gain while a character is speaking
+BACKGROUND_DUCK_FADE: float = 0.15  # Seconds to fade the background down/up
+CAPTION_MAX_WORKERS: Optional[int] = None  # None = one worker per CPU core
+
 
 # Dialogue Data
 DIALOGUE: List[DialogueItem] = [
@@ -0,0 +1,241 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from tracing import tracer
+
+
+class DiskCache:
+    """
+    A content-addressed, size-bounded file cache.
+
+    Entries are stored as ``<cache_dir>/<key[:2]>/<key><suffix>``. Writes are atomic
+    (temp file + ``os.replace``), and when the total size exceeds ``max_bytes`` the
+    least recently used entries (by mtime, refreshed on every hit) are evicted.
+    Safe to share between threads; other processes only ever see complete files.
+    Temp files left behind by a killed writer are swept up on the next open.
+    """
+
+    # Temp files untouched for this long belong to a writer that is gone
+    stale_tmp_seconds = 3600.0
+
+    _shared: Dict[Tuple[str, str], "DiskCache"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int,
+        suffix: str = "",
+        name: str = "DiskCache",
+    ) -> None:
+        """
+        Initialize the DiskCache.
+
+        Args:
+            cache_dir (str): Directory holding the cache entries.
+            max_bytes (int): Upper bound on the total size of all entries.
+            suffix (str): File extension given to every entry (e.g. ".mp3").
+            name (str): Logger name, so cache activity shows up per owner.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.logger = logging.getLogger(name)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._sweep_tmp()
+        self._total_bytes = sum(size for _, size, _ in self._scan())
+
+    @classmethod
+    def shared(
+        cls,
+        cache_dir: str,
+        max_bytes: int,
+        suffix: str = "",
+        name: str = "DiskCache",
+    ) -> "DiskCache":
+        """
+        The process's one DiskCache for ``cache_dir`` and ``suffix``, opened
+        (with its scan and temp-file sweep) on first use only, so everything
+        using the directory shares one size count.
+        """
+        key = (os.path.abspath(cache_dir), suffix)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(cache_dir, max_bytes, suffix=suffix, name=name)
+            return cls._shared[key]
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Hash an arbitrary tuple of JSON-serializable parts into a cache key."""
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}{self.suffix}")
+
+    def contains(self, key: str) -> bool:
+        """Check for an entry without touching the hit/miss counters."""
+        return os.path.exists(self.path_for(key))
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up an entry.
+
+        Returns:
+            Optional[str]: The cached file path, or None on a miss.
+        """
+        path = self.path_for(key)
+        try:
+            os.utime(path)  # refresh LRU position
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            tracer.count(f"{self.logger.name}.misses")
+            return None
+
+        with self._lock:
+            self.hits += 1
+        tracer.count(f"{self.logger.name}.hits")
+        return path
+
+    def reserve(self, key: str) -> str:
+        """
+        Returns a fresh temp file path next to the final entry location.
+        Write to it, then call ``commit`` (or ``discard`` on failure).
+        """
+        final_path = self.path_for(key)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(final_path), prefix=".tmp-", suffix=self.suffix
+        )
+        os.close(fd)
+        return tmp_path
+
+    def commit(self, key: str, tmp_path: str) -> str:
+        """Atomically move a reserved temp file into place and enforce the size bound."""
+        final_path = self.path_for(key)
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            if os.path.exists(final_path):
+                self._total_bytes -= os.path.getsize(final_path)
+            os.replace(tmp_path, final_path)
+            self._total_bytes += size
+        self._evict()
+        return final_path
+
+    @staticmethod
+    def discard(tmp_path: str) -> None:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    def put_bytes(self, key: str, data: bytes) -> str:
+        tmp_path = self.reserve(key)
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+        except Exception:
+            self.discard(tmp_path)
+            raise
+        return self.commit(key, tmp_path)
+
+    def put_file(self, key: str, src_path: str) -> str:
+        tmp_path = self.reserve(key)
+        try:
+            shutil.copyfile(src_path, tmp_path)
+        except Exception:
+            self.discard(tmp_path)
+            raise
+        return self.commit(key, tmp_path)
+
+    def materialize(self, key: str, dest_path: str) -> str:
+        """
+        Place a cached entry at ``dest_path``, hard-linking when possible and
+        copying otherwise (e.g. across filesystems).
+        """
+        return self.link_or_copy(self.path_for(key), dest_path)
+
+    @staticmethod
+    def link_or_copy(src_path: str, dest_path: str) -> str:
+        """Hard-link ``src_path`` to ``dest_path``, or copy it if that fails."""
+        dest_dir = os.path.dirname(dest_path)
+        if dest_dir:
+            os.makedirs(dest_dir, exist_ok=True)
+        if os.path.lexists(dest_path):
+            os.remove(dest_path)
+        try:
+            os.link(src_path, dest_path)
+        except OSError:
+            shutil.copyfile(src_path, dest_path)
+        return dest_path
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes": self._total_bytes,
+            }
+
+    def _sweep_tmp(self) -> None:
+        """Remove temp files abandoned by writers that crashed or were killed."""
+        cutoff = time.time() - self.stale_tmp_seconds
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if not filename.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                except OSError:
+                    continue
+
+    def _scan(self) -> List[Tuple[str, int, float]]:
+        """Returns (path, size, mtime) for every committed entry."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if filename.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _evict(self) -> None:
+        with self._lock:
+            if self._total_bytes <= self.max_bytes:
+                return
+
+            entries = sorted(self._scan(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+                tracer.count(f"{self.logger.name}.evictions")
+                self.logger.debug(f"Evicted {path} ({size} bytes)")
+            self._total_bytes = total
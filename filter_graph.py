@@ -0,0 +1,225 @@
+import os
+import logging
+import subprocess
+from typing import Dict, List, Optional, Tuple
+from moviepy.config import FFMPEG_BINARY
+
+
+class FilterGraph:
+    """
+    Describes a whole video as a single ffmpeg ``-filter_complex`` run.
+
+    Background cuts are taken with input seeking and concatenated; still images are single-frame inputs
+    overlaid with ``enable='between(t,...)'`` and held with ``eof_action=repeat``.
+    The same image at the same place is one input and one overlay however often it
+    appears (its intervals are OR-ed), so e.g. an avatar costs one decode for the
+    whole video. Time-varying layers come in as concat-demuxer image tracks, and
+    voice lines are delayed into place and summed with ``amix``. ffmpeg then does
+    every per-frame step natively.
+    """
+
+    def __init__(
+        self,
+        background: List[Tuple[str, float, float]],
+        duration: float,
+        fps: int,
+        background_audio: bool = True,
+        background_filter: Optional[str] = None,
+    ) -> None:
+        """
+        Initialize the FilterGraph.
+
+        Args:
+            background (List[Tuple[str, float, float]]): (path, start, end) cuts
+                of background footage, played back to back.
+            duration (float): Output duration in seconds.
+            fps (int): Output frame rate.
+            background_audio (bool): Mix the footage's own audio into the soundtrack.
+            background_filter (Optional[str]): Filter chain applied to the footage
+                to each cut first (e.g. scaling it to the output size).
+        """
+        self.background = background
+        self.duration = duration
+        self.fps = fps
+        self.background_audio = background_audio
+        self.background_filter = background_filter
+        # (path, x, y, height) -> (rank, [(start, end), ...])
+        self._images: Dict[
+            Tuple[str, str, str, Optional[int]], Tuple[int, List[Tuple[float, float]]]
+        ] = {}
+        self._tracks: List[Tuple[List[Tuple[float, str]], str, str]] = []
+        self._audio: List[Tuple[str, float]] = []
+        self.logger = logging.getLogger("FilterGraph")
+
+    def add_image(
+        self,
+        path: str,
+        start: float,
+        end: float,
+        x: str,
+        y: str,
+        height: Optional[int] = None,
+        rank: int = 0,
+    ) -> None:
+        """
+        Show a still image during ``[start, end)``.
+
+        Args:
+            path (str): Image file (PNG alpha is kept).
+            start (float): Start time in the output.
+            end (float): End time in the output.
+            x (str): Overlay x expression (``W``/``w`` are frame/image widths).
+            y (str): Overlay y expression.
+            height (Optional[int]): Scale to this height first, keeping aspect.
+            rank (int): Stacking order; higher ranks are drawn on top.
+        """
+        key = (os.path.abspath(path), x, y, height)
+        prev_rank, intervals = self._images.get(key, (rank, []))
+        intervals.append((start, end))
+        self._images[key] = (max(prev_rank, rank), intervals)
+
+    def add_image_track(self, states: List[Tuple[float, str]], x: str, y: str) -> None:
+        """
+        Show a sequence of equally sized images, each from its start time until the
+        next one's. Use a fully transparent image for gaps. The track is drawn above
+        every still image.
+
+        Args:
+            states (List[Tuple[float, str]]): (start time, image path), in time order.
+            x (str): Overlay x expression.
+            y (str): Overlay y expression.
+        """
+        if states:
+            self._tracks.append((states, x, y))
+
+    def add_audio(self, path: str, start: float) -> None:
+        """Mix an audio file into the soundtrack starting at ``start``."""
+        self._audio.append((os.path.abspath(path), start))
+
+    @staticmethod
+    def _enable(intervals: List[Tuple[float, float]]) -> str:
+        return "+".join(f"between(t,{start:.6f},{end:.6f})" for start, end in intervals)
+
+    def _write_track(self, states: List[Tuple[float, str]], list_path: str) -> None:
+        with open(list_path, "w", encoding="utf-8") as f:
+            for (start, path), (next_start, _) in zip(
+                states, states[1:] + [(self.duration, None)]
+            ):
+                f.write(f"file '{os.path.abspath(path)}'\n")
+                f.write(f"duration {max(0.0, next_start - start):.6f}\n")
+            # The concat demuxer ignores the last entry's duration unless repeated
+            f.write(f"file '{os.path.abspath(states[-1][1])}'\n")
+
+    def build(self, work_dir: str) -> Tuple[List[str], str]:
+        """
+        Lay out the inputs and the filter graph.
+
+        Args:
+            work_dir (str): Where image-track lists are written.
+
+        Returns:
+            Tuple[List[str], str]: ffmpeg input arguments, and the filter graph
+                (labelled ``[vout]`` and, if there is any audio, ``[aout]``).
+        """
+        inputs: List[str] = []
+        filters: List[str] = []
+        for path, start, end in self.background:
+            inputs += ["-ss", f"{start:.6f}", "-t", f"{end - start:.6f}", "-i", path]
+        n_inputs = len(self.background)
+
+        cuts = [f"{idx}:v" for idx in range(n_inputs)]
+        if self.background_filter:
+            for idx in range(n_inputs):
+                filters.append(f"[{idx}:v]{self.background_filter}[bg{idx}]")
+            cuts = [f"bg{idx}" for idx in range(n_inputs)]
+        video = cuts[0]
+        if n_inputs > 1:
+            filters.append(
+                "".join(f"[{cut}]" for cut in cuts) + f"concat=n={n_inputs}:v=1:a=0[bg]"
+            )
+            video = "bg"
+
+        images = sorted(
+            self._images.items(), key=lambda kv: (kv[1][0], min(kv[1][1])[0])
+        )
+        for idx, ((path, x, y, height), (_, intervals)) in enumerate(images):
+            inputs += ["-i", path]
+            source = f"{n_inputs}:v"
+            if height:
+                filters.append(f"[{source}]scale=-2:{height}[img{idx}]")
+                source = f"img{idx}"
+            filters.append(
+                f"[{video}][{source}]overlay=x='{x}':y='{y}':eof_action=repeat"
+                f":enable='{self._enable(intervals)}'[v{idx}]"
+            )
+            video = f"v{idx}"
+            n_inputs += 1
+
+        for idx, (states, x, y) in enumerate(self._tracks):
+            list_path = os.path.join(work_dir, f"track_{idx}.txt")
+            self._write_track(states, list_path)
+            inputs += ["-f", "concat", "-safe", "0", "-i", list_path]
+            filters.append(f"[{n_inputs}:v]format=rgba,setpts=PTS-STARTPTS[trk{idx}]")
+            filters.append(
+                f"[{video}][trk{idx}]overlay=x='{x}':y='{y}':eof_action=pass[t{idx}]"
+            )
+            video = f"t{idx}"
+            n_inputs += 1
+
+        filters.append(f"[{video}]fps={self.fps},format=yuv420p[vout]")
+
+        voices: List[str] = []
+        for idx, (path, start) in enumerate(self._audio):
+            inputs += ["-i", path]
+            delay = int(round(start * 1000))
+            filters.append(f"[{n_inputs}:a]adelay=delays={delay}:all=1[a{idx}]")
+            voices.append(f"[a{idx}]")
+            n_inputs += 1
+        if self.background_audio:
+            if len(self.background) > 1:
+                filters.append(
+                    "".join(f"[{idx}:a]" for idx in range(len(self.background)))
+                    + f"concat=n={len(self.background)}:v=0:a=1[bga]"
+                )
+                voices.append("[bga]")
+            else:
+                voices.append("[0:a]")
+        if voices:
+            # normalize=0 sums the sources like CompositeAudioClip does
+            filters.append(
+                f"{''.join(voices)}amix=inputs={len(voices)}"
+                f":duration=longest:normalize=0[aout]"
+            )
+
+        return inputs, ";\n".join(filters)
+
+    def render(self, output_path: str, work_dir: str) -> None:
+        """Run ffmpeg once to produce the finished video."""
+        inputs, graph = self.build(work_dir)
+        script_path = os.path.join(work_dir, "graph.txt")
+        with open(script_path, "w", encoding="utf-8") as f:
+            f.write(graph)
+
+        maps = ["-map", "[vout]"]
+        if "[aout]" in graph:
+            maps += ["-map", "[aout]", "-c:a", "aac"]
+        self.logger.info(
+            f"Rendering with ffmpeg: {len(self._images)} image overlays, "
+            f"{len(self._tracks)} image tracks, {len(self._audio)} audio inputs."
+        )
+        subprocess.run(
+            [FFMPEG_BINARY, "-y", "-loglevel", "error"]
+            + inputs
+            + ["-filter_complex_script", script_path]
+            + maps
+            + [
+                "-c:v",
+                "libx264",
+                "-t",
+                f"{self.duration:.6f}",
+                "-movflags",
+                "+faststart",
+                output_path,
+            ],
+            check=True,
+        )
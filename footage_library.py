@@ -0,0 +1,251 @@
+import os
+import re
+import json
+import bisect
+import random
+import logging
+import tempfile
+import subprocess
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from moviepy.config import FFMPEG_BINARY
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from config import BACKGROUND_INDEX_PATH, BACKGROUND_MIN_OFFSET
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".webm", ".m4v")
+_PTS_TIME = re.compile(r"pts_time:([0-9.]+)")
+
+
+class FootageSegment(NamedTuple):
+    """A ``[start, end)`` cut of one clip, in seconds of that clip."""
+
+    path: str
+    start: float
+    end: float
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+def footage_between(
+    segments: List[FootageSegment], start: float, end: float
+) -> List[FootageSegment]:
+    """The cuts that play from ``start`` to ``end`` when ``segments`` play back to back."""
+    cuts: List[FootageSegment] = []
+    position = 0.0
+    for segment in segments:
+        lo = max(start, position)
+        hi = min(end, position + segment.duration)
+        if hi > lo:
+            cuts.append(
+                FootageSegment(
+                    segment.path,
+                    segment.start + lo - position,
+                    segment.start + hi - position,
+                )
+            )
+        position += segment.duration
+        if position >= end:
+            break
+    return cuts
+
+
+class FootageLibrary:
+    """
+    An index of background gameplay clips, used to pick random segments
+    without touching the media.
+
+    Each clip is probed once for its duration, resolution, frame rate, audio and
+    keyframe timestamps. The results are stored in a JSON index and reused until
+    the file's size or mtime changes. Segments always start on a keyframe, so
+    opening one is a short seek rather than a decode from the start of the file.
+    When a script outlasts a clip, further clips are chained after it, and a
+    one-clip library loops.
+    """
+
+    def __init__(self, path: str, index_path: str = BACKGROUND_INDEX_PATH) -> None:
+        """
+        Initialize the FootageLibrary and bring its index up to date.
+
+        Args:
+            path (str): A directory of clips, or a single clip.
+            index_path (str): JSON file holding the probe results.
+        """
+        self.path = path
+        self.index_path = index_path
+        self.logger = logging.getLogger("FootageLibrary")
+        self.entries: Dict[str, Dict[str, Any]] = self._load_index()
+        self.scan()
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index: Dict[str, Dict[str, Any]]) -> None:
+        index_dir = os.path.dirname(self.index_path) or "."
+        os.makedirs(index_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=index_dir, prefix=".tmp-", suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _clip_paths(self) -> List[str]:
+        if os.path.isfile(self.path):
+            return [os.path.abspath(self.path)]
+        return sorted(
+            os.path.abspath(os.path.join(root, filename))
+            for root, _, files in os.walk(self.path)
+            for filename in files
+            if filename.lower().endswith(VIDEO_EXTENSIONS)
+        )
+
+    @staticmethod
+    def probe(path: str) -> Dict[str, Any]:
+        """Read a clip's stream info and keyframe timestamps (decoding keyframes only)."""
+        infos = ffmpeg_parse_infos(path)
+        result = subprocess.run(
+            [
+                FFMPEG_BINARY,
+                "-hide_banner",
+                "-skip_frame",
+                "nokey",
+                "-i",
+                path,
+                "-an",
+                "-vf",
+                "showinfo",
+                "-f",
+                "null",
+                "-",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        keyframes = sorted({float(t) for t in _PTS_TIME.findall(result.stderr)})
+        return {
+            "duration": infos["duration"],
+            "width": infos["video_size"][0],
+            "height": infos["video_size"][1],
+            "fps": infos["video_fps"],
+            "audio": infos["audio_found"],
+            "keyframes": keyframes or [0.0],
+        }
+
+    def scan(self) -> None:
+        """Probe clips that are new or changed since the last scan and drop vanished ones."""
+        index = self._load_index()
+        changed = False
+        entries: Dict[str, Dict[str, Any]] = {}
+        for path in self._clip_paths():
+            st = os.stat(path)
+            entry = index.get(path)
+            if (
+                entry is None
+                or entry["size"] != st.st_size
+                or entry["mtime_ns"] != st.st_mtime_ns
+            ):
+                self.logger.info(f"Indexing background clip {path}...")
+                try:
+                    entry = self.probe(path)
+                except Exception as e:
+                    self.logger.warning(f"Skipping unreadable clip {path}: {e}")
+                    continue
+                entry.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+                index[path] = entry
+                changed = True
+            entries[path] = entry
+
+        # Keep other libraries' entries; only forget clips that were under this path
+        root = os.path.abspath(self.path)
+        for path in list(index):
+            if path not in entries and (path == root or path.startswith(root + os.sep)):
+                del index[path]
+                changed = True
+
+        if changed:
+            self._save_index(index)
+        self.entries = entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _starts(
+        self, entry: Dict[str, Any], keyframe_interval: Optional[float]
+    ) -> List[float]:
+        if keyframe_interval:
+            return [
+                i * keyframe_interval
+                for i in range(int(entry["duration"] // keyframe_interval) + 1)
+            ]
+        return entry["keyframes"]
+
+    def pick(
+        self,
+        duration: float,
+        rng: Any = random,
+        min_offset: float = BACKGROUND_MIN_OFFSET,
+        keyframe_interval: Optional[float] = None,
+    ) -> List[FootageSegment]:
+        """
+        Choose random keyframe-aligned segments that together last ``duration``.
+
+        Args:
+            duration (float): Total footage needed, in seconds.
+            rng (Any): Source of randomness (``random`` or a ``random.Random``).
+            min_offset (float): Skip this much of a clip's start (intros) when
+                the clip is long enough.
+            keyframe_interval (Optional[float]): Assume a keyframe every this many
+                seconds (e.g. fixed-GOP proxies) instead of the indexed ones.
+
+        Returns:
+            List[FootageSegment]: Segments to play back to back.
+        """
+        if not self.entries:
+            raise FileNotFoundError(f"No background clips found in {self.path}")
+
+        paths = list(self.entries)
+        segments: List[FootageSegment] = []
+        remaining = duration
+        first = True
+        while remaining > 1e-6:
+            path = rng.choice(paths)
+            entry = self.entries[path]
+            starts = self._starts(entry, keyframe_interval)
+            # Keep a frame of slack so seeks near the end never run out of video
+            end_limit = entry["duration"] - 1.0 / max(1.0, entry["fps"] or 1.0)
+
+            if first:
+                # Prefer a start that lets this clip cover everything
+                lo = bisect.bisect_left(starts, min_offset)
+                hi = bisect.bisect_right(starts, end_limit - remaining)
+                if lo >= hi:
+                    lo, hi = 0, bisect.bisect_right(starts, end_limit - remaining)
+                start = starts[rng.randrange(lo, hi)] if lo < hi else 0.0
+            else:
+                start = 0.0
+
+            length = min(remaining, end_limit - start)
+            if length <= 0:
+                raise ValueError(f"Background clip too short to use: {path}")
+            segments.append(FootageSegment(path, start, start + length))
+            remaining -= length
+            first = False
+        return segments
+
+    def fitted_size(self, segments: List[FootageSegment]) -> Optional[Tuple[int, int]]:
+        """
+        Output size for playing ``segments`` back to back: None when they share a
+        resolution, otherwise the first one's size (the rest are fitted to it).
+        """
+        sizes = {
+            (self.entries[seg.path]["width"], self.entries[seg.path]["height"])
+            for seg in segments
+        }
+        if len(sizes) <= 1:
+            return None
+        first = self.entries[segments[0].path]
+        return first["width"], first["height"]
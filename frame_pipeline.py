@@ -0,0 +1,300 @@
+import logging
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Any, Callable, List, Optional, Tuple
+import numpy as np
+from moviepy import VideoClip
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+
+class FrameRing:
+    """
+    A fixed number of frame slots in shared memory, passed from a single
+    decoder to compositing processes and on to a single writer, strictly in
+    frame order.
+
+    Frame ``i`` always lives in slot ``i % slots``. The decoder may fill it with
+    the background once frame ``i - slots`` has been written out, a compositor
+    claims it once decoded and blends the overlays on in place, and the writer
+    takes it once the compositor has published it. At most ``slots`` frames
+    exist at any time and frame data never goes through a pipe or pickle.
+    """
+
+    def __init__(
+        self,
+        slots: int,
+        shape: Tuple[int, int, int],
+        ctx: Optional[multiprocessing.context.BaseContext] = None,
+    ) -> None:
+        """
+        Initialize the FrameRing.
+
+        Args:
+            slots (int): Number of frames the ring holds.
+            shape (Tuple[int, int, int]): (height, width, 3) of every frame.
+            ctx (Optional[BaseContext]): Multiprocessing context the producers run in.
+        """
+        ctx = ctx or multiprocessing.get_context("spawn")
+        self.slots = slots
+        self.shape = shape
+        self.frame_bytes = int(np.prod(shape))
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=slots * self.frame_bytes
+        )
+        self.name = self.shm.name
+        # Which frame each slot holds, once decoded and once composited; -1 while empty
+        self.decoded = ctx.Array("q", [-1] * slots, lock=False)
+        self.ready = ctx.Array("q", [-1] * slots, lock=False)
+        self.written = ctx.Value("q", 0, lock=False)
+        self.aborted = ctx.Value("b", 0, lock=False)
+        self.cond = ctx.Condition()
+        self._owner = True
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["shm"]
+        state["_owner"] = False
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(name=self.name)
+
+    def _view(self, index: int) -> np.ndarray:
+        offset = (index % self.slots) * self.frame_bytes
+        return np.ndarray(
+            self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset
+        )
+
+    def put(self, index: int, frame: np.ndarray) -> bool:
+        """
+        Copy background frame ``index`` into its slot once the slot is free,
+        and hand it to the compositors.
+
+        Returns:
+            bool: False if the pipeline was aborted instead.
+        """
+        with self.cond:
+            self.cond.wait_for(
+                lambda: self.aborted.value or self.written.value > index - self.slots
+            )
+            if self.aborted.value:
+                return False
+        self._view(index)[...] = frame[..., :3]
+        with self.cond:
+            self.decoded[index % self.slots] = index
+            self.cond.notify_all()
+        return True
+
+    def claim(self, index: int) -> Optional[np.ndarray]:
+        """
+        Wait for background frame ``index`` to be decoded.
+
+        Returns:
+            Optional[np.ndarray]: Its slot, to composite onto in place, or None
+                if the pipeline was aborted instead.
+        """
+        slot = index % self.slots
+        with self.cond:
+            self.cond.wait_for(
+                lambda: self.aborted.value or self.decoded[slot] == index
+            )
+            if self.aborted.value:
+                return None
+        return self._view(index)
+
+    def publish(self, index: int) -> None:
+        """Hand composited frame ``index`` to the writer."""
+        with self.cond:
+            self.ready[index % self.slots] = index
+            self.cond.notify_all()
+
+    def drain(
+        self,
+        index: int,
+        consume: Callable[[np.ndarray], None],
+        timeout: Optional[float] = None,
+    ) -> bool:
+        """
+        Wait for frame ``index``, pass it to ``consume`` and free its slot.
+
+        Returns:
+            bool: False on timeout or abort, without consuming anything.
+        """
+        slot = index % self.slots
+        with self.cond:
+            ok = self.cond.wait_for(
+                lambda: self.aborted.value or self.ready[slot] == index, timeout
+            )
+            if not ok or self.aborted.value:
+                return False
+        consume(self._view(index))
+        self.release(index)
+        return True
+
+    def release(self, index: int) -> None:
+        with self.cond:
+            self.written.value = index + 1
+            self.cond.notify_all()
+
+    def abort(self) -> None:
+        with self.cond:
+            self.aborted.value = 1
+            self.cond.notify_all()
+
+    def close(self) -> None:
+        try:
+            self.shm.close()
+        except BufferError:
+            # A frame view is still referenced (e.g. from a traceback); the
+            # mapping is released with the process instead
+            pass
+        if self._owner:
+            self.shm.unlink()
+
+
+def _decode_frames(
+    ring: FrameRing, background: VideoClip, n_frames: int, fps: int
+) -> None:
+    """Decoder thread: read the background once, in order, into the ring."""
+    try:
+        for index in range(n_frames):
+            if not ring.put(index, background.get_frame(index / fps)):
+                return
+    except BaseException:
+        logging.getLogger("FramePipeline").exception("Background decoding failed.")
+        ring.abort()
+
+
+def _composite_frames(
+    ring: FrameRing,
+    make_clip: Callable[..., VideoClip],
+    make_args: Tuple[Any, ...],
+    blocks: List[Tuple[int, int]],
+    fps: int,
+) -> None:
+    """
+    Compositor process: build the overlays, then blend them onto its share of
+    the decoded frames in the ring. Module-level so it can be started with the
+    spawn method.
+    """
+    try:
+        clip = make_clip(*make_args)
+        for first, end in blocks:
+            for index in range(first, end):
+                frame = ring.claim(index)
+                if frame is None:
+                    return
+                clip.blend_onto(frame, index / fps)
+                ring.publish(index)
+    except BaseException:
+        ring.abort()
+        raise
+    finally:
+        ring.close()
+
+
+def write_pipelined(
+    background: VideoClip,
+    make_clip: Callable[..., VideoClip],
+    make_args: Tuple[Any, ...],
+    output_path: str,
+    size: Tuple[int, int],
+    n_frames: int,
+    fps: int,
+    workers: int,
+    ring_frames: int,
+    audio_path: Optional[str] = None,
+    codec: str = "libx264",
+    audio_codec: Optional[str] = None,
+) -> None:
+    """
+    Encode a clip with compositing spread over worker processes.
+
+    A thread in this process decodes ``background`` once, in order, into a
+    shared ring. Each worker calls ``make_clip(*make_args)`` to build its own
+    copy of the overlays and blends them (``clip.blend_onto(frame, t)``) onto
+    interleaved blocks of those frames in place; this process streams the ring
+    to a single ffmpeg encoder in order. Decoding, compositing and encoding run
+    concurrently, and frame memory is bounded by ``ring_frames``.
+
+    Args:
+        background (VideoClip): The background, decoded here only.
+        make_clip (Callable[..., VideoClip]): Module-level factory for the clip
+            that blends the overlays.
+        make_args (Tuple[Any, ...]): Picklable arguments for ``make_clip``.
+        output_path (str): Where to write the video.
+        size (Tuple[int, int]): (width, height) of the frames.
+        n_frames (int): Number of frames to encode.
+        fps (int): Frame rate.
+        workers (int): Compositing processes.
+        ring_frames (int): Frames held in shared memory at most.
+        audio_path (Optional[str]): Audio to mux in.
+        codec (str): Video codec.
+        audio_codec (Optional[str]): Codec to encode the audio with; None copies it.
+    """
+    logger = logging.getLogger("FramePipeline")
+    ctx = multiprocessing.get_context("spawn")
+    workers = max(1, min(workers, n_frames))
+    ring_frames = max(ring_frames, workers)
+
+    # Interleave blocks so every worker stays close to the writer's position
+    block = max(1, ring_frames // (2 * workers))
+    assignments: List[List[Tuple[int, int]]] = [[] for _ in range(workers)]
+    for n, first in enumerate(range(0, n_frames, block)):
+        assignments[n % workers].append((first, min(first + block, n_frames)))
+
+    w, h = size
+    ring = FrameRing(ring_frames, (h, w, 3), ctx)
+    processes = [
+        ctx.Process(
+            target=_composite_frames,
+            args=(ring, make_clip, make_args, blocks, fps),
+            daemon=True,
+        )
+        for blocks in assignments
+    ]
+    logger.info(
+        f"Compositing {n_frames} frames on {workers} workers "
+        f"through a {ring_frames}-frame ring."
+    )
+
+    decoder = threading.Thread(
+        target=_decode_frames,
+        args=(ring, background, n_frames, fps),
+        name="FramePipelineDecoder",
+        daemon=True,
+    )
+    writer = None
+    try:
+        for process in processes:
+            process.start()
+        decoder.start()
+
+        writer = FFMPEG_VideoWriter(
+            output_path,
+            size,
+            fps,
+            codec=codec,
+            audiofile=audio_path,
+            audio_codec=audio_codec,
+        )
+        for index in range(n_frames):
+            while not ring.drain(index, writer.write_frame, timeout=1.0):
+                if ring.aborted.value or any(p.exitcode for p in processes):
+                    raise RuntimeError(
+                        f"The pipeline failed before frame {index}; see the "
+                        "decoder and compositing worker errors."
+                    )
+    except BaseException:
+        ring.abort()
+        raise
+    finally:
+        if writer is not None:
+            writer.close()
+        for process in processes:
+            process.join()
+        if decoder.is_alive():
+            decoder.join()
+        ring.close()
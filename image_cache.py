@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Dict, List, Optional
+from disk_cache import DiskCache
+
+
+class ImageCache:
+    """
+    Two-level persistent cache for image search.
+
+    Level 1 maps a search query to its result URLs and expires after a TTL.
+    Level 2 maps a URL to a blob stored under the hash of its content, so the same
+    image reached through different URLs is stored once. Blobs are evicted LRU by
+    total bytes; URL references to an evicted blob simply become misses.
+    Normalized (decoded, re-encoded and pre-scaled) assets are cached per blob and
+    target height alongside.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, search_ttl: float) -> None:
+        """
+        Initialize the ImageCache.
+
+        Args:
+            cache_dir (str): Root directory for the search, URL and blob stores.
+            max_bytes (int): Size bound for the whole cache, all stores together.
+            search_ttl (float): Seconds a cached search result stays valid.
+        """
+        self.search_ttl = search_ttl
+        self.logger = logging.getLogger("ImageDownloader.cache")
+
+        # Query results and URL references are tiny; the rest of the budget is
+        # split evenly between the blobs and their normalized assets
+        small = max(1, max_bytes // 64)
+        large = max(1, (max_bytes - 2 * small) // 2)
+        self.searches = DiskCache(
+            os.path.join(cache_dir, "search"),
+            small,
+            suffix=".json",
+            name="ImageDownloader.cache.search",
+        )
+        self.refs = DiskCache(
+            os.path.join(cache_dir, "urls"),
+            small,
+            suffix=".ref",
+            name="ImageDownloader.cache.urls",
+        )
+        self.blobs = DiskCache(
+            os.path.join(cache_dir, "blobs"),
+            large,
+            name="ImageDownloader.cache.blobs",
+        )
+        self.normalized = DiskCache(
+            os.path.join(cache_dir, "normalized"),
+            large,
+            suffix=".png",
+            name="ImageDownloader.cache.normalized",
+        )
+
+    @staticmethod
+    def content_key(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def get_search(self, term: str, max_results: int) -> Optional[List[str]]:
+        """Cached result URLs for a query, or None if absent or expired."""
+        path = self.searches.get(DiskCache.make_key("search", term, max_results))
+        if path is None:
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Unreadable search cache entry for '{term}': {e}")
+            return None
+
+        if time.time() - entry.get("fetched_at", 0) > self.search_ttl:
+            self.logger.info(f"Search cache entry expired for '{term}'.")
+            return None
+        return entry.get("urls", [])
+
+    def put_search(self, term: str, max_results: int, urls: List[str]) -> None:
+        payload = json.dumps({"term": term, "urls": urls, "fetched_at": time.time()})
+        self.searches.put_bytes(
+            DiskCache.make_key("search", term, max_results), payload.encode("utf-8")
+        )
+
+    def get_url(self, url: str) -> Optional[str]:
+        """Content key of the blob previously downloaded from ``url``, if still cached."""
+        ref_path = self.refs.get(DiskCache.make_key("url", url))
+        if ref_path is None:
+            return None
+        try:
+            with open(ref_path, "r", encoding="utf-8") as f:
+                content_key = f.read().strip()
+        except OSError:
+            return None
+        return content_key if self.blobs.get(content_key) else None
+
+    def put_url(self, url: str, data: bytes) -> str:
+        """Store a downloaded payload (deduplicated by content) and point ``url`` at it."""
+        content_key = self.content_key(data)
+        if not self.blobs.contains(content_key):
+            self.blobs.put_bytes(content_key, data)
+        self.refs.put_bytes(DiskCache.make_key("url", url), content_key.encode())
+        return content_key
+
+    def get_normalized(self, content_key: str, height: int) -> Optional[str]:
+        return self.normalized.get(
+            DiskCache.make_key("normalized", content_key, height)
+        )
+
+    def put_normalized(self, content_key: str, height: int, data: bytes) -> str:
+        key = DiskCache.make_key("normalized", content_key, height)
+        if self.normalized.contains(key):
+            return self.normalized.path_for(key)
+        return self.normalized.put_bytes(key, data)
+
+    def materialize_normalized(
+        self, content_key: str, height: int, dest_path: str
+    ) -> str:
+        key = DiskCache.make_key("normalized", content_key, height)
+        return self.normalized.materialize(key, dest_path)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "search": self.searches.stats(),
+            "urls": self.refs.stats(),
+            "blobs": self.blobs.stats(),
+            "normalized": self.normalized.stats(),
+        }
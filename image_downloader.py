@@ -1,9 +1,47 @@
+import io
 import os
+import time
 import logging
+import threading
 import requests
-from typing import List
-from ddgs import DDGS
-from config import RUNTIME_LOGS_DIR, DOWNLOADED_IMAGES_DIR
+import PIL.Image
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from config import (
+    RUNTIME_LOGS_DIR,
+    DOWNLOADED_IMAGES_DIR,
+    IMAGE_MAX_WORKERS,
+    IMAGE_MAX_CONNECTIONS_PER_HOST,
+    IMAGE_REQUEST_TIMEOUT,
+    IMAGE_HEDGE_CANDIDATES,
+    IMAGE_TERM_LATENCY_BUDGET,
+    IMAGE_CACHE_DIR,
+    IMAGE_CACHE_MAX_BYTES,
+    IMAGE_SEARCH_CACHE_TTL,
+    IMAGE_MAX_DOWNLOAD_BYTES,
+    CONTEXT_IMAGE_HEIGHT,
+    IMAGE_SEARCH_MAX_RETRIES,
+)
+from image_cache import ImageCache
+from tracing import queued_handler, tracer
+from utils import Utils
+
+if TYPE_CHECKING:
+    from ddgs import DDGS
+
+# Add a generic user-agent to avoid basic blocking
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# Magic bytes of the formats we accept (WebP is checked separately: RIFF....WEBP)
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+)
 
 
 class ImageDownloader:
@@ -12,7 +50,21 @@ class ImageDownloader:
     """
 
     def __init__(
-        self, max_images: int = 10, download_folder: str = DOWNLOADED_IMAGES_DIR
+        self,
+        max_images: int = 10,
+        download_folder: str = DOWNLOADED_IMAGES_DIR,
+        max_workers: int = IMAGE_MAX_WORKERS,
+        max_connections_per_host: int = IMAGE_MAX_CONNECTIONS_PER_HOST,
+        request_timeout: float = IMAGE_REQUEST_TIMEOUT,
+        hedged: bool = False,
+        hedge_candidates: int = IMAGE_HEDGE_CANDIDATES,
+        latency_budget: float = IMAGE_TERM_LATENCY_BUDGET,
+        cache_dir: str = IMAGE_CACHE_DIR,
+        cache_max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+        search_cache_ttl: float = IMAGE_SEARCH_CACHE_TTL,
+        max_download_bytes: int = IMAGE_MAX_DOWNLOAD_BYTES,
+        target_height: int = CONTEXT_IMAGE_HEIGHT,
+        search_retries: int = IMAGE_SEARCH_MAX_RETRIES,
     ) -> None:
         """
         Initialize the ImageDownloader.
@@ -20,9 +72,51 @@ class ImageDownloader:
         Args:
             max_images (int): Maximum number of images to download per search term.
             download_folder (str): Directory to save downloaded images.
+            max_workers (int): Size of the thread pool used by ``search_images_many``.
+            max_connections_per_host (int): Concurrent downloads allowed per host.
+            request_timeout (float): Timeout in seconds for each image download.
+            hedged (bool): Race the top ``hedge_candidates`` results and keep the
+                first one that decodes, instead of downloading results one by one.
+            hedge_candidates (int): Number of results raced per term in hedged mode.
+            latency_budget (float): Seconds to wait for a winner per term in
+                hedged mode before giving up on the term.
+            cache_dir (str): Root of the persistent search/image cache.
+            cache_max_bytes (int): Size bound for the whole image cache.
+            search_cache_ttl (float): Seconds a cached search result stays valid.
+            max_download_bytes (int): Downloads larger than this are abandoned.
+            target_height (int): Height (px) images are pre-scaled to at ingest,
+                matching the context image overlay in the editor.
+            search_retries (int): Extra attempts for a search that fails, with
+                jittered exponential backoff between them.
         """
         self.max_images = max_images
         self.download_folder = download_folder
+        self.max_workers = max(1, max_workers)
+        self.max_connections_per_host = max(1, max_connections_per_host)
+        self.request_timeout = request_timeout
+        self.hedged = hedged
+        self.hedge_candidates = max(1, hedge_candidates)
+        self.latency_budget = latency_budget
+        self.max_download_bytes = max_download_bytes
+        self.target_height = target_height
+        self.search_retries = max(0, search_retries)
+
+        # One keep-alive session shared by every download
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": USER_AGENT})
+        adapter = HTTPAdapter(
+            pool_connections=self.max_workers,
+            pool_maxsize=self.max_connections_per_host,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_slots_lock = threading.Lock()
+        self._local = threading.local()
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._hedge_pool_lock = threading.Lock()
+        self.cache = ImageCache(cache_dir, cache_max_bytes, search_cache_ttl)
 
         # Create required folders
         os.makedirs(self.download_folder, exist_ok=True)
@@ -41,10 +135,286 @@ class ImageDownloader:
             file_handler = logging.FileHandler(log_path)
             formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
             file_handler.setFormatter(formatter)
-            self.logger.addHandler(file_handler)
+            self.logger.addHandler(queued_handler(file_handler))
 
         self.logger.info("Logger initialized.")
 
+    def _ddgs(self) -> "DDGS":
+        """Returns this thread's DDGS client, reusing it across searches."""
+        ddgs = getattr(self._local, "ddgs", None)
+        if ddgs is None:
+            # Imported on first use, so cached runs and stand-ins don't need it
+            from ddgs import DDGS
+
+            ddgs = DDGS()
+            self._local.ddgs = ddgs
+        return ddgs
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._host_slots_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.max_connections_per_host)
+                self._host_slots[host] = slot
+            return slot
+
+    def _search_urls(self, term: str) -> List[str]:
+        """Return the result URLs for a term, from the search cache or DuckDuckGo."""
+        max_results = (
+            max(self.max_images, self.hedge_candidates)
+            if self.hedged
+            else self.max_images
+        )
+        cached_urls = self.cache.get_search(term, max_results)
+        if cached_urls is not None:
+            self.logger.info(f"Search cache hit for: {term}")
+            return cached_urls
+
+        for attempt in range(self.search_retries + 1):
+            try:
+                with tracer.span("image search", cat="image", term=term):
+                    # ddgs.images returns an iterator of dicts
+                    search_results = self._ddgs().images(
+                        query=term, max_results=max_results
+                    )
+                    urls = [
+                        item["image"] for item in search_results if item.get("image")
+                    ]
+                if urls:
+                    self.cache.put_search(term, max_results, urls)
+                return urls
+            except Exception as e:
+                self.logger.error(
+                    f"Error retrieving search results "
+                    f"(attempt {attempt + 1}/{self.search_retries + 1}): {e}"
+                )
+                if attempt < self.search_retries:
+                    tracer.count("image.search_retries")
+                    time.sleep(Utils.backoff_delay(attempt))
+        return []
+
+    def _image_path(self, term: str, idx: int) -> str:
+        # Sanitize filename
+        safe_term = "".join(c for c in term if c.isalnum() or c in (" ", "_")).rstrip()
+        img_name = f"{safe_term.replace(' ', '_')}_{idx + 1}.png"
+        return os.path.join(self.download_folder, img_name)
+
+    @staticmethod
+    def _sniff_format(data: bytes) -> Optional[str]:
+        """Identify the real image format from its magic bytes (None if not an image)."""
+        for signature, fmt in IMAGE_SIGNATURES:
+            if data.startswith(signature):
+                return fmt
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            return "webp"
+        return None
+
+    def _normalize(self, data: bytes) -> Optional[bytes]:
+        """
+        Decode the payload once and re-encode it as a PNG in RGB(A), scaled to the
+        overlay height the editor renders it at. Returns None if it doesn't decode.
+        """
+        try:
+            with PIL.Image.open(io.BytesIO(data)) as img:
+                img.load()
+                has_alpha = img.mode in ("RGBA", "LA", "PA") or (
+                    img.mode == "P" and "transparency" in img.info
+                )
+                img = img.convert("RGBA" if has_alpha else "RGB")
+
+            if img.height != self.target_height:
+                width = max(1, round(img.width * self.target_height / img.height))
+                img = img.resize((width, self.target_height), PIL.Image.LANCZOS)
+
+            out = io.BytesIO()
+            img.save(out, format="PNG")
+            return out.getvalue()
+        except Exception as e:
+            self.logger.warning(f"Failed to decode image: {e}")
+            return None
+
+    def _fetch_bytes(
+        self, url: str, cancelled: Optional[threading.Event] = None
+    ) -> Optional[bytes]:
+        """
+        Stream a download into memory, stopping at ``max_download_bytes`` or as soon
+        as ``cancelled`` is set. Raises on HTTP errors.
+        """
+        with self._host_slot(url), tracer.span(
+            "image download", cat="image", url=url
+        ) as span_args:
+            with self.session.get(
+                url, timeout=self.request_timeout, stream=True
+            ) as response:
+                response.raise_for_status()
+                declared = int(response.headers.get("Content-Length") or 0)
+                if declared > self.max_download_bytes:
+                    self.logger.warning(
+                        f"Skipping oversized image ({declared} B): {url}"
+                    )
+                    return None
+
+                chunks = []
+                received = 0
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    if cancelled is not None and cancelled.is_set():
+                        return None
+                    received += len(chunk)
+                    # Counted as they arrive, so abandoned downloads count too
+                    span_args["bytes"] = received
+                    tracer.count("image.bytes", len(chunk))
+                    if received > self.max_download_bytes:
+                        self.logger.warning(f"Image exceeded byte cap: {url}")
+                        return None
+                    chunks.append(chunk)
+        return b"".join(chunks)
+
+    def _ingest(self, url: str, data: bytes) -> Optional[Tuple[bytes, bytes]]:
+        """
+        Validate a downloaded payload and normalize it.
+
+        Returns:
+            Optional[Tuple[bytes, bytes]]: (raw, normalized PNG), or None if the
+                payload is not an image.
+        """
+        fmt = self._sniff_format(data)
+        if fmt is None:
+            self.logger.warning(f"Rejected non-image payload: {url}")
+            return None
+
+        normalized = self._normalize(data)
+        if normalized is None:
+            self.logger.warning(f"Rejected undecodable {fmt} image: {url}")
+            return None
+        return data, normalized
+
+    def _store(self, url: str, raw: bytes, normalized: bytes, dest_path: str) -> str:
+        """Cache an ingested image and place its normalized asset at ``dest_path``."""
+        content_key = self.cache.put_url(url, raw)
+        self.cache.put_normalized(content_key, self.target_height, normalized)
+        return self.cache.materialize_normalized(
+            content_key, self.target_height, dest_path
+        )
+
+    def _from_cache(self, url: str, dest_path: str) -> Optional[str]:
+        """Serve a previously ingested URL from the cache, re-normalizing if needed."""
+        content_key = self.cache.get_url(url)
+        if not content_key:
+            return None
+
+        if not self.cache.get_normalized(content_key, self.target_height):
+            with open(self.cache.blobs.path_for(content_key), "rb") as f:
+                normalized = self._normalize(f.read())
+            if normalized is None:
+                return None
+            self.cache.put_normalized(content_key, self.target_height, normalized)
+
+        return self.cache.materialize_normalized(
+            content_key, self.target_height, dest_path
+        )
+
+    def _download(self, url: str, term: str, idx: int) -> Optional[str]:
+        """Download one image over the shared session. Returns its path or None."""
+        img_path = self._image_path(term, idx)
+        cached_path = self._from_cache(url, img_path)
+        if cached_path:
+            self.logger.info(f"Image cache hit for image {idx + 1}: {url}")
+            return cached_path
+
+        try:
+            self.logger.info(f"Downloading image {idx + 1}: {url}")
+            data = self._fetch_bytes(url)
+            ingested = self._ingest(url, data) if data else None
+            if ingested is None:
+                return None
+            return self._store(url, *ingested, img_path)
+
+        except requests.RequestException as e:
+            self.logger.error(f"Request error for image {idx + 1}: {e}")
+        except Exception as e:
+            self.logger.error(f"Failed to download image {idx + 1}: {e}")
+        return None
+
+    def _get_hedge_pool(self) -> ThreadPoolExecutor:
+        with self._hedge_pool_lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers * self.hedge_candidates,
+                    thread_name_prefix="image-hedge",
+                )
+            return self._hedge_pool
+
+    def _fetch_candidate(
+        self, url: str, idx: int, cancelled: threading.Event
+    ) -> Optional[Tuple[bytes, bytes]]:
+        """
+        Stream and ingest one candidate, bailing out as soon as another
+        candidate has won. Returns (raw, normalized) only for valid images.
+        """
+        if cancelled.is_set():
+            return None
+        try:
+            data = self._fetch_bytes(url, cancelled)
+        except requests.RequestException as e:
+            self.logger.warning(f"Candidate {idx + 1} failed ({url}): {e}")
+            return None
+
+        if data is None or cancelled.is_set():
+            return None
+        return self._ingest(url, data)
+
+    def _download_hedged(self, urls: List[str], term: str) -> Optional[str]:
+        """
+        Race the candidate URLs and keep the first valid image, within the
+        per-term latency budget. Losing downloads are cancelled.
+        """
+        if not urls:
+            return None
+
+        img_path = self._image_path(term, 0)
+
+        # Any candidate we already hold wins without touching the network
+        for idx, url in enumerate(urls):
+            cached_path = self._from_cache(url, img_path)
+            if cached_path:
+                self.logger.info(f"Image cache hit for candidate {idx + 1}: {url}")
+                return cached_path
+
+        cancelled = threading.Event()
+        pool = self._get_hedge_pool()
+        pending = {
+            pool.submit(self._fetch_candidate, url, idx, cancelled): idx
+            for idx, url in enumerate(urls)
+        }
+        deadline = time.monotonic() + self.latency_budget
+
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.logger.warning(
+                        f"Latency budget of {self.latency_budget}s exhausted for: {term}"
+                    )
+                    return None
+
+                done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx = pending.pop(future)
+                    ingested = future.result()
+                    if ingested is None:
+                        continue
+
+                    self.logger.info(
+                        f"Hedged download won by candidate {idx + 1}: {urls[idx]}"
+                    )
+                    return self._store(urls[idx], *ingested, img_path)
+            return None
+        finally:
+            cancelled.set()
+            for future in pending:
+                future.cancel()
+
     def search_images(self, term: str) -> List[str]:
         """
         Search for images and download them.
@@ -59,52 +429,16 @@ class ImageDownloader:
         downloaded_image_paths: List[str] = []
 
         try:
-            # Add a delay to respect rate limits if necessary, though DDGS handles some internally
-            # Using a fresh DDGS instance for each search
-            with DDGS() as ddgs:
-                # ddgs.images returns an iterator of dicts
-                # Added error handling specifically for the generator
-                try:
-                    search_results = ddgs.images(
-                        query=term, max_results=self.max_images
-                    )
-                    # search_results is a generator, so we iterate directly
-                    for idx, item in enumerate(search_results):
-                        url = item.get("image")
-                        if not url:
-                            continue
-
-                        try:
-                            self.logger.info(f"Downloading image {idx + 1}: {url}")
-                            # Add a generic user-agent to avoid basic blocking
-                            headers = {
-                                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-                            }
-                            response = requests.get(url, timeout=10, headers=headers)
-                            response.raise_for_status()
-
-                            # Sanitize filename
-                            safe_term = "".join(
-                                c for c in term if c.isalnum() or c in (" ", "_")
-                            ).rstrip()
-                            img_name = f"{safe_term.replace(' ', '_')}_{idx + 1}.jpg"
-                            img_path = os.path.join(self.download_folder, img_name)
-
-                            with open(img_path, "wb") as img_file:
-                                img_file.write(response.content)
-
-                            downloaded_image_paths.append(img_path)
-
-                        except requests.RequestException as e:
-                            self.logger.error(f"Request error for image {idx + 1}: {e}")
-                        except Exception as e:
-                            self.logger.error(
-                                f"Failed to download image {idx + 1}: {e}"
-                            )
-
-                except Exception as e:
-                    self.logger.error(f"Error retrieving search results: {e}")
-
+            urls = self._search_urls(term)
+            if self.hedged:
+                img_path = self._download_hedged(urls[: self.hedge_candidates], term)
+                if img_path:
+                    downloaded_image_paths.append(img_path)
+            else:
+                for idx, url in enumerate(urls):
+                    img_path = self._download(url, term, idx)
+                    if img_path:
+                        downloaded_image_paths.append(img_path)
         except Exception as e:
             self.logger.critical(f"Image search failed: {e}")
 
@@ -112,3 +446,32 @@ class ImageDownloader:
             f"Downloaded {len(downloaded_image_paths)} images successfully."
         )
         return downloaded_image_paths
+
+    def search_images_many(self, terms: List[str]) -> List[List[str]]:
+        """
+        Search for and download images for many terms on a bounded thread pool.
+
+        Duplicate terms are searched once. Downloads share the keep-alive session
+        and are capped per host.
+
+        Args:
+            terms (List[str]): The search keywords.
+
+        Returns:
+            List[List[str]]: Downloaded file paths for each term, in input order.
+        """
+        unique_terms = list(dict.fromkeys(terms))
+        self.logger.info(
+            f"Fetching images for {len(unique_terms)} terms "
+            f"with {self.max_workers} workers..."
+        )
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="image"
+        ) as pool:
+            results = dict(
+                zip(unique_terms, pool.map(self.search_images, unique_terms))
+            )
+
+        self.logger.info(f"Image cache: {self.cache.stats()}")
+        return [list(results[term]) for term in terms]
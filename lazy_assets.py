@@ -0,0 +1,139 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+import numpy as np
+import PIL.Image
+from moviepy import VideoClip
+from config import ASSET_MEMORY_BUDGET
+
+
+def _nbytes(value: Any) -> int:
+    """Memory held by a cached value: its arrays, including inside tuples."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    return 0
+
+
+class AssetCache:
+    """
+    A least-recently-used cache of decoded assets (image pixels, caption states)
+    bounded by total bytes rather than entry count.
+
+    Lazy clips fetch their data through it when a frame is requested, so only the
+    layers visible around the current time stay decoded. Anything else is dropped
+    once the budget is exceeded and decoded again if it is ever needed.
+    """
+
+    def __init__(self, max_bytes: int = ASSET_MEMORY_BUDGET) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._peak_bytes = 0
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger("AssetCache")
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for ``key``, calling ``loader`` on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        value = loader()
+        size = _nbytes(value)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, size)
+                self._bytes += size
+                self._peak_bytes = max(self._peak_bytes, self._bytes)
+            # Never evict the entry just added, even if it alone is over budget
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+        return value
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes": self._bytes,
+                "peak_bytes": self._peak_bytes,
+            }
+
+
+def _load_rgba(path: str, height: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode an image (scaled to ``height`` if given) into RGB and float alpha."""
+    with PIL.Image.open(path) as image:
+        image = image.convert("RGBA")
+        if height is not None and image.height != height:
+            width = int(image.width * height / image.height)
+            image = image.resize((width, height), PIL.Image.Resampling.LANCZOS)
+        rgba = np.asarray(image)
+    return np.ascontiguousarray(rgba[..., :3]), rgba[..., 3] / 255.0
+
+
+class LazyImageClip(VideoClip):
+    """
+    A still image clip that only knows its file until a frame is requested.
+
+    The size comes from the image header. Pixels (and the alpha mask) are decoded
+    through an AssetCache on first use and may be evicted again afterwards, so a
+    long timeline of images costs memory only for the ones being shown.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cache: AssetCache,
+        height: Optional[int] = None,
+        duration: Optional[float] = None,
+    ) -> None:
+        """
+        Initialize the LazyImageClip.
+
+        Args:
+            path (str): Image file.
+            cache (AssetCache): Where decoded pixels are kept.
+            height (Optional[int]): Scale to this height, keeping aspect ratio.
+            duration (Optional[float]): Clip duration.
+        """
+        super().__init__(duration=duration)
+        self.path = path
+        self.cache = cache
+        self.key = ("image", path, height)
+        with PIL.Image.open(path) as image:
+            w, h = image.size
+        if height is not None and h != height:
+            w, h = int(w * height / h), height
+        self.size = (w, h)
+
+        def pixels() -> Tuple[np.ndarray, np.ndarray]:
+            return cache.get(self.key, lambda: _load_rgba(path, height))
+
+        # Frame functions are assigned after construction, since passing them to
+        # the constructor would render frame 0 right away
+        self.frame_function = lambda t: pixels()[0]
+        self.mask = VideoClip(is_mask=True, duration=duration)
+        self.mask.frame_function = lambda t: pixels()[1]
+        self.mask.size = self.size
+
+    def release(self) -> None:
+        self.cache.discard(self.key)
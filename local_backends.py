@@ -0,0 +1,90 @@
+import os
+import asyncio
+import hashlib
+import threading
+from typing import Any, Dict, List
+import PIL.Image
+import PIL.ImageDraw
+from moviepy.config import FFMPEG_BINARY
+from image_downloader import ImageDownloader
+from voice_generator import PETER_VOICE, VoiceGenerator
+
+
+class LocalVoiceGenerator(VoiceGenerator):
+    """
+    Offline stand-in for edge-tts, for testing and local development.
+
+    Each line becomes a quiet tone lasting as long as the line would take to
+    say, encoded like edge-tts output (24 kHz mono MP3), with evenly spaced
+    word timings. Caching, retries and batching are the real VoiceGenerator's.
+    """
+
+    words_per_second = 2.5
+
+    async def _generate_audio_file(
+        self, text: str, voice: str, output_file: str
+    ) -> List[Dict[str, Any]]:
+        words = text.split()
+        step = 1.0 / self.words_per_second
+        duration = max(step, len(words) * step)
+        frequency = 220 if voice == PETER_VOICE else 330
+
+        process = await asyncio.create_subprocess_exec(
+            FFMPEG_BINARY,
+            "-v",
+            "error",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"sine=frequency={frequency}:duration={duration:.3f}",
+            "-af",
+            "volume=0.1",
+            "-ac",
+            "1",
+            "-ar",
+            "24000",
+            "-b:a",
+            "48k",
+            "-f",
+            "mp3",
+            output_file,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='replace')}")
+        return [
+            {"text": word, "start": idx * step, "end": (idx + 1) * step}
+            for idx, word in enumerate(words)
+        ]
+
+
+class LocalImageDownloader(ImageDownloader):
+    """
+    Offline stand-in for image search, for testing and local development.
+
+    Every term gets a generated card with the term written on it, in a colour
+    derived from the term, so the same term always gives the same image.
+    """
+
+    def search_images(self, term: str) -> List[str]:
+        digest = hashlib.sha1(term.encode("utf-8")).hexdigest()[:12]
+        img_path = os.path.join(self.download_folder, f"local_{digest}.png")
+        if not os.path.exists(img_path):
+            height = self.target_height
+            color = tuple(int(digest[i : i + 2], 16) // 2 for i in (0, 2, 4))
+            image = PIL.Image.new("RGB", (height * 4 // 3, height), color)
+            draw = PIL.ImageDraw.Draw(image)
+            draw.text(
+                (image.width // 2, image.height // 2),
+                term,
+                fill="white",
+                anchor="mm",
+                font_size=max(12, height // 10),
+            )
+            tmp_path = f"{img_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            image.save(tmp_path, format="PNG")
+            os.replace(tmp_path, img_path)
+        self.logger.info(f"Local image for '{term}': {img_path}")
+        return [img_path]
@@ -1,11 +1,19 @@
 import os
+import sys
 import logging
-import shutil
-from typing import List, Dict, Any
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Dict, Any, Tuple
 
-from voice_generator import VoiceGenerator
-from video_editor import DynamicVideoEditor
-from image_downloader import ImageDownloader
+# Media, TTS and search modules are imported by the commands that use them, so
+# validating or planning a script doesn't load MoviePy, edge-tts or requests
+from batch_renderer import (
+    BatchRenderer,
+    build_paths,
+    find_scripts,
+    load_script,
+    parse_script,
+)
 from config import (
     DIALOGUE,
     VIDEO_TEMPLATE_PATH,
@@ -16,27 +24,43 @@ from config import (
     RUNTIME_LOGS_DIR,
     VIDEO_TITLE,
     TITLE_SOUND_PATH,
+    STREAMING,
+    BUILD_MANIFEST_PATH,
+    OUTPUT_FPS,
 )
+from tracing import queued_handler, tracer
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(
-            os.path.join(RUNTIME_LOGS_DIR, "flow_log.log")
-            if os.path.exists(RUNTIME_LOGS_DIR)
-            else "flow.log"
-        ),
-    ],
-)
+if TYPE_CHECKING:
+    from image_downloader import ImageDownloader
+    from voice_generator import VoiceGenerator
+
+
+def setup_logging(to_file: bool) -> None:
+    """
+    Log to the console, and to the flow log too if ``to_file`` is set. Records
+    are written on a background thread.
+    """
+    handlers: List[logging.Handler] = [logging.StreamHandler()]
+    if to_file:
+        handlers.append(
+            logging.FileHandler(
+                os.path.join(RUNTIME_LOGS_DIR, "flow_log.log")
+                if os.path.exists(RUNTIME_LOGS_DIR)
+                else "flow.log"
+            )
+        )
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[queued_handler(*handlers)],
+    )
 
 
 def setup_directories() -> None:
-    """Sets up necessary directories for the project."""
-    if os.path.exists(AUDIO_ASSETS_DIR):
-        shutil.rmtree(AUDIO_ASSETS_DIR)
+    """
+    Sets up necessary directories for the project. Generated audio and images
+    are kept: the build manifest decides which of them are still up to date.
+    """
     os.makedirs(AUDIO_ASSETS_DIR, exist_ok=True)
 
     os.makedirs(IMAGE_ASSETS_DIR, exist_ok=True)
@@ -47,8 +71,6 @@ def setup_directories() -> None:
             f"Make sure '{IMAGE_ASSETS_DIR}' contains 'peter.png' and 'stewie.png'."
         )
 
-    if os.path.exists(DOWNLOADED_IMAGES_DIR):
-        shutil.rmtree(DOWNLOADED_IMAGES_DIR)
     os.makedirs(DOWNLOADED_IMAGES_DIR, exist_ok=True)
 
     os.makedirs(RUNTIME_LOGS_DIR, exist_ok=True)
@@ -59,59 +81,70 @@ def setup_directories() -> None:
         os.makedirs(output_dir, exist_ok=True)
 
 
-def main() -> None:
-    # 1. Setup
-    setup_directories()
+def run_batch(
+    voice_generator: "VoiceGenerator", image_downloader: "ImageDownloader"
+) -> bool:
+    """
+    Generates every asset first, then edits the video in one pass.
 
-    # 2. Initialize Tools
-    voice_generator = VoiceGenerator()
-    image_downloader = ImageDownloader(
-        max_images=1, download_folder=DOWNLOADED_IMAGES_DIR
-    )
+    Returns:
+        bool: Whether the video was created.
+    """
+    from video_editor import DynamicVideoEditor
 
     processed_dialogue: List[Dict[str, Any]] = []
 
     # 3. Process Dialogue (Audio & Images)
     logging.info("Starting audio generation and image gathering...")
 
+    # A. Fetch context images in the background while the audio is synthesized
+    search_terms = [item.get("image_search") or "" for item in DIALOGUE]
+    terms_to_fetch = [term for term in search_terms if term]
+    with ThreadPoolExecutor(max_workers=1) as background:
+        images_future = background.submit(
+            image_downloader.search_images_many, terms_to_fetch
+        )
+
+        # B. Generate Audio for every line concurrently
+        audio_paths = voice_generator.generate_batch(
+            [
+                (item["sentence"], item["character"], idx)
+                for idx, item in enumerate(DIALOGUE)
+            ]
+        )
+
+        found_images = images_future.result()
+
+    images_by_term = dict(zip(terms_to_fetch, found_images))
+
     for idx, item in enumerate(DIALOGUE):
-        # A. Generate Audio
         line = f"{item['character']}: {item['sentence']}"
         logging.info(f"Processing line {idx}: {line}")
 
-        success = voice_generator.process_conversation(line, idx)
+        if audio_paths[idx] is None:
+            logging.error(f"Failed to generate audio for line {idx}: {line}")
+            logging.error("Aborting video generation due to audio failure.")
+            return False
 
-        if success:
-            item_data = item.copy()
-            item_data["id"] = idx
+        item_data = item.copy()
+        item_data["id"] = idx
 
-            # B. Download Context Image
-            search_term = item.get("image_search")
-            if search_term:
-                logging.info(f"Searching for image: {search_term}")
-                images = image_downloader.search_images(search_term)
-                if images:
-                    item_data["context_image_path"] = images[0]
-                else:
-                    logging.warning(f"No image found for: {search_term}")
+        # C. Attach Context Image
+        search_term = search_terms[idx]
+        if search_term:
+            images = images_by_term.get(search_term)
+            if images:
+                item_data["context_image_path"] = images[0]
+            else:
+                logging.warning(f"No image found for: {search_term}")
 
-            processed_dialogue.append(item_data)
-        else:
-            logging.error(f"Failed to generate audio for line {idx}: {line}")
-            logging.error("Aborting video generation due to audio failure.")
-            return
+        processed_dialogue.append(item_data)
 
     logging.info("Audio and Image processing completed.")
 
     # 4. Edit Video
     logging.info("Starting video editing...")
 
-    if not os.path.exists(VIDEO_TEMPLATE_PATH):
-        logging.error(
-            f"Video template not found at {VIDEO_TEMPLATE_PATH}. Please provide a background video."
-        )
-        return
-
     editor = DynamicVideoEditor(
         video_path=VIDEO_TEMPLATE_PATH,
         output_path=OUTPUT_VIDEO_PATH,
@@ -123,9 +156,352 @@ def main() -> None:
     try:
         editor.edit()
         logging.info(f"Video created successfully: {OUTPUT_VIDEO_PATH}")
+        return True
     except Exception as e:
         logging.error(f"Error during video editing: {e}")
+        return False
+
+
+def main() -> bool:
+    """
+    Renders the script in config.py.
+
+    Returns:
+        bool: Whether the video was created.
+    """
+    from image_downloader import ImageDownloader
+    from streaming import StreamingRenderer
+    from voice_generator import VoiceGenerator
+
+    # 1. Setup
+    setup_directories()
+
+    if not os.path.exists(VIDEO_TEMPLATE_PATH):
+        logging.error(
+            f"Video template not found at {VIDEO_TEMPLATE_PATH}. Please provide a background video."
+        )
+        return False
+
+    # 2. Initialize Tools
+    voice_generator = VoiceGenerator()
+    image_downloader = ImageDownloader(
+        max_images=1, download_folder=DOWNLOADED_IMAGES_DIR, hedged=True
+    )
+
+    if not STREAMING:
+        return run_batch(voice_generator, image_downloader)
+
+    # 3. Synthesize, fetch, lay out and render each line as soon as it can be
+    logging.info("Starting streaming render...")
+    renderer = StreamingRenderer(
+        video_path=VIDEO_TEMPLATE_PATH,
+        output_path=OUTPUT_VIDEO_PATH,
+        dialogue=DIALOGUE,
+        voice_generator=voice_generator,
+        image_downloader=image_downloader,
+        video_title=VIDEO_TITLE,
+        title_sound_path=TITLE_SOUND_PATH,
+    )
+    try:
+        renderer.run()
+        logging.info(f"Video created successfully: {OUTPUT_VIDEO_PATH}")
+        return True
+    except Exception as e:
+        logging.error(f"Error during video generation: {e}")
+        return False
+
+
+def main_batch(sources: List[str]) -> bool:
+    """
+    Renders every script under ``sources`` (script files, directories of
+    scripts, or .txt manifests listing them) in one process, each to its own
+    video named after its title.
+
+    Returns:
+        bool: Whether every script was rendered.
+    """
+    from image_downloader import ImageDownloader
+    from voice_generator import VoiceGenerator
+
+    setup_directories()
+
+    if not os.path.exists(VIDEO_TEMPLATE_PATH):
+        logging.error(
+            f"Video template not found at {VIDEO_TEMPLATE_PATH}. Please provide a background video."
+        )
+        return False
+
+    scripts = [script for source in sources for script in find_scripts(source)]
+    if not scripts:
+        logging.error(f"No scripts found in: {', '.join(sources)}")
+        return False
+
+    voice_generator = VoiceGenerator()
+    image_downloader = ImageDownloader(
+        max_images=1, download_folder=DOWNLOADED_IMAGES_DIR, hedged=True
+    )
+    results = BatchRenderer(scripts, voice_generator, image_downloader).run()
+    for script, output in results.items():
+        if output:
+            logging.info(f"{script} -> {output}")
+        else:
+            logging.error(f"{script} failed.")
+    return all(results.values())
+
+
+def load_targets(sources: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    The scripts under ``sources`` (as for ``main_batch``), or the one in
+    config.py if there are none, with where each one's build lives.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[str]]: For each usable script, its
+            "source", "title", "dialogue", "output" video, "audio_dir" and
+            "manifest" path; and an error for each script that isn't usable.
+    """
+    targets: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    if not sources:
+        try:
+            title, dialogue = parse_script(DIALOGUE, VIDEO_TITLE, "config.py")
+        except ValueError as e:
+            return [], [str(e)]
+        targets.append(
+            {
+                "source": "config.py",
+                "title": title,
+                "dialogue": dialogue,
+                "output": OUTPUT_VIDEO_PATH,
+                "audio_dir": AUDIO_ASSETS_DIR,
+                "manifest": BUILD_MANIFEST_PATH,
+            }
+        )
+        return targets, errors
+
+    scripts = [script for source in sources for script in find_scripts(source)]
+    if not scripts:
+        return [], [f"No scripts found in: {', '.join(sources)}"]
+    owners: Dict[str, str] = {}
+    for script in scripts:
+        try:
+            title, dialogue = load_script(script)
+        except (OSError, ValueError) as e:
+            errors.append(f"{script}: {e}" if isinstance(e, OSError) else str(e))
+            continue
+        output, audio_dir, manifest = build_paths(
+            title, os.path.dirname(OUTPUT_VIDEO_PATH) or "."
+        )
+        if output in owners:
+            errors.append(
+                f"{script}: its output {output} is already written by {owners[output]}."
+            )
+            continue
+        owners[output] = script
+        targets.append(
+            {
+                "source": script,
+                "title": title,
+                "dialogue": dialogue,
+                "output": output,
+                "audio_dir": audio_dir,
+                "manifest": manifest,
+            }
+        )
+    return targets, errors
+
+
+def cmd_validate(targets: List[Dict[str, Any]]) -> List[str]:
+    """Check that every character's avatar image is there."""
+    errors: List[str] = []
+    for target in targets:
+        n_errors = len(errors)
+        for idx, item in enumerate(target["dialogue"]):
+            avatar_path = os.path.join(IMAGE_ASSETS_DIR, item["image"])
+            if not os.path.exists(avatar_path):
+                errors.append(f"{target['source']}: line {idx} needs {avatar_path}.")
+        if len(errors) == n_errors:
+            print(f"{target['source']}: {len(target['dialogue'])} lines, ok.")
+    return errors
+
+
+def cmd_plan(targets: List[Dict[str, Any]]) -> List[str]:
+    """
+    Print each script's timeline, laid out as the streaming renderer would. Lines
+    already voiced by the last build (or ``synth``) are measured from their
+    audio headers; the rest are estimated from their word count, marked "~".
+    """
+    from audio_probe import audio_duration
+    from build_manifest import BuildManifest
+    from timeline import (
+        LINE_GAP,
+        TITLE_DURATION,
+        estimate_line_duration,
+        segment_frames,
+    )
+    from voice_generator import VoiceGenerator, tts_cache_key
+
+    for target in targets:
+        manifest = BuildManifest(target["manifest"])
+        print(f"{target['title']} ({target['source']} -> {target['output']})")
+        print(
+            f"  {'line':>4}  {'start':>8}  {'length':>8}  {'character':<10}  sentence"
+        )
+        first_frame = 0
+        estimated = 0
+        for idx, item in enumerate(target["dialogue"]):
+            inputs = tts_cache_key(
+                VoiceGenerator.sanitize_text(item["sentence"]),
+                VoiceGenerator.voice_for(item["character"]),
+            )
+            paths = manifest.outputs(idx, "audio", inputs)
+            if paths:
+                duration = audio_duration(paths[0])
+                mark = " "
+            else:
+                duration = estimate_line_duration(item["sentence"])
+                mark = "~"
+                estimated += 1
+            # The title opens the first segment
+            start = TITLE_DURATION + LINE_GAP if idx == 0 else 0.0
+            sentence = item["sentence"]
+            if len(sentence) > 48:
+                sentence = sentence[:45] + "..."
+            print(
+                f"  {idx:>4}  {first_frame / OUTPUT_FPS + start:>7.2f}s"
+                f"  {mark}{duration:>6.2f}s  {item['character']:<10}  {sentence}"
+            )
+            first_frame += segment_frames(start, duration, OUTPUT_FPS)
+        print(
+            f"  Total {first_frame / OUTPUT_FPS:.2f}s at {OUTPUT_FPS} fps"
+            + (f", {estimated} lines estimated." if estimated else ".")
+        )
+    return []
+
+
+def cmd_synth(targets: List[Dict[str, Any]]) -> List[str]:
+    """Voice every line ahead of rendering, recording it in the script's build."""
+    from build_manifest import BuildManifest
+    from voice_generator import VoiceGenerator
+
+    setup_directories()
+    voice_generator = VoiceGenerator()
+    errors: List[str] = []
+    for target in targets:
+        dialogue = target["dialogue"]
+        manifest = BuildManifest(target["manifest"])
+        paths = voice_generator.generate_batch(
+            [
+                (item["sentence"], item["character"], idx)
+                for idx, item in enumerate(dialogue)
+            ],
+            output_dir=target["audio_dir"],
+        )
+        for idx, (item, path) in enumerate(zip(dialogue, paths)):
+            if path is None:
+                errors.append(f"{target['source']}: line {idx} could not be voiced.")
+                continue
+            manifest.record(
+                idx,
+                "audio",
+                voice_generator.cache_key(
+                    voice_generator.sanitize_text(item["sentence"]),
+                    voice_generator.voice_for(item["character"]),
+                ),
+                [path],
+            )
+        manifest.checkpoint(force=True)
+        print(f"{target['source']}: voiced {sum(p is not None for p in paths)} lines.")
+    return errors
+
+
+def cmd_fetch(targets: List[Dict[str, Any]]) -> List[str]:
+    """Fetch every context image ahead of rendering, recording it in the script's build."""
+    from build_manifest import BuildManifest
+    from image_downloader import ImageDownloader
+
+    setup_directories()
+    image_downloader = ImageDownloader(
+        max_images=1, download_folder=DOWNLOADED_IMAGES_DIR, hedged=True
+    )
+    terms = [
+        item.get("image_search") or ""
+        for target in targets
+        for item in target["dialogue"]
+    ]
+    unique_terms = list(dict.fromkeys(term for term in terms if term))
+    found = dict(zip(unique_terms, image_downloader.search_images_many(unique_terms)))
+
+    errors: List[str] = []
+    for target in targets:
+        manifest = BuildManifest(target["manifest"])
+        for idx, item in enumerate(target["dialogue"]):
+            term = item.get("image_search") or ""
+            if not term:
+                continue
+            if found[term]:
+                manifest.record(idx, "image", term, found[term])
+            else:
+                errors.append(f"{target['source']}: no image found for '{term}'.")
+        manifest.checkpoint(force=True)
+    print(
+        f"Fetched images for {sum(bool(v) for v in found.values())} of {len(found)} terms."
+    )
+    return errors
+
+
+COMMANDS = {
+    "validate": (cmd_validate, "Check scripts without touching any media."),
+    "plan": (cmd_plan, "Print each script's timeline without opening any media."),
+    "synth": (cmd_synth, "Voice every line ahead of rendering."),
+    "fetch": (cmd_fetch, "Fetch every context image ahead of rendering."),
+    "render": (None, "Render the videos."),
+}
+# Commands that do real work; the others are dry runs
+WORK_COMMANDS = ("synth", "fetch", "render")
+
+
+def cli(argv: List[str]) -> int:
+    """
+    Command line entry point. Each command takes script files, directories of
+    scripts or .txt manifests, and works on the script in config.py without
+    any. With no command, the arguments are rendered as before.
+
+    Returns:
+        int: The exit status.
+    """
+    if not argv or argv[0] not in COMMANDS and not argv[0].startswith("-"):
+        argv = ["render"] + argv
+
+    parser = argparse.ArgumentParser(description="Family Guy dialogue video generator.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        command = commands.add_parser(name, help=help_text, description=help_text)
+        command.add_argument(
+            "scripts",
+            nargs="*",
+            help="Scripts, directories of scripts or .txt manifests "
+            "(default: the script in config.py).",
+        )
+    args = parser.parse_args(argv)
+    # Dry runs leave no files behind
+    setup_logging(to_file=args.command in WORK_COMMANDS)
+
+    errors: List[str] = []
+    ok = True
+    try:
+        if args.command == "render":
+            ok = main_batch(args.scripts) if args.scripts else main()
+        else:
+            targets, errors = load_targets(args.scripts)
+            errors += COMMANDS[args.command][0](targets)
+    finally:
+        # Only commands that did real work have anything to show
+        if args.command in WORK_COMMANDS:
+            tracer.export_run(args.command)
+    for error in errors:
+        logging.error(error)
+    return 0 if ok and not errors else 1
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(cli(sys.argv[1:]))
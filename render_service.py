@@ -0,0 +1,520 @@
+import os
+import sys
+import json
+import time
+import heapq
+import signal
+import logging
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import Any, Dict, List, Optional, Tuple
+from background_proxy import BackgroundProxyCache
+from batch_renderer import build_paths, parse_script
+from build_manifest import BuildManifest
+from config import (
+    BACKGROUND_PROXY,
+    BATCH_MAX_JOBS,
+    DOWNLOADED_IMAGES_DIR,
+    OUTPUT_FPS,
+    OUTPUT_SIZE,
+    OUTPUT_VIDEO_PATH,
+    RENDER_WORKERS,
+    SERVICE_HOST,
+    SERVICE_KEEP_FINISHED_JOBS,
+    SERVICE_PORT,
+    SERVICE_SOCKET,
+    TITLE_SOUND_PATH,
+    VIDEO_TEMPLATE_PATH,
+    DialogueItem,
+)
+from footage_library import FootageLibrary, FootageSegment
+from tracing import queued_handler, tracer
+from image_downloader import ImageDownloader
+from streaming import StreamingRenderer, make_segment_cache
+from utils import Utils
+from voice_generator import VoiceGenerator
+
+
+def _warm_worker() -> None:
+    """Runs once in each render process, so the first job doesn't pay for imports."""
+    import video_editor  # noqa: F401
+
+    # Long enough that every worker takes one of these, not one worker all
+    time.sleep(0.2)
+
+
+class RenderJob:
+    """A script submitted to the service, and how far it has got."""
+
+    def __init__(
+        self,
+        job_id: str,
+        title: str,
+        dialogue: List[DialogueItem],
+        priority: int = 0,
+        skip_failed_lines: bool = False,
+    ) -> None:
+        self.id = job_id
+        self.title = title
+        self.dialogue = dialogue
+        self.priority = priority
+        self.skip_failed_lines = skip_failed_lines
+        self.state = "queued"  # queued, running, done, failed or cancelled
+        self.output: Optional[str] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "id": self.id,
+            "title": self.title,
+            "lines": len(self.dialogue),
+            "priority": self.priority,
+            "state": self.state,
+            "output": self.output,
+            "error": self.error,
+            "queued_seconds": round(
+                (self.started_at or self.finished_at or now) - self.submitted_at, 3
+            ),
+            "render_seconds": (
+                round((self.finished_at or now) - self.started_at, 3)
+                if self.started_at
+                else None
+            ),
+        }
+
+
+class RenderService:
+    """
+    Keeps everything a render needs warm in one long-running process and runs
+    the jobs submitted to it, highest priority first.
+
+    At start the background library is indexed, its proxies are built, and a
+    pool of render processes is started with MoviePy already imported. The
+    library, the proxy and segment caches, the voice generator and the image
+    downloader (with their caches, HTTP sessions and clients) are shared by
+    every job, as are the caption cache, fonts and open background clips in
+    each process. A job then only costs its own lines: TTS, images and segments
+    it doesn't already have in the caches. Each title has its own audio
+    directory, build manifest and output, so jobs with the same title never
+    run at the same time. Clips added to the background directory are picked
+    up on restart.
+
+    Only the last ``keep_finished_jobs`` finished jobs can still be polled.
+    """
+
+    def __init__(
+        self,
+        voice_generator: VoiceGenerator,
+        image_downloader: ImageDownloader,
+        video_path: str = VIDEO_TEMPLATE_PATH,
+        output_dir: str = os.path.dirname(OUTPUT_VIDEO_PATH) or ".",
+        title_sound_path: str = TITLE_SOUND_PATH,
+        max_jobs: int = BATCH_MAX_JOBS,
+        render_workers: Optional[int] = RENDER_WORKERS,
+        fps: int = OUTPUT_FPS,
+        output_size: Optional[Tuple[int, int]] = OUTPUT_SIZE,
+        use_proxy: bool = BACKGROUND_PROXY,
+        keep_finished_jobs: int = SERVICE_KEEP_FINISHED_JOBS,
+        **renderer_kwargs: Any,
+    ) -> None:
+        """
+        Initialize the RenderService.
+
+        Args:
+            voice_generator (VoiceGenerator): Synthesizes lines for every job.
+            image_downloader (ImageDownloader): Fetches images for every job.
+            video_path (str): Background clip or directory of clips.
+            output_dir (str): Where the videos are written.
+            title_sound_path (str): Sound played under each title.
+            max_jobs (int): Jobs rendered at the same time.
+            render_workers (Optional[int]): Size of the shared render pool;
+                None = one per core.
+            fps (int): Output frame rate.
+            output_size (Optional[Tuple[int, int]]): Output (width, height).
+            use_proxy (bool): Render from background proxies.
+            keep_finished_jobs (int): Finished jobs kept for polling; older
+                ones are forgotten as new jobs come in.
+            **renderer_kwargs: Further StreamingRenderer arguments.
+        """
+        self.voice_generator = voice_generator
+        self.image_downloader = image_downloader
+        self.video_path = video_path
+        self.output_dir = output_dir
+        self.title_sound_path = title_sound_path
+        self.max_jobs = max(1, max_jobs)
+        self.render_workers = render_workers or os.cpu_count() or 1
+        self.fps = fps
+        self.output_size = output_size
+        self.use_proxy = use_proxy
+        self.keep_finished_jobs = max(0, keep_finished_jobs)
+        self.renderer_kwargs = renderer_kwargs
+        self.logger = logging.getLogger("RenderService")
+
+        self.jobs: Dict[str, RenderJob] = {}
+        self._queue: List[Tuple[int, int, str]] = []
+        self._running_titles: set = set()
+        self._next_id = 0
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._workers: List[threading.Thread] = []
+        self.render_pool: Optional[ProcessPoolExecutor] = None
+        # One for every job, so its size bound holds across them
+        self.segment_cache = make_segment_cache()
+        self.library: Optional[FootageLibrary] = None
+        self.proxies: Optional[BackgroundProxyCache] = None
+
+    def start(self) -> None:
+        """Warm everything up and start taking jobs."""
+        start = time.monotonic()
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.render_pool = ProcessPoolExecutor(
+            max_workers=self.render_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        warming = [
+            self.render_pool.submit(_warm_worker) for _ in range(self.render_workers)
+        ]
+
+        self.library = FootageLibrary(self.video_path)
+        if self.use_proxy:
+            size = self.output_size or self.library.fitted_size(
+                [FootageSegment(path, 0.0, 0.0) for path in self.library.entries]
+            )
+            self.proxies = BackgroundProxyCache()
+            for path in self.library.entries:
+                self.proxies.get(path, size, self.fps)
+        wait(warming)
+
+        for idx in range(self.max_jobs):
+            worker = threading.Thread(
+                target=self._work, name=f"render-job-{idx}", daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        self.logger.info(
+            f"Warm in {time.monotonic() - start:.1f}s: {len(self.library)} background "
+            f"clips, {self.render_workers} render workers, {self.max_jobs} job slots."
+        )
+
+    def stop(self) -> None:
+        """Stop taking jobs, let running ones finish, and release the workers."""
+        with self._cond:
+            self._stopping = True
+            for _, _, job_id in self._queue:
+                self.jobs[job_id].state = "cancelled"
+                self.jobs[job_id].finished_at = time.time()
+            self._queue.clear()
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+        if self.render_pool is not None:
+            self.render_pool.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, payload: Dict[str, Any]) -> RenderJob:
+        """
+        Queue a job.
+
+        Args:
+            payload (Dict[str, Any]): A script ({"title", "dialogue"}), plus an
+                optional integer "priority" (higher runs first) and
+                "skip_failed_lines".
+
+        Raises:
+            ValueError: If the payload is not a valid script.
+        """
+        if not isinstance(payload, dict):
+            raise ValueError("Expected a JSON object.")
+        priority = payload.get("priority", 0)
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            raise ValueError("'priority' must be an integer.")
+        title, dialogue = parse_script(payload, "", "job")
+
+        with self._cond:
+            if self._stopping:
+                raise ValueError("The service is shutting down.")
+            self._next_id += 1
+            seq = self._next_id
+            job = RenderJob(
+                str(seq),
+                title or f"job_{seq}",
+                dialogue,
+                priority,
+                bool(payload.get("skip_failed_lines", False)),
+            )
+            self._forget_finished()
+            self.jobs[job.id] = job
+            heapq.heappush(self._queue, (-priority, seq, job.id))
+            self._cond.notify()
+        self.logger.info(
+            f"Queued job {job.id}: {job.title} ({len(dialogue)} lines, "
+            f"priority {priority})."
+        )
+        return job
+
+    def _forget_finished(self) -> None:
+        """Drop the oldest finished jobs over the limit; the caller holds the lock."""
+        finished = [
+            job
+            for job in self.jobs.values()
+            if job.state in ("done", "failed", "cancelled")
+        ]
+        finished.sort(key=lambda job: job.finished_at or 0.0)
+        for job in finished[: max(0, len(finished) - self.keep_finished_jobs)]:
+            del self.jobs[job.id]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued job. Returns False if it isn't queued (any more)."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.state != "queued":
+                return False
+            self._queue = [entry for entry in self._queue if entry[2] != job_id]
+            heapq.heapify(self._queue)
+            job.state = "cancelled"
+            job.finished_at = time.time()
+            return True
+
+    def list_jobs(self) -> List[RenderJob]:
+        with self._cond:
+            return list(self.jobs.values())
+
+    def counts(self) -> Dict[str, int]:
+        with self._cond:
+            counts: Dict[str, int] = {}
+            for job in self.jobs.values():
+                counts[job.state] = counts.get(job.state, 0) + 1
+            return counts
+
+    def _next_job(self) -> Optional[RenderJob]:
+        """Wait for the best queued job whose title isn't already rendering."""
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None
+                ready = [
+                    entry
+                    for entry in self._queue
+                    if Utils.safe_title(self.jobs[entry[2]].title)
+                    not in self._running_titles
+                ]
+                if ready:
+                    entry = min(ready)
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    job = self.jobs[entry[2]]
+                    job.state = "running"
+                    job.started_at = time.time()
+                    self._running_titles.add(Utils.safe_title(job.title))
+                    return job
+                self._cond.wait()
+
+    def _work(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                job.output = self._render(job)
+                job.state = "done"
+            except Exception as e:
+                self.logger.error(f"Job {job.id} failed: {e}")
+                job.error = str(e)
+                job.state = "failed"
+            with self._cond:
+                job.finished_at = time.time()
+                self._running_titles.discard(Utils.safe_title(job.title))
+                self._cond.notify_all()
+            self.logger.info(
+                f"Job {job.id} {job.state} in "
+                f"{job.finished_at - job.started_at:.1f}s."
+            )
+            # Everything recorded since the last job finished (including any
+            # job running alongside), so the service's trace never fills up
+            try:
+                tracer.export_run(f"job_{job.id}", drain=True)
+            except OSError as e:
+                self.logger.warning(f"Could not write the trace of job {job.id}: {e}")
+
+    def _render(self, job: RenderJob) -> str:
+        output_path, audio_dir, manifest_path = build_paths(job.title, self.output_dir)
+        StreamingRenderer(
+            video_path=self.video_path,
+            output_path=output_path,
+            dialogue=job.dialogue,
+            voice_generator=self.voice_generator,
+            image_downloader=self.image_downloader,
+            video_title=job.title,
+            title_sound_path=self.title_sound_path,
+            render_workers=self.render_workers,
+            fps=self.fps,
+            output_size=self.output_size,
+            use_proxy=self.use_proxy,
+            manifest=BuildManifest(manifest_path),
+            skip_failed_lines=job.skip_failed_lines,
+            render_pool=self.render_pool,
+            audio_dir=audio_dir,
+            segment_cache=self.segment_cache,
+            library=self.library,
+            proxies=self.proxies,
+            **self.renderer_kwargs,
+        ).run()
+        return output_path
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    The job API:
+
+    - ``POST /jobs`` with a script (plus "priority") queues a job: 202 with its status.
+    - ``GET /jobs`` lists the jobs still kept; ``GET /jobs/<id>`` polls one.
+    - ``DELETE /jobs/<id>`` cancels a queued job.
+    - ``GET /health`` reports the number of jobs in each state.
+    """
+
+    server_version = "RenderService/1"
+
+    @property
+    def service(self) -> RenderService:
+        return self.server.service
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Unix socket peers have no address; requests are logged without one
+        self.service.logger.debug(format % args)
+
+    def _send(self, status: int, body: Any) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_id(self) -> Optional[str]:
+        parts = self.path.strip("/").split("/")
+        return parts[1] if len(parts) == 2 and parts[0] == "jobs" else None
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/health":
+            self._send(200, {"status": "ok", "jobs": self.service.counts()})
+        elif self.path.rstrip("/") == "/jobs":
+            self._send(200, [job.to_dict() for job in self.service.list_jobs()])
+        else:
+            job = self.service.jobs.get(self._job_id() or "")
+            if job is None:
+                self._send(404, {"error": "No such job."})
+            else:
+                self._send(200, job.to_dict())
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") != "/jobs":
+            self._send(404, {"error": "Not found."})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = self.service.submit(json.loads(self.rfile.read(length) or b"null"))
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+        self._send(202, job.to_dict())
+
+    def do_DELETE(self) -> None:
+        job = self.service.jobs.get(self._job_id() or "")
+        if job is None:
+            self._send(404, {"error": "No such job."})
+        elif self.service.cancel(job.id):
+            self._send(200, job.to_dict())
+        else:
+            self._send(409, {"error": "Only queued jobs can be cancelled."})
+
+
+class _UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(
+    service: RenderService,
+    host: str = SERVICE_HOST,
+    port: int = SERVICE_PORT,
+    socket_path: Optional[str] = SERVICE_SOCKET,
+) -> None:
+    """Warm the service up and answer the job API until interrupted."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, _RequestHandler)
+        address = socket_path
+    else:
+        server = ThreadingHTTPServer((host, port), _RequestHandler)
+        server.daemon_threads = True
+        address = f"http://{host}:{server.server_address[1]}"
+    server.service = service
+
+    if threading.current_thread() is threading.main_thread():
+        # Service managers stop daemons with SIGTERM; finish running jobs first
+        signal.signal(
+            signal.SIGTERM,
+            lambda *_: threading.Thread(target=server.shutdown, daemon=True).start(),
+        )
+    service.start()
+    service.logger.info(f"Accepting jobs on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+        tracer.export_run("service")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Keep a warm renderer running.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument(
+        "--socket", default=SERVICE_SOCKET, help="Serve on a Unix socket instead"
+    )
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="Use the offline TTS and image search stand-ins",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[queued_handler(logging.StreamHandler())],
+    )
+    if args.local:
+        from local_backends import LocalImageDownloader, LocalVoiceGenerator
+
+        voice_generator: VoiceGenerator = LocalVoiceGenerator()
+        image_downloader: ImageDownloader = LocalImageDownloader(
+            max_images=1, download_folder=DOWNLOADED_IMAGES_DIR
+        )
+    else:
+        voice_generator = VoiceGenerator()
+        image_downloader = ImageDownloader(
+            max_images=1, download_folder=DOWNLOADED_IMAGES_DIR, hedged=True
+        )
+    serve(
+        RenderService(voice_generator, image_downloader),
+        args.host,
+        args.port,
+        args.socket,
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
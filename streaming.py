@@ -0,0 +1,681 @@
+import os
+import queue
+import shutil
+import logging
+import tempfile
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+from audio_probe import audio_duration
+from background_proxy import BackgroundProxyCache
+from build_manifest import BuildManifest
+from config import (
+    BACKGROUND_PROXY,
+    CONTEXT_IMAGE_HEIGHT,
+    OUTPUT_FPS,
+    OUTPUT_SIZE,
+    RENDER_MAX_RETRIES,
+    RENDER_WORKERS,
+    SEGMENT_CACHE_DIR,
+    SEGMENT_CACHE_MAX_BYTES,
+    SKIP_FAILED_LINES,
+    STREAM_QUEUE_SIZE,
+)
+from disk_cache import DiskCache
+from footage_library import FootageLibrary, FootageSegment, footage_between
+from image_downloader import ImageDownloader
+from timeline import TITLE_DURATION, LINE_GAP, estimate_duration, segment_frames
+from tracing import run_traced, tracer
+from utils import Utils
+from video_editor import DynamicVideoEditor, _render_part
+from voice_generator import VoiceGenerator
+
+# Bump whenever compositing changes, so cached segments are rendered again
+SEGMENT_FORMAT = 1
+
+_DONE = object()
+
+
+def make_segment_cache() -> DiskCache:
+    """The process's rendered segment cache, shared by every renderer."""
+    return DiskCache.shared(
+        SEGMENT_CACHE_DIR,
+        SEGMENT_CACHE_MAX_BYTES,
+        suffix=".mp4",
+        name="StreamingRenderer.segments",
+    )
+
+
+class StreamingRenderer:
+    """
+    Produces the video with each dialogue line moving through synthesis, image
+    search, layout and rendering as soon as its own inputs are ready, instead of
+    waiting for the whole script at every step.
+
+    Stages are threads connected by bounded queues. TTS and image search post
+    finished lines to an event queue. The layout stage places lines in script
+    order (a line's start depends on every earlier line's duration) and puts
+    each line's segment on a bounded render queue. Segments are composited in a
+    process pool. Once the last segment is done, the soundtrack is mixed and the
+    segments are stream-copied together. The video is then finished soon after
+    the slower of the network and the renderer, not after both.
+
+    Builds are incremental. Every line is rendered as its own segment, in its own
+    local time and a whole number of frames long, so it doesn't depend on when
+    it plays. Segments are cached under a key of all their inputs. A
+    BuildManifest lets unchanged lines skip TTS and image search and keep their
+    background cut. After an edit, only the edited lines are synthesized and
+    rendered again.
+
+    A line that still fails after its retries costs only that line. The other
+    lines carry on, and everything finished is checkpointed into the manifest
+    and the caches as it completes, so a rerun (after a failure, a crash or a
+    kill) redoes only the unfinished work. The run fails at the end listing the
+    lines that failed, or leaves them out if ``skip_failed_lines`` is set.
+    """
+
+    def __init__(
+        self,
+        video_path: str,
+        output_path: str,
+        dialogue: List[Dict[str, Any]],
+        voice_generator: VoiceGenerator,
+        image_downloader: ImageDownloader,
+        video_title: str,
+        title_sound_path: str,
+        render_workers: Optional[int] = RENDER_WORKERS,
+        fps: int = OUTPUT_FPS,
+        output_size: Optional[Tuple[int, int]] = OUTPUT_SIZE,
+        use_proxy: bool = BACKGROUND_PROXY,
+        queue_size: int = STREAM_QUEUE_SIZE,
+        manifest: Optional[BuildManifest] = None,
+        render_retries: int = RENDER_MAX_RETRIES,
+        skip_failed_lines: bool = SKIP_FAILED_LINES,
+        render_pool: Optional[ProcessPoolExecutor] = None,
+        audio_dir: Optional[str] = None,
+        segment_cache: Optional[DiskCache] = None,
+        library: Optional[FootageLibrary] = None,
+        proxies: Optional[BackgroundProxyCache] = None,
+        **editor_kwargs: Any,
+    ) -> None:
+        """
+        Initialize the StreamingRenderer.
+
+        Args:
+            video_path (str): Background clip or directory of clips.
+            output_path (str): Where to write the video.
+            dialogue (List[Dict[str, Any]]): Script lines (character, sentence,
+                image, optional image_search), in order.
+            voice_generator (VoiceGenerator): Synthesizes the lines.
+            image_downloader (ImageDownloader): Fetches context images.
+            video_title (str): Title shown at the start.
+            title_sound_path (str): Sound played under the title.
+            render_workers (Optional[int]): Rendering processes; None = one per core.
+            fps (int): Output frame rate.
+            output_size (Optional[Tuple[int, int]]): Output (width, height).
+            use_proxy (bool): Render from background proxies.
+            queue_size (int): Capacity of each queue between stages.
+            manifest (Optional[BuildManifest]): Record of the previous build;
+                the default one under the cache directory if None.
+            render_retries (int): Extra attempts for a segment that fails to
+                render, with jittered exponential backoff between them.
+            skip_failed_lines (bool): Produce the video without the lines that
+                still fail, instead of failing the run.
+            render_pool (Optional[ProcessPoolExecutor]): Rendering processes
+                shared with other renderers; the run starts (and stops) its own
+                if None.
+            audio_dir (Optional[str]): Where this script's audio is written;
+                the audio assets directory if None.
+            segment_cache (Optional[DiskCache]): Rendered segment cache shared
+                with other renderers, so its size bound holds across them; one
+                of its own if None.
+            library (Optional[FootageLibrary]): Background library already
+                indexed (e.g. by a warm service); ``video_path`` is indexed if
+                None.
+            proxies (Optional[BackgroundProxyCache]): Background proxies to
+                render from when ``use_proxy`` is set; opened here if None.
+            **editor_kwargs: Further DynamicVideoEditor arguments
+                (subtitle_mode, compositor).
+        """
+        self.video_path = video_path
+        self.output_path = output_path
+        self.dialogue = dialogue
+        self.voice_generator = voice_generator
+        self.image_downloader = image_downloader
+        self.video_title = video_title
+        self.title_sound_path = title_sound_path
+        self.render_workers = render_workers or os.cpu_count() or 1
+        self.fps = fps
+        self.output_size = output_size
+        self.use_proxy = use_proxy
+        self.queue_size = max(1, queue_size)
+        self.manifest = manifest or BuildManifest()
+        self.render_retries = max(0, render_retries)
+        self.skip_failed_lines = skip_failed_lines
+        self.render_pool = render_pool
+        self.audio_dir = audio_dir
+        self.editor_kwargs = editor_kwargs
+
+        self.segment_cache = segment_cache or make_segment_cache()
+        self.proxies = (proxies or BackgroundProxyCache()) if use_proxy else None
+        self.library = library
+        self.background_segments: List[FootageSegment] = []
+        self.editor: Optional[DynamicVideoEditor] = None
+        self.stop = threading.Event()
+        self.errors: List[BaseException] = []
+        # Lines given up on, with the reason
+        self.failed: Dict[int, str] = {}
+        self._failed_lock = threading.Lock()
+        self.logger = logging.getLogger("StreamingRenderer")
+
+        # What each line's TTS audio and context image are made from
+        self.audio_inputs = [
+            voice_generator.cache_key(
+                VoiceGenerator.sanitize_text(item["sentence"]),
+                VoiceGenerator.voice_for(item["character"]),
+            )
+            for item in dialogue
+        ]
+        self.image_inputs = [item.get("image_search") or "" for item in dialogue]
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        """Blocking put that gives up once the pipeline is stopping."""
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _synthesize(self, events: queue.Queue) -> None:
+        """
+        TTS stage: posts ("audio", line, path or None) as each line finishes.
+        Lines whose audio from the last build is still valid are posted first.
+        """
+        try:
+            pending: List[int] = []
+            reused: List[Tuple[str, int, str]] = []
+            for idx in range(len(self.dialogue)):
+                paths = self.manifest.outputs(idx, "audio", self.audio_inputs[idx])
+                if paths and os.path.exists(Utils.word_timings_path(paths[0])):
+                    reused.append(("audio", idx, paths[0]))
+                else:
+                    pending.append(idx)
+            self.logger.info(f"Reusing audio for {len(reused)} lines.")
+            # Posted alongside synthesis, so a full queue can't delay the requests
+            threading.Thread(
+                target=lambda: [self._put(events, event) for event in reused],
+                daemon=True,
+            ).start()
+            if not pending:
+                return
+
+            with tracer.span("synthesize", video=self.video_title, lines=len(pending)):
+                self.voice_generator.generate_batch(
+                    [
+                        (
+                            self.dialogue[idx]["sentence"],
+                            self.dialogue[idx]["character"],
+                            idx,
+                        )
+                        for idx in pending
+                    ],
+                    on_done=lambda position, path: self._put(
+                        events, ("audio", pending[position], path)
+                    ),
+                    output_dir=self.audio_dir,
+                )
+        except BaseException as e:
+            self._put(events, ("error", None, e))
+
+    def _fetch_images(self, events: queue.Queue, pool: ThreadPoolExecutor) -> None:
+        """Image stage: one search per distinct term, posted to every line using it."""
+        lines_by_term: Dict[str, List[int]] = {}
+        for idx, term in enumerate(self.image_inputs):
+            if not term:
+                continue
+            reused = self.manifest.outputs(idx, "image", term)
+            if reused:
+                pool.submit(self._put, events, ("image", idx, reused))
+            else:
+                lines_by_term.setdefault(term, []).append(idx)
+
+        def fetch(term: str) -> None:
+            try:
+                paths = self.image_downloader.search_images(term)
+            except Exception as e:
+                # A missing image must not hold up the lines waiting for it
+                self.logger.warning(f"Image search failed for {term}: {e}")
+                paths = []
+            for idx in lines_by_term[term]:
+                self._put(events, ("image", idx, paths))
+
+        for term in lines_by_term:
+            pool.submit(fetch, term)
+
+    def _fail(self, idx: int, reason: str) -> None:
+        self.logger.error(f"Line {idx} failed: {reason}")
+        with self._failed_lock:
+            self.failed.setdefault(idx, reason)
+
+    def _render_segments(self, jobs: queue.Queue, pool: ProcessPoolExecutor) -> None:
+        """
+        Render stage: composites queued segments into the cache until told to
+        finish. A segment that keeps failing marks its line as failed.
+        """
+        while True:
+            job = jobs.get()
+            if job is _DONE:
+                return
+            if self.stop.is_set():
+                continue
+            idx, key, args, part_path = job
+            for attempt in range(self.render_retries + 1):
+                tmp_path = self.segment_cache.reserve(key)
+                try:
+                    _, trace = pool.submit(
+                        run_traced, _render_part, *args, tmp_path
+                    ).result()
+                    tracer.merge(trace)
+                    # The run keeps its own link, as eviction may take the
+                    # cache entry before the concat
+                    DiskCache.link_or_copy(tmp_path, part_path)
+                    self.segment_cache.commit(key, tmp_path)
+                    self.manifest.checkpoint()
+                    break
+                except BrokenProcessPool as e:
+                    # The pool is gone; nothing else can be rendered
+                    self.segment_cache.discard(tmp_path)
+                    self.errors.append(e)
+                    self.stop.set()
+                    break
+                except Exception as e:
+                    self.segment_cache.discard(tmp_path)
+                    if attempt == self.render_retries or self.stop.is_set():
+                        self._fail(idx, f"rendering failed: {e}")
+                        break
+                    self.logger.warning(
+                        f"Rendering line {idx} failed "
+                        f"(attempt {attempt + 1}/{self.render_retries + 1}): {e}"
+                    )
+                    tracer.count("render.retries")
+                    time.sleep(Utils.backoff_delay(attempt))
+
+    def _make_editor(self) -> DynamicVideoEditor:
+        return DynamicVideoEditor(
+            video_path=self.video_path,
+            output_path=self.output_path,
+            dialogue_data=[],
+            video_title=self.video_title,
+            title_sound_path=self.title_sound_path,
+            background_segments=self.background_segments,
+            render_workers=1,
+            fps=self.fps,
+            output_size=self.output_size,
+            use_proxy=self.use_proxy,
+            **self.editor_kwargs,
+        )
+
+    def _valid_footage(self, cuts: Optional[List[List[Any]]]) -> List[FootageSegment]:
+        """Recorded cuts as segments, or [] if any no longer fits its clip."""
+        segments = [FootageSegment(*cut) for cut in cuts or []]
+        for segment in segments:
+            entry = self.library.entries.get(segment.path)
+            if entry is None or segment.end > entry["duration"]:
+                return []
+        return segments
+
+    def _ensure_footage(self, needed: float, margin: float) -> None:
+        """
+        Make sure the background lasts ``needed`` seconds, picking ``margin``
+        seconds more when it has to be extended. Footage already handed to the
+        renderer is never changed, only appended to.
+        """
+        have = sum(segment.duration for segment in self.background_segments)
+        if self.editor is not None and have >= needed:
+            return
+
+        if self.editor is None:
+            if self.library is None:
+                self.library = FootageLibrary(self.video_path)
+            # Keep the last build's background, so unchanged lines keep theirs
+            self.background_segments = self._valid_footage(self.manifest.background)
+            have = sum(segment.duration for segment in self.background_segments)
+
+        if have < needed:
+            keyframe_interval = (
+                BackgroundProxyCache.keyframe_interval if self.use_proxy else None
+            )
+            if self.background_segments:
+                self.logger.info(
+                    f"Extending background by {needed - have + margin:.1f}s."
+                )
+            self.background_segments = self.background_segments + self.library.pick(
+                needed - have + margin, keyframe_interval=keyframe_interval
+            )
+        if self.output_size is None:
+            self.output_size = self.library.fitted_size(self.background_segments)
+        self.manifest.background = [list(s) for s in self.background_segments]
+        self.editor = self._make_editor()
+
+    def _line_key(self, entry: Dict[str, Any], title: bool, frames: int) -> str:
+        """Key of everything a line's segment looks like, apart from its footage."""
+        editor = self.editor
+        item = entry["item"]
+        avatar_path = f"image_assests/{item['image']}"
+        context_path = item.get("context_image_path")
+        words_path = Utils.word_timings_path(entry["audio_path"])
+        return DiskCache.make_key(
+            "line",
+            SEGMENT_FORMAT,
+            self.fps,
+            editor.video.size,
+            editor.subtitle_mode,
+            editor.compositor,
+            editor.caption_renderer.style,
+            CONTEXT_IMAGE_HEIGHT,
+            self.video_title if title else None,
+            item["sentence"],
+            item["image"],
+            self.manifest.sha256(avatar_path) if os.path.exists(avatar_path) else None,
+            self.manifest.sha256(context_path) if context_path else None,
+            self.manifest.sha256(entry["audio_path"]),
+            self.manifest.sha256(words_path) if os.path.exists(words_path) else None,
+            entry["start"],
+            entry["duration"],
+            frames,
+        )
+
+    def _queue_segment(
+        self,
+        jobs: queue.Queue,
+        work_dir: str,
+        idx: int,
+        entry: Dict[str, Any],
+        first_frame: int,
+        title: bool,
+    ) -> Tuple[str, int, List[FootageSegment]]:
+        """
+        Find or render the segment for one line.
+
+        Args:
+            jobs (queue.Queue): The render queue.
+            work_dir (str): Where the run keeps its segments until the concat.
+            idx (int): Line index.
+            entry (Dict[str, Any]): The line's layout entry, in segment-local time.
+            first_frame (int): Where the segment starts in the video.
+            title (bool): Whether the segment opens with the title.
+
+        Returns:
+            Tuple[str, int, List[FootageSegment]]: Segment file, its length in
+                frames, and the background cuts it plays over.
+        """
+        # The line and the gap after it (plus the title before the first one)
+        frames = segment_frames(entry["start"], entry["duration"], self.fps)
+        line_key = self._line_key(entry, title, frames)
+
+        # Render over a frame more footage than shown, as the part renderer expects
+        length = (frames + 1) / self.fps
+        footage = self._valid_footage(self.manifest.footage(line_key))
+        if abs(sum(s.duration for s in footage) - length) > 1e-6:
+            start = first_frame / self.fps
+            self._ensure_footage(
+                start + length, estimate_duration(self.dialogue[idx + 1 :])
+            )
+            footage = footage_between(self.background_segments, start, start + length)
+
+        segment_key = DiskCache.make_key(
+            "segment",
+            line_key,
+            [
+                (
+                    s.path,
+                    self.library.entries[s.path]["size"],
+                    self.library.entries[s.path]["mtime_ns"],
+                    s.start,
+                    s.end,
+                )
+                for s in footage
+            ],
+        )
+        self.manifest.record_segment(line_key, segment_key, [list(s) for s in footage])
+
+        part_path = os.path.join(work_dir, f"segment_{idx:04d}.mp4")
+        if self.segment_cache.get(segment_key) is not None:
+            try:
+                self.segment_cache.materialize(segment_key, part_path)
+                self.logger.info(f"Line {idx} unchanged; reusing its segment.")
+                return part_path, frames, footage
+            except OSError:
+                # Evicted since the lookup; rendered again below
+                pass
+
+        # Rasterized here, so the render worker only reads it from the cache
+        self.editor.prerender_captions([entry])
+        kwargs = self.editor.worker_kwargs()
+        kwargs["background_segments"] = footage
+        kwargs["video_title"] = self.video_title if title else None
+        self._put(
+            jobs, (idx, segment_key, (kwargs, [entry], length, (0, frames)), part_path)
+        )
+        return part_path, frames, footage
+
+    def _layout(
+        self, events: queue.Queue, jobs: queue.Queue, work_dir: str
+    ) -> List[Dict[str, Any]]:
+        """
+        Layout stage: places lines in order as their audio and image arrive and
+        queues each one's segment. Outputs are recorded in the manifest as soon
+        as they arrive. Lines whose audio failed are left out.
+
+        Returns:
+            List[Dict[str, Any]]: For each placed line, in order: its layout
+                "entry" (in segment-local time), segment "part" file, length in
+                "frames" and background "footage".
+        """
+        n = len(self.dialogue)
+        audio: Dict[int, Optional[str]] = {}
+        images: Dict[int, List[str]] = {
+            idx: [] for idx, term in enumerate(self.image_inputs) if not term
+        }
+        placed: List[Dict[str, Any]] = []
+        next_idx = 0
+        first_frame = 0
+
+        while next_idx < n:
+            try:
+                kind, idx, value = events.get(timeout=0.5)
+            except queue.Empty:
+                if self.stop.is_set():
+                    raise RuntimeError("Rendering failed.") from (
+                        self.errors[0] if self.errors else None
+                    )
+                continue
+            if kind == "error":
+                raise value
+            if kind == "audio":
+                audio[idx] = value
+                if value is None:
+                    self._fail(idx, "audio could not be generated")
+                else:
+                    self.manifest.record(idx, "audio", self.audio_inputs[idx], [value])
+            else:
+                images[idx] = value
+                if value:
+                    self.manifest.record(idx, "image", self.image_inputs[idx], value)
+            self.manifest.checkpoint()
+
+            # Place every line whose predecessors are placed and inputs are ready
+            while next_idx < n and next_idx in audio and next_idx in images:
+                idx = next_idx
+                next_idx += 1
+                if audio[idx] is None:
+                    continue
+                item = self.dialogue[idx].copy()
+                item["id"] = idx
+                if images[idx]:
+                    item["context_image_path"] = images[idx][0]
+                elif item.get("image_search"):
+                    self.logger.warning(f"No image found for: {item['image_search']}")
+
+                # The title opens the first line that made it
+                title = not placed
+                entry = {
+                    "item": item,
+                    "audio_path": audio[idx],
+                    "start": TITLE_DURATION + LINE_GAP if title else 0.0,
+                    "duration": audio_duration(audio[idx]),
+                }
+                part_path, frames, footage = self._queue_segment(
+                    jobs, work_dir, idx, entry, first_frame, title
+                )
+                placed.append(
+                    {
+                        "entry": entry,
+                        "part": part_path,
+                        "frames": frames,
+                        "footage": footage,
+                    }
+                )
+                self.logger.info(
+                    f"Line {idx} ready at {first_frame / self.fps + entry['start']:.2f}s."
+                )
+                first_frame += frames
+
+        return placed
+
+    def run(self) -> None:
+        """
+        Produce the video.
+
+        Raises:
+            RuntimeError: If any line's audio or segment still failed after its
+                retries (unless ``skip_failed_lines`` is set), or the pipeline
+                itself broke down.
+        """
+        output_dir = os.path.dirname(self.output_path) or "."
+        work_dir = tempfile.mkdtemp(prefix=".render_", dir=output_dir)
+        events: queue.Queue = queue.Queue(self.queue_size)
+        jobs: queue.Queue = queue.Queue(self.queue_size)
+        image_pool = ThreadPoolExecutor(
+            max_workers=self.image_downloader.max_workers, thread_name_prefix="image"
+        )
+        render_pool = self.render_pool or ProcessPoolExecutor(
+            max_workers=self.render_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        renderers = [
+            threading.Thread(
+                target=self._render_segments, args=(jobs, render_pool), daemon=True
+            )
+            for _ in range(self.render_workers)
+        ]
+        self.logger.info(
+            f"Streaming {len(self.dialogue)} lines into {self.render_workers} "
+            f"render workers..."
+        )
+
+        try:
+            threading.Thread(
+                target=self._synthesize, args=(events,), daemon=True
+            ).start()
+            self._fetch_images(events, image_pool)
+            for thread in renderers:
+                thread.start()
+
+            # Background proxies are built while the network stages run
+            with tracer.span("footage", video=self.video_title):
+                self._ensure_footage(estimate_duration(self.dialogue), 0.0)
+            self.manifest.checkpoint(force=True)
+            with tracer.span(
+                "layout", video=self.video_title, lines=len(self.dialogue)
+            ):
+                placed = self._layout(events, jobs, work_dir)
+            self.manifest.checkpoint(force=True)
+            with tracer.span("wait for renders", video=self.video_title):
+                for _ in renderers:
+                    jobs.put(_DONE)
+                for thread in renderers:
+                    thread.join()
+            if self.errors:
+                raise RuntimeError("Rendering failed.") from self.errors[0]
+
+            self.manifest.save(len(self.dialogue))
+            if self.failed:
+                failed = ", ".join(str(idx) for idx in sorted(self.failed))
+                if not self.skip_failed_lines:
+                    raise RuntimeError(
+                        f"Lines {failed} failed; rerun to retry just those lines."
+                    )
+                self.logger.error(f"Leaving out failed lines {failed}.")
+                placed = [
+                    line
+                    for line in placed
+                    if line["entry"]["item"]["id"] not in self.failed
+                ]
+            if not placed:
+                raise RuntimeError("No line could be produced.")
+
+            # Segments are self-contained, so the video is just the ones that made it
+            layout: List[Dict[str, Any]] = []
+            played: List[FootageSegment] = []
+            first_frame = 0
+            for line in placed:
+                entry = line["entry"]
+                layout.append(
+                    dict(entry, start=first_frame / self.fps + entry["start"])
+                )
+                played += footage_between(line["footage"], 0, line["frames"] / self.fps)
+                first_frame += line["frames"]
+
+            editor = self.editor
+            editor.dialogue_data = [entry["item"] for entry in layout]
+            editor.line_layout = layout
+            editor.current_start = first_frame / self.fps
+            # Background audio follows the cuts the segments were rendered over
+            editor.background_cuts = [
+                (
+                    (
+                        self.proxies.get(s.path, self.output_size, self.fps)
+                        if self.proxies
+                        else s.path
+                    ),
+                    s.start,
+                    s.end,
+                )
+                for s in played
+            ]
+            editor.background_has_audio = all(
+                self.library.entries[s.path]["audio"] for s in played
+            )
+            audio_path = os.path.join(work_dir, "audio.wav")
+            with tracer.span("mix audio", video=self.video_title):
+                editor.mix_audio(audio_path)
+            with tracer.span("concat", video=self.video_title, segments=len(placed)):
+                editor.concat_parts(
+                    [line["part"] for line in placed], audio_path, work_dir
+                )
+        finally:
+            self.stop.set()
+            # Whatever finished is kept for the next run, even if this one broke
+            self.manifest.checkpoint(force=True)
+            # Queued segments are no longer wanted; every render thread still
+            # running gets its sentinel and is waited for, so none is leaked
+            while True:
+                try:
+                    jobs.get_nowait()
+                except queue.Empty:
+                    break
+            running = [thread for thread in renderers if thread.is_alive()]
+            for _ in running:
+                jobs.put(_DONE)
+            for thread in running:
+                thread.join()
+            image_pool.shutdown(wait=False, cancel_futures=True)
+            if render_pool is not self.render_pool:
+                render_pool.shutdown(wait=True, cancel_futures=True)
+            shutil.rmtree(work_dir, ignore_errors=True)
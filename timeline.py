@@ -0,0 +1,151 @@
+import os
+import bisect
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+from audio_probe import audio_duration
+from config import AUDIO_ASSETS_DIR
+
+T = TypeVar("T")
+
+TITLE_DURATION = 1.0
+LINE_GAP = 0.5  # Silence between dialogue lines, in seconds
+
+# Conservative speaking rate for sizing things before any audio exists
+# (edge-tts voices speak about 2.5-3 words per second)
+WORDS_PER_SECOND = 2.0
+
+
+def estimate_line_duration(sentence: str) -> float:
+    """Rough upper estimate of how long a line takes to say, from its word count."""
+    return len(sentence.split()) / WORDS_PER_SECOND
+
+
+def estimate_duration(dialogue: List[Dict[str, Any]]) -> float:
+    """Rough upper estimate of the video length from the script's word count."""
+    return (
+        TITLE_DURATION
+        + LINE_GAP
+        + sum(estimate_line_duration(item["sentence"]) + LINE_GAP for item in dialogue)
+    )
+
+
+def segment_frames(start: float, duration: float, fps: int) -> int:
+    """
+    Length in frames of a line's segment: the line and the gap after it, plus
+    whatever comes before it in the segment (the title, for the first line).
+    Each segment is rounded to whole frames on its own, so a line's segment
+    doesn't change when earlier lines do.
+    """
+    return round((start + duration + LINE_GAP) * fps)
+
+
+def layout_dialogue(
+    dialogue_data: List[Dict[str, Any]], audio_dir: str = AUDIO_ASSETS_DIR
+) -> Tuple[List[Dict[str, Any]], float]:
+    """
+    Compute when each dialogue line starts and how long it lasts, from the
+    voice files' headers alone (nothing is decoded or opened as media).
+    Lines whose audio file is missing are skipped.
+
+    Args:
+        dialogue_data (List[Dict[str, Any]]): Lines with 'character' and 'id'.
+        audio_dir (str): Directory holding the TTS audio.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], float]: One entry per line (item,
+            audio_path, start, duration) in order, and the total video duration.
+    """
+    current_start = TITLE_DURATION + LINE_GAP
+    entries: List[Dict[str, Any]] = []
+    for item in dialogue_data:
+        # The ID is added in main.py
+        audio_filename = f"{item['character'].lower()}_audio_{item['id']}.mp3"
+        audio_path = os.path.join(audio_dir, audio_filename)
+
+        if not os.path.exists(audio_path):
+            print(f"Audio file not found: {audio_path}, skipping.")
+            continue
+
+        duration = audio_duration(audio_path)
+        entries.append(
+            {
+                "item": item,
+                "audio_path": audio_path,
+                "start": current_start,
+                "duration": duration,
+            }
+        )
+        current_start += duration + LINE_GAP
+    return entries, current_start
+
+
+class Timeline(Generic[T]):
+    """
+    A sorted event index over layers that each occupy a ``[start, end)`` interval.
+
+    The timeline is cut into elementary intervals at every start and end time, and
+    the layers active in each one are recorded once at build time. Looking up what
+    is visible at time ``t`` is then a single binary search, independent of how
+    many layers the whole video has. Layers keep their original order, so the
+    result can be composited bottom-to-top as given.
+    """
+
+    def __init__(
+        self,
+        layers: Sequence[T],
+        start_of: Callable[[T], float] = lambda layer: layer.start,
+        end_of: Callable[[T], Optional[float]] = lambda layer: layer.end,
+    ) -> None:
+        """
+        Build the index.
+
+        Args:
+            layers (Sequence[T]): Layers in compositing order (bottom first).
+            start_of (Callable[[T], float]): Returns a layer's start time.
+            end_of (Callable[[T], Optional[float]]): Returns a layer's end time, or
+                None for layers that never end.
+        """
+        self.layers: List[T] = list(layers)
+        starts = [start_of(layer) for layer in self.layers]
+        ends = [end_of(layer) for layer in self.layers]
+
+        self.boundaries: List[float] = sorted(
+            set(starts) | {end for end in ends if end is not None}
+        )
+        self._active: List[List[T]] = []
+
+        # Sweep the boundaries once, snapshotting the active set at each of them
+        by_start = sorted(range(len(self.layers)), key=lambda i: starts[i])
+        next_start = 0
+        active: List[int] = []
+        for boundary in self.boundaries:
+            while (
+                next_start < len(by_start) and starts[by_start[next_start]] <= boundary
+            ):
+                active.append(by_start[next_start])
+                next_start += 1
+            active = [i for i in active if ends[i] is None or ends[i] > boundary]
+            self._active.append([self.layers[i] for i in sorted(active)])
+
+    def __len__(self) -> int:
+        return len(self.layers)
+
+    def active_at(self, t: float) -> List[T]:
+        """Layers active at time ``t`` (``start <= t < end``), in compositing order."""
+        idx = bisect.bisect_right(self.boundaries, t) - 1
+        if idx < 0:
+            return []
+        return self._active[idx]
+
+    @property
+    def end(self) -> Optional[float]:
+        return self.boundaries[-1] if self.boundaries else None
@@ -0,0 +1,386 @@
+import os
+import json
+import time
+import atexit
+import queue
+import logging
+import tempfile
+import itertools
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from config import TRACE_COUNTER_INTERVAL, TRACE_DIR, TRACE_MAX_EVENTS
+
+
+def _now_us() -> int:
+    # CLOCK_MONOTONIC is system-wide, so worker processes' spans line up
+    return time.monotonic_ns() // 1000
+
+
+class Tracer:
+    """
+    Spans and counters for one process, exported as a Chrome trace.
+
+    A span is a named, timed section of work (one TTS request, one segment's
+    frames); a counter is a running total (cache hits, retries, bytes). Both are
+    kept in memory in the Chrome trace event format, so the export loads as is
+    in chrome://tracing or Perfetto, with one track per process and thread.
+    Counters are sampled into the trace at most every ``counter_interval``
+    seconds each, and once more with their final value on export or drain, so
+    busy counters can't crowd spans out of ``max_events``.
+
+    Render workers record into their own process's tracer; ``run_traced`` ships
+    what they recorded back with each result, to be ``merge``d by the parent.
+    """
+
+    def __init__(
+        self,
+        max_events: int = TRACE_MAX_EVENTS,
+        counter_interval: float = TRACE_COUNTER_INTERVAL,
+    ) -> None:
+        """
+        Initialize the Tracer.
+
+        Args:
+            max_events (int): Events kept; later ones are dropped, and counted.
+            counter_interval (float): Seconds between samples of one counter.
+        """
+        self.max_events = max_events
+        self.counter_interval_us = int(counter_interval * 1e6)
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._events: List[Dict[str, Any]] = []
+        # Totals since the last drain, and since the process started
+        self._counters: Dict[str, float] = {}
+        self._totals: Dict[str, float] = {}
+        self._threads: Dict[Tuple[int, int], str] = {}
+        self._async_ids = itertools.count()
+        # When each counter was last sampled, and those changed since
+        self._sampled: Dict[str, int] = {}
+        self._unsampled: set = set()
+
+    def _add(self, event: Dict[str, Any]) -> None:
+        """Record an event; the caller holds the lock."""
+        key = (event["pid"], event["tid"])
+        if key not in self._threads:
+            self._threads[key] = threading.current_thread().name
+        if len(self._events) < self.max_events:
+            self._events.append(event)
+        else:
+            self.dropped += 1
+
+    @contextmanager
+    def span(
+        self, name: str, cat: str = "stage", **args: Any
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Time the enclosed block as one span.
+
+        Args:
+            name (str): What is being done ("tts request", "render frames").
+            cat (str): Group of the span ("stage", "tts", "image", "render").
+            **args: Details shown with the span (line index, term, ...).
+
+        Yields:
+            Dict[str, Any]: The span's args, for details only known at the end.
+        """
+        start = _now_us()
+        try:
+            yield args
+        finally:
+            end = _now_us()
+            with self._lock:
+                self._add(
+                    {
+                        "name": name,
+                        "cat": cat,
+                        "ph": "X",
+                        "ts": start,
+                        "dur": end - start,
+                        "pid": os.getpid(),
+                        "tid": threading.get_native_id(),
+                        "args": args,
+                    }
+                )
+
+    @contextmanager
+    def async_span(
+        self, name: str, cat: str = "stage", **args: Any
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Like ``span``, for work that overlaps other spans on the same thread
+        (coroutines sharing an event loop). Each one gets its own async track,
+        as Chrome requires complete spans on a thread to nest.
+        """
+        start = _now_us()
+        try:
+            yield args
+        finally:
+            end = _now_us()
+            with self._lock:
+                # Both ends or neither, so no span is left open
+                room = len(self._events) + 2 <= self.max_events
+                span_id = f"{os.getpid():x}.{next(self._async_ids)}"
+                for phase, ts in (("b", start), ("e", end)):
+                    if not room:
+                        self.dropped += 1
+                        continue
+                    self._add(
+                        {
+                            "name": name,
+                            "cat": cat,
+                            "ph": phase,
+                            "id": span_id,
+                            "ts": ts,
+                            "pid": os.getpid(),
+                            "tid": threading.get_native_id(),
+                            "args": args if phase == "b" else {},
+                        }
+                    )
+
+    def count(self, name: str, value: float = 1) -> None:
+        """Add ``value`` to the counter ``name``."""
+        now = _now_us()
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+            self._totals[name] = self._totals.get(name, 0) + value
+            last = self._sampled.get(name)
+            if last is None or now - last >= self.counter_interval_us:
+                self._sample(name, now)
+            else:
+                self._unsampled.add(name)
+
+    def _sample(self, name: str, ts: int) -> None:
+        """Record a counter's current total; the caller holds the lock."""
+        self._sampled[name] = ts
+        self._unsampled.discard(name)
+        self._add(
+            {
+                "name": name,
+                "ph": "C",
+                "ts": ts,
+                "pid": os.getpid(),
+                "tid": threading.get_native_id(),
+                "args": {"value": self._totals[name]},
+            }
+        )
+
+    def _flush_counters(self) -> None:
+        """Sample every counter changed since its last sample; the caller holds the lock."""
+        now = _now_us()
+        for name in sorted(self._unsampled):
+            self._sample(name, now)
+
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
+
+    def drain(self) -> Dict[str, Any]:
+        """Take (and forget) everything recorded since the last drain."""
+        with self._lock:
+            self._flush_counters()
+            data = {
+                "events": self._events,
+                "counters": self._counters,
+                "threads": list(self._threads.items()),
+                "dropped": self.dropped,
+            }
+            self._events = []
+            self._counters = {}
+            self.dropped = 0
+        return data
+
+    def merge(self, data: Dict[str, Any]) -> None:
+        """Add what another tracer drained (e.g. a worker process's)."""
+        with self._lock:
+            room = max(0, self.max_events - len(self._events))
+            self._events += data["events"][:room]
+            self.dropped += data["dropped"] + max(0, len(data["events"]) - room)
+            for name, value in data["counters"].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+            for key, thread_name in data["threads"]:
+                self._threads.setdefault(tuple(key), thread_name)
+
+    def _snapshot(self) -> Dict[str, Any]:
+        """Everything recorded so far, in the form ``drain`` returns it."""
+        with self._lock:
+            self._flush_counters()
+            return {
+                "events": list(self._events),
+                "counters": dict(self._counters),
+                "threads": list(self._threads.items()),
+                "dropped": self.dropped,
+            }
+
+    def export(self, path: str, data: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Write everything recorded so far as Chrome trace JSON.
+
+        Args:
+            path (str): The trace file.
+            data (Optional[Dict[str, Any]]): What ``drain`` returned, to write
+                instead.
+
+        Returns:
+            str: ``path``.
+        """
+        data = data or self._snapshot()
+        events = data["events"]
+        threads = {tuple(key): thread_name for key, thread_name in data["threads"]}
+        dropped = data["dropped"]
+        main_pid = os.getpid()
+        metadata: List[Dict[str, Any]] = []
+        for pid in sorted({pid for pid, _ in threads}):
+            metadata.append(
+                {
+                    "name": "process_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "args": {"name": "main" if pid == main_pid else f"worker {pid}"},
+                }
+            )
+        for (pid, tid), thread_name in threads.items():
+            metadata.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"name": thread_name},
+                }
+            )
+
+        trace_dir = os.path.dirname(path) or "."
+        os.makedirs(trace_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=trace_dir, prefix=".tmp-", suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "traceEvents": metadata + events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"dropped_events": dropped},
+                },
+                f,
+                default=str,
+            )
+        os.replace(tmp_path, path)
+        return path
+
+    def summary(self, data: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Where the time went: total, mean and longest duration of each kind of
+        span (with frames per second for spans that render frames), then every
+        counter. Of everything recorded so far, or of what ``drain`` returned.
+        """
+        data = data or self._snapshot()
+        events = data["events"]
+        spans = [e for e in events if e["ph"] == "X"]
+        begins = {e["id"]: e for e in events if e["ph"] == "b"}
+        spans += [
+            dict(begins[e["id"]], dur=e["ts"] - begins[e["id"]]["ts"])
+            for e in events
+            if e["ph"] == "e" and e["id"] in begins
+        ]
+        counters = data["counters"]
+        dropped = data["dropped"]
+
+        stats: Dict[Tuple[str, str], Dict[str, float]] = {}
+        for event in spans:
+            entry = stats.setdefault(
+                (event["cat"], event["name"]),
+                {"count": 0, "total": 0.0, "max": 0.0, "frames": 0},
+            )
+            seconds = event["dur"] / 1e6
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["frames"] += event["args"].get("frames", 0)
+
+        rows = [
+            f"{'span':<28} {'count':>6} {'total s':>9} {'mean ms':>9} "
+            f"{'max ms':>9} {'fps':>7}"
+        ]
+        for (cat, name), entry in sorted(
+            stats.items(), key=lambda item: -item[1]["total"]
+        ):
+            fps = (
+                f"{entry['frames'] / entry['total']:7.1f}"
+                if entry["frames"] and entry["total"]
+                else ""
+            )
+            rows.append(
+                f"{cat + '/' + name:<28} {entry['count']:>6} {entry['total']:>9.2f} "
+                f"{entry['total'] / entry['count'] * 1000:>9.1f} "
+                f"{entry['max'] * 1000:>9.1f} {fps:>7}"
+            )
+        if counters:
+            rows.append("")
+            rows.append(f"{'counter':<44} {'value':>14}")
+            for name, value in sorted(counters.items()):
+                rows.append(f"{name:<44} {value:>14,.0f}")
+        if dropped:
+            rows.append(f"({dropped} events dropped over the limit)")
+        return "\n".join(rows)
+
+    def export_run(
+        self, name: str, trace_dir: str = TRACE_DIR, drain: bool = False
+    ) -> str:
+        """
+        Export to a timestamped file in ``trace_dir`` and log the summary.
+
+        Args:
+            name (str): What ran ("render", "job_3"); the file is named after it.
+            trace_dir (str): Where the trace file goes.
+            drain (bool): Export (and forget) only what was recorded since the
+                last drain, as a long-running process does after each job.
+
+        Returns:
+            str: The trace file.
+        """
+        data = self.drain() if drain else self._snapshot()
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = self.export(os.path.join(trace_dir, f"{name}_{stamp}.json"), data)
+        logging.getLogger("Tracer").info(
+            f"Trace written to {path} (open in chrome://tracing or "
+            f"ui.perfetto.dev).\n{self.summary(data)}"
+        )
+        return path
+
+
+# The process's tracer; every module records into it
+tracer = Tracer()
+
+
+def run_traced(fn: Callable[..., Any], *args: Any) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Call ``fn`` in a worker process and return its result along with what the
+    worker's tracer recorded, for the parent to ``merge``. Module-level so it
+    can be pickled by the process pool.
+    """
+    result = fn(*args)
+    return result, tracer.drain()
+
+
+_listeners: List[QueueListener] = []
+
+
+def _stop_listeners() -> None:
+    for listener in _listeners:
+        listener.stop()
+
+
+def queued_handler(*handlers: logging.Handler) -> QueueHandler:
+    """
+    A handler that only puts records on a queue; a background thread writes
+    them to ``handlers``, so logging never blocks the caller on disk or a
+    terminal. Records still queued at exit are written out.
+    """
+    log_queue: queue.Queue = queue.Queue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    if not _listeners:
+        atexit.register(_stop_listeners)
+    _listeners.append(listener)
+    return QueueHandler(log_queue)
@@ -1,9 +1,12 @@
 import os
 import re
+import json
+import random
 import shutil
 import logging
 from datetime import datetime
-from typing import List
+from typing import Any, Dict, List
+from config import RETRY_BACKOFF_BASE, RETRY_BACKOFF_CAP
 
 
 class Utils:
@@ -50,6 +53,69 @@ class Utils:
             )
             return []
 
+    @staticmethod
+    def backoff_delay(
+        attempt: int, base: float = RETRY_BACKOFF_BASE, cap: float = RETRY_BACKOFF_CAP
+    ) -> float:
+        """
+        Seconds to wait before retry number ``attempt + 1``: exponential backoff
+        with full jitter, so clients that failed together don't retry together.
+
+        Example:
+            Input: attempt=3, base=0.5
+            Output: a random delay between 0 and 4.0
+        """
+        return random.uniform(0, min(cap, base * (2**attempt)))
+
+    @staticmethod
+    def safe_title(title: str) -> str:
+        """
+        Turns a video title into a file name, the same way config derives
+        OUTPUT_VIDEO_PATH from VIDEO_TITLE.
+
+        Example:
+            Input: 'Chapter 7: CPU Scheduling'
+            Output: 'Chapter_7__CPU_Scheduling'
+        """
+        return (
+            title.replace(" ", "_")
+            .replace(":", "_")
+            .replace("/", "_")
+            .replace("\\", "_")
+        )
+
+    @staticmethod
+    def word_timings_path(audio_path: str) -> str:
+        """
+        Returns the path of the word-timing sidecar written next to a TTS audio file.
+
+        Example:
+            Input: 'audio_assests/peter_audio_1.mp3'
+            Output: 'audio_assests/peter_audio_1.words.json'
+        """
+        return f"{os.path.splitext(audio_path)[0]}.words.json"
+
+    @staticmethod
+    def load_word_timings(audio_path: str) -> List[Dict[str, Any]]:
+        """
+        Loads the word timings (text, start, end in seconds) for a TTS audio file.
+
+        Args:
+            audio_path (str): Path of the audio file.
+
+        Returns:
+            List[Dict[str, Any]]: The timings, or an empty list if none were recorded.
+        """
+        path = Utils.word_timings_path(audio_path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logging.error(f"[Utils] Error reading word timings '{path}': {e}")
+            return []
+
     @staticmethod
     def archive_audio_assets(
         source_dir: str = "audio_assests", archive_root: str = "archives_audios"
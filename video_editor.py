@@ -1,21 +1,476 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import os
-import textwrap
+import math
+import time
+import bisect
+import shutil
+import functools
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from moviepy import (
+    concatenate_videoclips,
     VideoFileClip,
-    AudioFileClip,
-    CompositeAudioClip,
     CompositeVideoClip,
     ImageClip,
     TextClip,
+    VideoClip,
 )
+from moviepy.config import FFMPEG_BINARY
+from moviepy.tools import compute_position
+import numpy as np
 import PIL.Image
-import random
+import PIL.ImageDraw
+import PIL.ImageFont
+from config import (
+    CONTEXT_IMAGE_HEIGHT,
+    SUBTITLE_MODE,
+    COMPOSITOR,
+    OUTPUT_FPS,
+    OUTPUT_SIZE,
+    BACKGROUND_PROXY,
+    RENDER_WORKERS,
+    RENDER_BACKEND,
+    PIPELINE_RING_FRAMES,
+    CAPTION_MAX_WORKERS,
+    BACKGROUND_CLIPS_OPEN,
+    BACKGROUND_VOLUME,
+    BACKGROUND_DUCK_GAIN,
+    BACKGROUND_DUCK_FADE,
+)
+from background_proxy import BackgroundProxyCache, profile_filter
+from lazy_assets import AssetCache, LazyImageClip
+from footage_library import FootageLibrary, FootageSegment
+from audio_mixer import AudioMixer
+from caption_renderer import CaptionRenderer, save_rgba_png
+from filter_graph import FilterGraph
+from frame_pipeline import write_pipelined
+from timeline import TITLE_DURATION, Timeline, layout_dialogue
+from tracing import run_traced, tracer
+from utils import Utils
 
 if not hasattr(PIL.Image, "ANTIALIAS"):
     PIL.Image.ANTIALIAS = PIL.Image.LANCZOS
 
 
+def _cover(clip: VideoClip, size: Tuple[int, int]) -> VideoClip:
+    """Scale a clip to fill ``size`` and centre-crop the overflow."""
+    w, h = size
+    scaled = clip.resized(max(w / clip.w, h / clip.h))
+    return scaled.cropped(
+        x_center=scaled.w / 2, y_center=scaled.h / 2, width=w, height=h
+    )
+
+
+@functools.lru_cache(maxsize=BACKGROUND_CLIPS_OPEN)
+def _open_background(path: str) -> VideoFileClip:
+    """
+    Open a background clip once per process. Editors only take subclips of
+    it, so a render worker's editor for each line doesn't probe and open the
+    clip again.
+    """
+    return VideoFileClip(path)
+
+
+class TimelineCompositeVideoClip(CompositeVideoClip):
+    """
+    CompositeVideoClip whose per-frame clip lookup goes through a Timeline index,
+    so each frame only touches the layers active at ``t`` rather than scanning
+    every clip in the video. Its mask is indexed the same way.
+    """
+
+    def __init__(self, clips: List[Any], *args: Any, **kwargs: Any) -> None:
+        super().__init__(clips, *args, **kwargs)
+        self.timeline: Timeline = Timeline(self.clips)
+
+        if isinstance(self.mask, CompositeVideoClip):
+            self.mask = TimelineCompositeVideoClip(
+                self.mask.clips, self.size, is_mask=True, bg_color=0.0
+            )
+
+    def playing_clips(self, t: float = 0) -> List[Any]:
+        if isinstance(t, np.ndarray):
+            return super().playing_clips(t)
+        return self.timeline.active_at(t)
+
+
+def _layer_rgba(
+    clip: VideoClip, t: float, size: Tuple[int, int]
+) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
+    """A clip's frame at absolute time ``t`` as float RGB, float alpha and its position."""
+    ct = t - clip.start
+    rgb = clip.get_frame(ct)[..., :3].astype(np.float32)
+    if clip.mask is not None:
+        alpha = clip.mask.get_frame(ct).astype(np.float32)
+    else:
+        alpha = np.ones(rgb.shape[:2], dtype=np.float32)
+    pos = compute_position(
+        (rgb.shape[1], rgb.shape[0]), size, clip.pos(ct), clip.relative_pos
+    )
+    return rgb, alpha[..., None], (int(pos[0]), int(pos[1]))
+
+
+def _clip_region(
+    pos: Tuple[int, int], layer_size: Tuple[int, int], canvas_size: Tuple[int, int]
+) -> Optional[Tuple[slice, slice, slice, slice]]:
+    """Overlapping (canvas_y, canvas_x, layer_y, layer_x) slices, or None if off-canvas."""
+    x, y = pos
+    w, h = layer_size
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(canvas_size[0], x + w), min(canvas_size[1], y + h)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (
+        slice(y0, y1),
+        slice(x0, x1),
+        slice(y0 - y, y1 - y),
+        slice(x0 - x, x1 - x),
+    )
+
+
+class SegmentOverlay:
+    """
+    All overlays of one dialogue segment (avatar, context image, caption).
+
+    The static layers are flattened once, on first use, into a single premultiplied
+    RGBA buffer cropped to their bounding box, so putting them on a background
+    frame is one vectorized blend: ``out = bg * (1 - alpha) + premultiplied``.
+    Layers that change over time (karaoke captions) are blended on top per frame.
+    """
+
+    def __init__(
+        self, start: float, end: float, clips: List[VideoClip], size: Tuple[int, int]
+    ) -> None:
+        self.start = start
+        self.end = end
+        self.size = size
+        static = (ImageClip, LazyImageClip)
+        self.static_clips = [c for c in clips if isinstance(c, static)]
+        self.dynamic_clips = [c for c in clips if not isinstance(c, static)]
+        self._bbox: Optional[Tuple[slice, slice]] = None
+        self._premultiplied: Optional[np.ndarray] = None
+        self._inverse_alpha: Optional[np.ndarray] = None
+
+    @property
+    def is_flattened(self) -> bool:
+        return self._premultiplied is not None
+
+    def flatten(self) -> None:
+        if self.is_flattened:
+            return
+        with tracer.span("layer prep", cat="render", layers=len(self.static_clips)):
+            self._flatten()
+
+    def _flatten(self) -> None:
+        w, h = self.size
+        canvas = np.zeros((h, w, 4), dtype=np.float32)
+        for clip in self.static_clips:
+            rgb, alpha, pos = _layer_rgba(clip, self.start, self.size)
+            region = _clip_region(pos, (rgb.shape[1], rgb.shape[0]), self.size)
+            if region is None:
+                continue
+            cy, cx, ly, lx = region
+            a = alpha[ly, lx]
+            dst = canvas[cy, cx]
+            dst[..., :3] = rgb[ly, lx] * a + dst[..., :3] * (1.0 - a)
+            dst[..., 3:] = a + dst[..., 3:] * (1.0 - a)
+
+        rows = np.flatnonzero(canvas[..., 3].any(axis=1))
+        cols = np.flatnonzero(canvas[..., 3].any(axis=0))
+        if rows.size == 0:
+            self._bbox = (slice(0, 0), slice(0, 0))
+        else:
+            self._bbox = (
+                slice(rows[0], rows[-1] + 1),
+                slice(cols[0], cols[-1] + 1),
+            )
+        cropped = canvas[self._bbox]
+        self._premultiplied = np.ascontiguousarray(cropped[..., :3])
+        self._inverse_alpha = np.ascontiguousarray(1.0 - cropped[..., 3:])
+
+    def release(self) -> None:
+        self._bbox = None
+        self._premultiplied = None
+        self._inverse_alpha = None
+
+    def blend_onto(self, frame: np.ndarray, t: float) -> None:
+        """Composite this segment's overlays onto an RGB uint8 frame in place."""
+        self.flatten()
+        if self._premultiplied.size:
+            region = frame[self._bbox]
+            blended = region * self._inverse_alpha + self._premultiplied
+            frame[self._bbox] = np.rint(blended)
+
+        for clip in self.dynamic_clips:
+            rgb, alpha, pos = _layer_rgba(clip, t, self.size)
+            region = _clip_region(pos, (rgb.shape[1], rgb.shape[0]), self.size)
+            if region is None:
+                continue
+            cy, cx, ly, lx = region
+            a = alpha[ly, lx]
+            frame[cy, cx] = np.rint(frame[cy, cx] * (1.0 - a) + rgb[ly, lx] * a)
+
+
+class SegmentCompositeVideoClip(VideoClip):
+    """
+    Background video with one pre-flattened overlay per segment blended on top.
+    Only the active segment keeps its flattened buffer in memory.
+    """
+
+    def __init__(
+        self,
+        background: VideoClip,
+        segments: List[SegmentOverlay],
+        duration: Optional[float] = None,
+    ) -> None:
+        super().__init__(duration=duration or background.duration)
+        self.background = background
+        self.size = background.size
+        self.fps = getattr(background, "fps", None)
+        self.timeline: Timeline = Timeline(segments)
+        self._flattened: List[SegmentOverlay] = []
+
+    def frame_function(self, t: float) -> np.ndarray:
+        frame = np.array(self.background.get_frame(t)[..., :3], dtype=np.uint8)
+        self.blend_onto(frame, t)
+        return frame
+
+    def blend_onto(self, frame: np.ndarray, t: float) -> None:
+        """Composite the overlays at ``t`` onto a background frame in place."""
+        active = self.timeline.active_at(t)
+
+        for segment in self._flattened:
+            if segment not in active:
+                segment.release()
+        self._flattened = list(active)
+
+        for segment in active:
+            segment.blend_onto(frame, t)
+
+
+class WordAtlas:
+    """
+    Caches one rasterized RGBA sprite per (word, color) for a fixed font and stroke.
+    Every sprite shares the same height and baseline, so words can be laid out
+    side by side without re-rendering text.
+    """
+
+    def __init__(
+        self,
+        font: Optional[str],
+        font_size: int,
+        stroke_color: str,
+        stroke_width: float,
+    ) -> None:
+        self.font = (
+            PIL.ImageFont.truetype(font, font_size)
+            if font
+            else PIL.ImageFont.load_default(size=font_size)
+        )
+        self.stroke_color = stroke_color
+        self.stroke = int(round(stroke_width))
+        self.ascent, descent = self.font.getmetrics()
+        self.line_height = self.ascent + descent + 2 * self.stroke
+        self.space_width = int(round(self.font.getlength(" ")))
+        self._sprites: Dict[Tuple[str, str], np.ndarray] = {}
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def shared(
+        font: Optional[str], font_size: int, stroke_color: str, stroke_width: float
+    ) -> "WordAtlas":
+        """The process's atlas for a style, so its font and sprites are loaded once."""
+        return WordAtlas(font, font_size, stroke_color, stroke_width)
+
+    def word_width(self, word: str) -> int:
+        return int(math.ceil(self.font.getlength(word))) + 2 * self.stroke
+
+    def sprite(self, word: str, color: str) -> np.ndarray:
+        key = (word, color)
+        if key not in self._sprites:
+            img = PIL.Image.new(
+                "RGBA", (max(1, self.word_width(word)), self.line_height), (0, 0, 0, 0)
+            )
+            PIL.ImageDraw.Draw(img).text(
+                (self.stroke, self.stroke + self.ascent),
+                word,
+                font=self.font,
+                fill=color,
+                anchor="ls",
+                stroke_width=self.stroke,
+                stroke_fill=self.stroke_color,
+            )
+            self._sprites[key] = np.asarray(img)
+        return self._sprites[key]
+
+
+class WordCaptionRenderer:
+    """
+    Builds word-by-word (karaoke) caption clips from TTS word timings.
+
+    Each line is laid out once from atlas sprites; a frame is the pre-composed
+    line with the word being spoken pasted over in the highlight color. Each
+    highlight state is composed once and kept in an AssetCache while in use.
+    """
+
+    def __init__(
+        self,
+        box_size: Tuple[int, int],
+        atlas: WordAtlas,
+        color: str = "white",
+        highlight_color: str = "yellow",
+        cache: Optional[AssetCache] = None,
+    ) -> None:
+        self.box_size = box_size
+        self.atlas = atlas
+        self.color = color
+        self.highlight_color = highlight_color
+        self.cache = cache or AssetCache()
+
+    def _layout(self, words: List[str]) -> List[Tuple[int, int]]:
+        """Wrap words to the box width; returns each word's top-left corner."""
+        box_w, box_h = self.box_size
+        lines: List[List[int]] = [[]]
+        line_width = 0
+        for idx, word in enumerate(words):
+            width = self.atlas.word_width(word)
+            needed = (
+                width if not lines[-1] else line_width + self.atlas.space_width + width
+            )
+            if lines[-1] and needed > box_w:
+                lines.append([idx])
+                line_width = width
+            else:
+                lines[-1].append(idx)
+                line_width = needed
+
+        positions: List[Tuple[int, int]] = [(0, 0)] * len(words)
+        top = (box_h - len(lines) * self.atlas.line_height) // 2
+        for row, line in enumerate(lines):
+            widths = [self.atlas.word_width(words[i]) for i in line]
+            total = sum(widths) + self.atlas.space_width * max(0, len(line) - 1)
+            x = (box_w - total) // 2
+            y = top + row * self.atlas.line_height
+            for idx, width in zip(line, widths):
+                positions[idx] = (x, y)
+                x += width + self.atlas.space_width
+        return positions
+
+    @staticmethod
+    def _paste(canvas: np.ndarray, sprite: np.ndarray, pos: Tuple[int, int]) -> None:
+        """Alpha-composite an RGBA sprite onto an RGBA canvas in place, clipped to bounds."""
+        x, y = pos
+        h, w = sprite.shape[:2]
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(canvas.shape[1], x + w), min(canvas.shape[0], y + h)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        src = sprite[y0 - y : y1 - y, x0 - x : x1 - x].astype(np.float32) / 255.0
+        dst = canvas[y0:y1, x0:x1].astype(np.float32) / 255.0
+        src_a = src[..., 3:4]
+        out_a = src_a + dst[..., 3:4] * (1.0 - src_a)
+        out_rgb = src[..., :3] * src_a + dst[..., :3] * dst[..., 3:4] * (1.0 - src_a)
+        out_rgb = np.divide(out_rgb, out_a, out=np.zeros_like(out_rgb), where=out_a > 0)
+        canvas[y0:y1, x0:x1] = np.round(
+            np.concatenate([out_rgb, out_a], axis=-1) * 255.0
+        ).astype(np.uint8)
+
+    def _prepare(
+        self, words: List[Dict[str, Any]]
+    ) -> Tuple[List[str], List[float], List[Tuple[int, int]], np.ndarray]:
+        """Lay the words out once and paste them, unhighlighted, onto a base RGBA canvas."""
+        with tracer.span("caption raster", cat="render", words=len(words)):
+            texts = [w["text"] for w in words]
+            starts = [w["start"] for w in words]
+            positions = self._layout(texts)
+
+            base = np.zeros((self.box_size[1], self.box_size[0], 4), dtype=np.uint8)
+            for text, pos in zip(texts, positions):
+                self._paste(base, self.atlas.sprite(text, self.color), pos)
+        return texts, starts, positions, base
+
+    def _highlight(
+        self,
+        base: np.ndarray,
+        texts: List[str],
+        positions: List[Tuple[int, int]],
+        idx: int,
+    ) -> np.ndarray:
+        """The caption with word ``idx`` highlighted (``base`` itself if idx < 0)."""
+        if idx < 0:
+            return base
+        frame = base.copy()
+        self._paste(
+            frame, self.atlas.sprite(texts[idx], self.highlight_color), positions[idx]
+        )
+        return frame
+
+    def states(self, words: List[Dict[str, Any]]) -> List[Tuple[float, np.ndarray]]:
+        """
+        Every distinct look of the caption, for renderers that sequence images
+        instead of calling a frame function.
+
+        Returns:
+            List[Tuple[float, np.ndarray]]: (offset into the line in seconds,
+                RGBA frame) per state, in time order, starting at 0.
+        """
+        texts, starts, positions, base = self._prepare(words)
+        states = [(0.0, base)]
+        for idx, start in enumerate(starts):
+            frame = self._highlight(base, texts, positions, idx)
+            if start <= states[-1][0]:
+                states[-1] = (states[-1][0], frame)
+            else:
+                states.append((start, frame))
+        return states
+
+    def make_clip(
+        self, words: List[Dict[str, Any]], start_time: float, duration: float
+    ) -> VideoClip:
+        """
+        Args:
+            words (List[Dict[str, Any]]): Timings as recorded by VoiceGenerator
+                (text, start, end; seconds relative to the line's audio).
+            start_time (float): When the line starts in the video.
+            duration (float): How long the caption stays on screen.
+
+        Returns:
+            VideoClip: The caption clip (with alpha mask), not yet positioned.
+        """
+        starts = [w["start"] for w in words]
+        key = ("karaoke", start_time, tuple(starts))
+
+        # Layout and highlight states live in the shared asset cache, so a line's
+        # caption only takes memory while it is on screen
+        def state(idx: int) -> Tuple[np.ndarray, np.ndarray]:
+            def load() -> Tuple[np.ndarray, np.ndarray]:
+                texts, _, positions, base = self.cache.get(
+                    key, lambda: self._prepare(words)
+                )
+                frame = self._highlight(base, texts, positions, idx)
+                return (
+                    np.ascontiguousarray(frame[..., :3]),
+                    frame[..., 3].astype(np.float32) / 255.0,
+                )
+
+            return self.cache.get(key + (idx,), load)
+
+        def active(t: float) -> int:
+            return bisect.bisect_right(starts, t) - 1
+
+        # Frame functions are assigned after construction, which would otherwise
+        # render frame 0 right away
+        clip = VideoClip(duration=duration)
+        clip.frame_function = lambda t: state(active(t))[0]
+        clip.size = self.box_size
+        mask = VideoClip(is_mask=True, duration=duration)
+        mask.frame_function = lambda t: state(active(t))[1]
+        mask.size = self.box_size
+        return clip.with_mask(mask).with_start(start_time)
+
+
 class DynamicVideoEditor:
     """
     Edits the video by combining background video, audio, character avatars, and subtitles.
@@ -26,24 +481,87 @@ class DynamicVideoEditor:
         video_path: str,
         output_path: str,
         dialogue_data: List[Dict[str, Any]],
-        video_title: str = "PDF to Brainrot",
+        video_title: Optional[str] = "PDF to Brainrot",
         title_sound_path: str = "audio_assests/title_sound.mp3",
+        subtitle_mode: str = SUBTITLE_MODE,
+        compositor: str = COMPOSITOR,
+        background_segments: Optional[List[FootageSegment]] = None,
+        render_workers: Optional[int] = RENDER_WORKERS,
+        fps: int = OUTPUT_FPS,
+        backend: str = RENDER_BACKEND,
+        output_size: Optional[Tuple[int, int]] = OUTPUT_SIZE,
+        use_proxy: bool = BACKGROUND_PROXY,
     ) -> None:
         self.video_path = video_path
         self.output_path = output_path
         self.dialogue_data = dialogue_data
         self.video_title = video_title
         self.title_sound_path = title_sound_path
-        self.audio_clips: List[AudioFileClip] = []
-        self.image_clips: List[ImageClip] = []
+        self.subtitle_mode = subtitle_mode
+        self.compositor = compositor
+        self.segments: List[SegmentOverlay] = []
+        self.image_clips: List[VideoClip] = []
         self.subtitle_clips: List[TextClip] = []
         self.current_start: float = 0.0
+        self.timeline: Optional[Timeline] = None
+        self.line_layout: Optional[List[Dict[str, Any]]] = None
+        self.render_workers = render_workers or os.cpu_count() or 1
+        self.fps = fps
+        self.backend = backend
+
+        self.output_size = output_size
+        self.use_proxy = use_proxy
+        proxies = BackgroundProxyCache() if use_proxy else None
 
-        full_video = VideoFileClip(video_path)
-        clipped_video = full_video.subclipped(
-            random.randint(10, 300), full_video.duration
+        # Picked once and kept, so parallel render workers cut the same footage
+        if background_segments is None:
+            self.layout()  # The footage has to cover the whole timeline
+            library = FootageLibrary(video_path)
+            background_segments = library.pick(
+                self.current_start,
+                keyframe_interval=proxies.keyframe_interval if proxies else None,
+            )
+            if self.output_size is None:
+                self.output_size = library.fitted_size(background_segments)
+        self.background_segments = background_segments
+
+        # Decode proxies already at the output profile instead of the sources
+        clips = []
+        self.background_cuts: List[Tuple[str, float, float]] = []
+        for segment in self.background_segments:
+            path = (
+                proxies.get(segment.path, self.output_size, fps)
+                if proxies
+                else segment.path
+            )
+            clip = _open_background(path)
+            if self.output_size is not None and not proxies:
+                clip = _cover(clip, self.output_size)
+            clips.append(clip.subclipped(segment.start, segment.end))
+            self.background_cuts.append((path, segment.start, segment.end))
+        self.background_has_audio = all(clip.audio is not None for clip in clips)
+        self.video = clips[0] if len(clips) == 1 else concatenate_videoclips(clips)
+        # Decoded images, captions and voice samples, bounded by ASSET_MEMORY_BUDGET
+        self.assets = AssetCache()
+        # Render workers (render_workers=1) rasterize in process, without a pool
+        self.caption_renderer = CaptionRenderer(
+            box_size=(self.video.w - 200, 500),
+            max_workers=1 if self.render_workers == 1 else CAPTION_MAX_WORKERS,
         )
-        self.video = clipped_video
+        self.word_caption_renderer: Optional[WordCaptionRenderer] = None
+        if self.subtitle_mode == "word":
+            style = self.caption_renderer.style
+            self.word_caption_renderer = WordCaptionRenderer(
+                box_size=self.caption_renderer.box_size,
+                atlas=WordAtlas.shared(
+                    style["font"],
+                    style["font_size"],
+                    style["stroke_color"],
+                    style["stroke_width"],
+                ),
+                color=style["color"],
+                cache=self.assets,
+            )
 
     def create_title_clip(self, text: str, duration: float) -> TextClip:
         return TextClip(
@@ -55,93 +573,161 @@ class DynamicVideoEditor:
         ).with_duration(duration)
 
     def add_full_sentence_subtitle(
-        self, text: str, start_time: float, duration: float
+        self,
+        text: str,
+        start_time: float,
+        duration: float,
+        raster_path: Optional[str] = None,
     ) -> TextClip:
-        """Create a subtitle clip showing the full sentence at once."""
+        """
+        Create a subtitle clip showing the full sentence at once.
+        Uses the pre-rendered caption raster when one is given.
+        """
         if not text:
             return None
 
-        # Remove all non-alphanumeric and non-punctuation characters from text, and also remove asterisks
-        import string
-
-        text = "".join(
-            c
-            for c in text
-            if (c.isalnum() or c in string.punctuation or c.isspace()) and c != "*"
-        )
-
-        # Wrap text at word boundaries to prevent mid-word breaks
-        # Approximate character width based on font size (rough estimate)
-        chars_per_line = int(
-            (self.video.w - 200) / 30
-        )  # ~30 pixels per char at font_size=50
-        wrapped_text = textwrap.fill(text, width=chars_per_line, break_long_words=False)
-
-        clip = (
-            TextClip(
-                text=wrapped_text,
-                font_size=50,
-                color="white",
-                stroke_color="black",
-                stroke_width=4.0,
-                vertical_align="center",
-                text_align="center",
-                horizontal_align="center",
-                method="caption",
-                size=(self.video.w - 200, 500),
+        if raster_path and os.path.exists(raster_path):
+            clip = LazyImageClip(raster_path, self.assets)
+        else:
+            clip = TextClip(
+                text=self.caption_renderer.prepare_text(text),
+                **self.caption_renderer.style,
             )
-            .with_start(start_time)
+
+        return (
+            clip.with_start(start_time)
             .with_duration(duration)
             .with_position(("center", self.video.h // 2))
         )
-        return clip
 
-    def edit(self) -> None:
-        # Add title clip at the beginning
-        title_duration = 1.0
-        title_clip = (
-            self.create_title_clip(self.video_title, title_duration)
-            .with_start(0)
-            .with_position("center")
-        )
-        self.subtitle_clips.append(title_clip)
+    def add_word_by_word_subtitle(
+        self, words: List[Dict[str, Any]], start_time: float, duration: float
+    ) -> VideoClip:
+        """Create a karaoke-style subtitle clip highlighting each word as it is spoken."""
+        return self.word_caption_renderer.make_clip(
+            words, start_time, duration
+        ).with_position(("center", self.video.h // 2))
 
-        # Add title sound effect
-        if os.path.exists(self.title_sound_path):
-            title_audio = AudioFileClip(self.title_sound_path).with_start(0)
-            self.audio_clips.append(title_audio)
-        else:
+    def layout(self) -> List[Dict[str, Any]]:
+        """
+        Compute when each dialogue line starts and how long it lasts.
+        Lines whose audio file is missing are skipped.
+
+        Returns:
+            List[Dict[str, Any]]: One entry per line (item, audio_path, start,
+                duration), in order. ``self.current_start`` ends up at the total
+                video duration.
+        """
+        if self.line_layout is None:
+            self.line_layout, self.current_start = layout_dialogue(self.dialogue_data)
+        return self.line_layout
+
+    def mix_audio(self, audio_path: str) -> bool:
+        """
+        Pre-mix the whole soundtrack (title sound, every line, ducked background
+        audio) into a single PCM WAV at ``audio_path``.
+
+        Returns:
+            bool: False if there is no audio at all.
+        """
+        layout = self.layout()
+        has_title_sound = os.path.exists(self.title_sound_path)
+        if not has_title_sound:
             print(f"Title sound not found: {self.title_sound_path}")
+        if not layout and not has_title_sound:
+            return False
+
+        mixer = AudioMixer(self.current_start)
+        if has_title_sound:
+            mixer.add(self.title_sound_path, 0)
+        for entry in layout:
+            mixer.add(entry["audio_path"], entry["start"])
 
-        self.current_start = title_duration + 0.5
+        # Include background video audio if it exists
+        if self.background_has_audio:
+            mixer.add_background(
+                self.background_cuts,
+                [(e["start"], e["start"] + e["duration"]) for e in layout],
+                volume=BACKGROUND_VOLUME,
+                duck_gain=BACKGROUND_DUCK_GAIN,
+                fade=BACKGROUND_DUCK_FADE,
+            )
+        mixer.write_wav(audio_path)
+        return True
 
-        for item in self.dialogue_data:
-            # Construct audio path
-            # The ID is added in main.py
-            audio_filename = f"{item['character'].lower()}_audio_{item['id']}.mp3"
-            audio_path = os.path.join("audio_assests", audio_filename)
+    def compose_video(self, window: Optional[Tuple[float, float]] = None) -> VideoClip:
+        """
+        Build the composited (silent) video.
 
-            if not os.path.exists(audio_path):
-                print(f"Audio file not found: {audio_path}, skipping.")
-                continue
+        Args:
+            window (Optional[Tuple[float, float]]): Only build overlays for lines
+                visible in ``[start, end)``; the whole video if None.
+
+        Returns:
+            VideoClip: The video, spanning the full timeline duration.
+        """
+        layout = self.layout()
+        t0, t1 = window or (0.0, float("inf"))
+
+        def visible(start: float, end: float) -> bool:
+            return start < t1 and end > t0
+
+        # Add title clip at the beginning
+        if self.video_title and visible(0, TITLE_DURATION):
+            title_clip = (
+                self.create_title_clip(self.video_title, TITLE_DURATION)
+                .with_start(0)
+                .with_position("center")
+            )
+            self.subtitle_clips.append(title_clip)
+            self.segments.append(
+                SegmentOverlay(0, TITLE_DURATION, [title_clip], self.video.size)
+            )
+
+        entries = [
+            entry
+            for entry in layout
+            if visible(entry["start"], entry["start"] + entry["duration"])
+        ]
+
+        # Word timings recorded during TTS drive the karaoke captions
+        word_timings = [
+            (
+                Utils.load_word_timings(entry["audio_path"])
+                if self.word_caption_renderer
+                else []
+            )
+            for entry in entries
+        ]
+
+        # Rasterize every full-sentence caption up front (in parallel, cached
+        # across renders); lines with word timings don't need one
+        caption_paths = self.caption_renderer.render_many(
+            [
+                "" if words else entry["item"]["sentence"]
+                for entry, words in zip(entries, word_timings)
+            ]
+        )
+
+        for entry, words, caption_path in zip(entries, word_timings, caption_paths):
+            item = entry["item"]
+            start, duration = entry["start"], entry["duration"]
 
             # Construct Avatar Image Path
             image_path = f"image_assests/{item['image']}"
 
             subtitle_text = item["sentence"]
 
-            # Load and position audio
-            audio = AudioFileClip(audio_path).with_start(self.current_start)
-            self.audio_clips.append(audio)
+            # Overlays for this line, bottom to top
+            segment_clips: List[VideoClip] = []
 
             # Position character image
             char_position = "left" if "peter" in image_path.lower() else "right"
             if os.path.exists(image_path):
                 char_image = (
-                    ImageClip(image_path)
-                    .with_start(self.current_start)
-                    .with_duration(audio.duration)
-                    .resized(height=500)
+                    LazyImageClip(image_path, self.assets, height=500)
+                    .with_start(start)
+                    .with_duration(duration)
                 )
 
                 y_position = max(0, self.video.h - 500 - 50)
@@ -153,13 +739,17 @@ class DynamicVideoEditor:
 
                 char_image = char_image.with_position((x_position, y_position))
                 self.image_clips.append(char_image)
+                segment_clips.append(char_image)
             else:
                 print(f"Avatar image not found: {image_path}")
 
             # Subtitle
-            subtitle_clip = self.add_full_sentence_subtitle(
-                subtitle_text, self.current_start, audio.duration
-            )
+            if words:
+                subtitle_clip = self.add_word_by_word_subtitle(words, start, duration)
+            else:
+                subtitle_clip = self.add_full_sentence_subtitle(
+                    subtitle_text, start, duration, caption_path
+                )
             if subtitle_clip:
                 self.subtitle_clips.append(subtitle_clip)
 
@@ -168,39 +758,363 @@ class DynamicVideoEditor:
             context_image_path = item.get("context_image_path")
             if context_image_path and os.path.exists(context_image_path):
                 try:
+                    # ImageDownloader pre-scales at ingest; only stragglers resample
                     searched_image = (
-                        ImageClip(context_image_path)
-                        .with_start(self.current_start)
-                        .with_duration(audio.duration)
-                        .resized(height=600)
-                        .with_position(("center", 300))
+                        LazyImageClip(
+                            context_image_path,
+                            self.assets,
+                            height=CONTEXT_IMAGE_HEIGHT,
+                        )
+                        .with_start(start)
+                        .with_duration(duration)
                     )
+                    searched_image = searched_image.with_position(("center", 300))
                     self.image_clips.append(searched_image)
+                    segment_clips.append(searched_image)
                 except Exception as e:
                     print(f"Failed to process context image {context_image_path}: {e}")
 
-            self.current_start += audio.duration + 0.5
+            # Captions go on top of the images
+            if subtitle_clip:
+                segment_clips.append(subtitle_clip)
+            self.segments.append(
+                SegmentOverlay(start, start + duration, segment_clips, self.video.size)
+            )
 
-        # Combine all clips
-        if not self.audio_clips:
-            print("No audio clips generated. Aborting video creation.")
-            return
+        if self.compositor == "layered":
+            # Reference path: every layer composited by MoviePy on every frame
+            visual_clips = [self.video] + self.image_clips + self.subtitle_clips
+            final_video = TimelineCompositeVideoClip(visual_clips)
+        else:
+            final_video = SegmentCompositeVideoClip(self.video, self.segments)
+        self.timeline = final_video.timeline
 
-        # Include background video audio if it exists
-        all_audio_clips = self.audio_clips.copy()
-        if self.video.audio is not None:
-            all_audio_clips.append(self.video.audio)
+        # Trim video to audio duration
+        return final_video.with_duration(self.current_start)
 
-        final_audio = CompositeAudioClip(all_audio_clips)
+    def plan_parts(self, parts: int) -> List[Tuple[int, int]]:
+        """
+        Split the timeline at dialogue boundaries into about ``parts`` ranges of
+        similar duration, snapped to the frame grid.
 
-        # Filter out None clips if any
-        visual_clips = [self.video] + self.image_clips + self.subtitle_clips
+        Returns:
+            List[Tuple[int, int]]: (first_frame, end_frame) per part, covering
+                every frame of the video.
+        """
+        layout = self.layout()
+        total_frames = int(self.current_start * self.fps)
+        target = self.current_start / max(1, parts)
 
-        final_video = CompositeVideoClip(visual_clips).with_audio(final_audio)
+        cuts = [0]
+        for entry in layout[1:]:
+            if entry["start"] - cuts[-1] / self.fps >= target:
+                frame = round(entry["start"] * self.fps)
+                if cuts[-1] < frame < total_frames:
+                    cuts.append(frame)
+        cuts.append(total_frames)
+        return list(zip(cuts[:-1], cuts[1:]))
 
-        # Trim video to audio duration
-        final_video = final_video.with_duration(self.current_start)
+    def worker_kwargs(self) -> Dict[str, Any]:
+        """Constructor arguments that recreate this editor in a worker process."""
+        return {
+            "video_path": self.video_path,
+            "output_path": self.output_path,
+            "dialogue_data": self.dialogue_data,
+            "video_title": self.video_title,
+            "title_sound_path": self.title_sound_path,
+            "subtitle_mode": self.subtitle_mode,
+            "compositor": self.compositor,
+            "background_segments": self.background_segments,
+            "render_workers": 1,
+            "fps": self.fps,
+            "output_size": self.output_size,
+            "use_proxy": self.use_proxy,
+        }
 
-        final_video.write_videofile(
-            self.output_path, codec="libx264", audio_codec="aac", fps=24
+    def prerender_captions(
+        self, entries: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        """
+        Rasterize (and cache) the sentence captions of ``entries``, every line
+        if None, so render workers only read them from the cache instead of
+        each starting a caption pool.
+        """
+        self.caption_renderer.render_many(
+            [
+                (
+                    ""
+                    if self.word_caption_renderer
+                    and Utils.load_word_timings(entry["audio_path"])
+                    else entry["item"]["sentence"]
+                )
+                for entry in (self.layout() if entries is None else entries)
+            ]
+        )
+
+    def _render_parallel(self, audio_path: str, work_dir: str) -> None:
+        """
+        Render dialogue-aligned parts in a process pool, then stream-copy
+        concatenate them and mux in the soundtrack.
+        """
+        parts = self.plan_parts(self.render_workers * 2)
+        part_paths = [
+            os.path.join(work_dir, f"part_{idx:04d}.mp4") for idx in range(len(parts))
+        ]
+        self.prerender_captions()
+        print(f"Rendering {len(parts)} parts on {self.render_workers} workers...")
+        with ProcessPoolExecutor(
+            max_workers=self.render_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as pool:
+            futures = [
+                pool.submit(
+                    run_traced,
+                    _render_part,
+                    self.worker_kwargs(),
+                    self.line_layout,
+                    self.current_start,
+                    frames,
+                    part_path,
+                )
+                for frames, part_path in zip(parts, part_paths)
+            ]
+            for future in futures:
+                tracer.merge(future.result()[1])
+
+        self.concat_parts(part_paths, audio_path, work_dir)
+
+    def concat_parts(
+        self, part_paths: List[str], audio_path: str, work_dir: str
+    ) -> None:
+        """Stream-copy concatenate rendered parts and mux in the soundtrack."""
+        concat_list = os.path.join(work_dir, "parts.txt")
+        with open(concat_list, "w", encoding="utf-8") as f:
+            for part_path in part_paths:
+                f.write(f"file '{os.path.abspath(part_path)}'\n")
+
+        subprocess.run(
+            [
+                FFMPEG_BINARY,
+                "-y",
+                "-loglevel",
+                "error",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                concat_list,
+                "-i",
+                audio_path,
+                "-map",
+                "0:v",
+                "-map",
+                "1:a",
+                "-c:v",
+                "copy",
+                "-c:a",
+                "aac",
+                "-movflags",
+                "+faststart",
+                self.output_path,
+            ],
+            check=True,
+        )
+
+    def _render_pipelined(self, audio_path: str) -> None:
+        """
+        Decode the background once, blend the overlays onto its frames in
+        worker processes and stream them through a shared-memory ring into a
+        single encoder.
+        """
+        self.prerender_captions()
+        # Workers only blend overlays onto frames decoded here, which needs
+        # the segment compositor
+        editor_kwargs = dict(self.worker_kwargs(), compositor="segment")
+        write_pipelined(
+            self.video,
+            _compose_for_pipeline,
+            (editor_kwargs, self.line_layout, self.current_start),
+            self.output_path,
+            self.video.size,
+            int(self.current_start * self.fps),
+            self.fps,
+            workers=self.render_workers,
+            ring_frames=PIPELINE_RING_FRAMES,
+            audio_path=audio_path,
+            audio_codec="aac",
+        )
+
+    def _render_filter_graph(self, audio_path: str, work_dir: str) -> None:
+        """
+        Render with a single ffmpeg filter graph built from the same layout, so no
+        frame passes through Python. Karaoke captions are sequenced as one image
+        per highlighted word.
+        """
+        layout = self.layout()
+        graph = FilterGraph(
+            self.background_cuts,
+            self.current_start,
+            self.fps,
+            # Already in the pre-mixed soundtrack
+            background_audio=False,
+            background_filter=(
+                None if self.use_proxy else profile_filter(self.output_size, self.fps)
+            ),
+        )
+        graph.add_audio(audio_path, 0)
+
+        if self.video_title:
+            title_path = os.path.join(work_dir, "title.png")
+            title_clip = self.create_title_clip(self.video_title, TITLE_DURATION)
+            save_rgba_png(title_clip, title_path)
+            title_clip.close()
+            graph.add_image(title_path, 0, TITLE_DURATION, "(W-w)/2", "(H-h)/2", rank=3)
+
+        word_timings = [
+            (
+                Utils.load_word_timings(entry["audio_path"])
+                if self.word_caption_renderer
+                else []
+            )
+            for entry in layout
+        ]
+        caption_paths = self.caption_renderer.render_many(
+            [
+                "" if words else entry["item"]["sentence"]
+                for entry, words in zip(layout, word_timings)
+            ]
+        )
+
+        caption_y = str(self.video.h // 2)
+        box_w, box_h = self.caption_renderer.box_size
+        blank_path = os.path.join(work_dir, "blank.png")
+        PIL.Image.new("RGBA", (box_w, box_h)).save(blank_path)
+        word_states: List[Tuple[float, str]] = [(0.0, blank_path)]
+
+        for idx, (entry, words, caption_path) in enumerate(
+            zip(layout, word_timings, caption_paths)
+        ):
+            item = entry["item"]
+            start, duration = entry["start"], entry["duration"]
+            end = start + duration
+
+            image_path = f"image_assests/{item['image']}"
+            if os.path.exists(image_path):
+                x = "50" if "peter" in image_path.lower() else "max(0,W-w-50)"
+                y = str(max(0, self.video.h - 500 - 50))
+                graph.add_image(image_path, start, end, x, y, height=500, rank=0)
+            else:
+                print(f"Avatar image not found: {image_path}")
+
+            context_image_path = item.get("context_image_path")
+            if context_image_path and os.path.exists(context_image_path):
+                graph.add_image(
+                    context_image_path,
+                    start,
+                    end,
+                    "(W-w)/2",
+                    "300",
+                    height=CONTEXT_IMAGE_HEIGHT,
+                    rank=1,
+                )
+
+            if words:
+                for state_idx, (offset, rgba) in enumerate(
+                    self.word_caption_renderer.states(words)
+                ):
+                    state_path = os.path.join(
+                        work_dir, f"words_{idx:05d}_{state_idx:04d}.png"
+                    )
+                    PIL.Image.fromarray(rgba, "RGBA").save(state_path, compress_level=1)
+                    word_states.append((start + offset, state_path))
+                word_states.append((end, blank_path))
+            elif caption_path:
+                graph.add_image(caption_path, start, end, "(W-w)/2", caption_y, rank=2)
+
+        if len(word_states) > 1:
+            graph.add_image_track(word_states, "(W-w)/2", caption_y)
+
+        graph.render(self.output_path, work_dir)
+
+    def edit(self) -> None:
+        output_dir = os.path.dirname(self.output_path) or "."
+        work_dir = tempfile.mkdtemp(prefix=".render_", dir=output_dir)
+
+        try:
+            audio_path = os.path.join(work_dir, "audio.wav")
+            if not self.mix_audio(audio_path):
+                print("No audio clips generated. Aborting video creation.")
+                return
+
+            if self.backend == "ffmpeg":
+                self._render_filter_graph(audio_path, work_dir)
+            elif self.backend == "pipeline":
+                self._render_pipelined(audio_path)
+            elif (
+                self.render_workers > 1
+                and len(self.plan_parts(self.render_workers)) > 1
+            ):
+                self._render_parallel(audio_path, work_dir)
+            else:
+                self.compose_video().write_videofile(
+                    self.output_path,
+                    codec="libx264",
+                    audio=audio_path,
+                    audio_codec="aac",
+                    fps=self.fps,
+                )
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _compose_for_pipeline(
+    editor_kwargs: Dict[str, Any],
+    line_layout: List[Dict[str, Any]],
+    total_duration: float,
+) -> VideoClip:
+    """Rebuild the composited video in a pipeline worker process."""
+    editor = DynamicVideoEditor(**editor_kwargs)
+    editor.line_layout = line_layout
+    editor.current_start = total_duration
+    return editor.compose_video()
+
+
+def _render_part(
+    editor_kwargs: Dict[str, Any],
+    line_layout: List[Dict[str, Any]],
+    total_duration: float,
+    frames: Tuple[int, int],
+    output_path: str,
+) -> None:
+    """
+    Render one frame range of the video (no audio) in a worker process.
+    Module-level so it can be pickled by the process pool.
+    """
+    editor = DynamicVideoEditor(**editor_kwargs)
+    editor.line_layout = line_layout
+    editor.current_start = total_duration
+
+    first_frame, end_frame = frames
+    t0, t1 = first_frame / editor.fps, end_frame / editor.fps
+    lines = [
+        entry["item"].get("id")
+        for entry in line_layout
+        if entry["start"] < t1 and entry["start"] + entry["duration"] > t0
+    ]
+    with tracer.span(
+        "render frames", cat="render", frames=end_frame - first_frame, lines=lines
+    ) as span_args:
+        start = time.monotonic()
+        video = editor.compose_video(window=(t0, t1))
+
+        # Half a frame of slack so float rounding can't drop the last frame
+        part = video.subclipped(t0, t1).with_duration(
+            (end_frame - first_frame + 0.5) / editor.fps
+        )
+        part.write_videofile(
+            output_path, codec="libx264", audio=False, fps=editor.fps, logger=None
+        )
+        span_args["fps"] = round(
+            (end_frame - first_frame) / (time.monotonic() - start), 1
         )
@@ -1,8 +1,26 @@
 import asyncio
 import os
+import json
 import logging
-import edge_tts
-from config import AUDIO_ASSETS_DIR, RUNTIME_LOGS_DIR
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from config import (
+    AUDIO_ASSETS_DIR,
+    RUNTIME_LOGS_DIR,
+    TTS_MAX_CONCURRENCY,
+    TTS_REQUEST_TIMEOUT,
+    TTS_MAX_RETRIES,
+    TTS_RATE,
+    TTS_VOLUME,
+    TTS_PITCH,
+    TTS_CACHE_DIR,
+    TTS_CACHE_MAX_BYTES,
+    TTS_WORDS_CACHE_DIR,
+)
+from disk_cache import DiskCache
+from tracing import queued_handler, tracer
+from utils import Utils
 import string
 
 # Define voice mappings
@@ -13,17 +31,59 @@ STEWIE_VOICE = (
 )
 
 
+def tts_cache_key(
+    text: str,
+    voice: str,
+    rate: str = TTS_RATE,
+    volume: str = TTS_VOLUME,
+    pitch: str = TTS_PITCH,
+) -> str:
+    """TTS cache key for an already-sanitized sentence and its voice/prosody settings."""
+    return DiskCache.make_key("tts", text, voice, rate, volume, pitch)
+
+
 class VoiceGenerator:
     """
     Generates audio using the edge-tts library (Microsoft Edge's free online TTS).
     No Selenium, no API keys, no rate limits (within reason).
     """
 
-    def __init__(self, proxy: str = None) -> None:
+    def __init__(
+        self,
+        proxy: str = None,
+        max_concurrency: int = TTS_MAX_CONCURRENCY,
+        request_timeout: float = TTS_REQUEST_TIMEOUT,
+        max_retries: int = TTS_MAX_RETRIES,
+        rate: str = TTS_RATE,
+        volume: str = TTS_VOLUME,
+        pitch: str = TTS_PITCH,
+        cache_dir: str = TTS_CACHE_DIR,
+        cache_max_bytes: int = TTS_CACHE_MAX_BYTES,
+    ) -> None:
         self.output_dir = AUDIO_ASSETS_DIR
         os.makedirs(self.output_dir, exist_ok=True)
         self.setup_logging()
         self.proxy = proxy
+        self.max_concurrency = max(1, max_concurrency)
+        self.request_timeout = request_timeout
+        self.max_retries = max(0, max_retries)
+        self.rate = rate
+        self.volume = volume
+        self.pitch = pitch
+        self.cache = DiskCache(
+            cache_dir, cache_max_bytes, suffix=".mp3", name="VoiceGenerator.cache"
+        )
+        # Word timings are tiny next to the audio; bound them by the same budget
+        self.word_cache = DiskCache(
+            TTS_WORDS_CACHE_DIR,
+            cache_max_bytes,
+            suffix=".json",
+            name="VoiceGenerator.word_cache",
+        )
+        # In-flight requests of each event loop; batches may run concurrently
+        # on separate threads, each with its own loop
+        self._inflight: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._inflight_lock = threading.Lock()
 
     def setup_logging(self) -> None:
         """Set up logging configuration"""
@@ -37,46 +97,295 @@ class VoiceGenerator:
             handler.setLevel(logging.DEBUG)
             formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
             handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
+            self.logger.addHandler(queued_handler(handler))
 
         self.logger.info("Logging initialized (edge-tts version).")
 
+    @staticmethod
+    def sanitize_text(text: str) -> str:
+        """Strip characters edge-tts would read out (or choke on), including markdown asterisks."""
+        return "".join(
+            c
+            for c in text
+            if (c.isalnum() or c in string.punctuation or c.isspace()) and c != "*"
+        )
+
+    @staticmethod
+    def voice_for(speaker: str) -> str:
+        """Select voice based on speaker name."""
+        return PETER_VOICE if speaker.lower() == "peter" else STEWIE_VOICE
+
+    def output_path_for(
+        self, speaker: str, index: int, output_dir: Optional[str] = None
+    ) -> str:
+        """Path of the audio file for a given speaker and dialogue index."""
+        filename = f"{speaker.lower()}_audio_{index}.mp3"
+        return os.path.join(output_dir or self.output_dir, filename)
+
     async def _generate_audio_file(
         self, text: str, voice: str, output_file: str
-    ) -> None:
+    ) -> List[Dict[str, Any]]:
         """
         Internal async method to generate audio using edge-tts.
+        Returns the word timings (seconds) from the WordBoundary events streamed
+        alongside the audio.
         """
+        # Imported on first use, so cached runs and stand-ins don't need it
+        import edge_tts
+
         try:
-            communicate = edge_tts.Communicate(text, voice, proxy=self.proxy)
-            await communicate.save(output_file)
+            communicate = edge_tts.Communicate(
+                text,
+                voice,
+                rate=self.rate,
+                volume=self.volume,
+                pitch=self.pitch,
+                boundary="WordBoundary",
+                proxy=self.proxy,
+            )
+            words: List[Dict[str, Any]] = []
+            with open(output_file, "wb") as audio_file:
+                async for chunk in communicate.stream():
+                    if chunk["type"] == "audio":
+                        audio_file.write(chunk["data"])
+                    elif chunk["type"] == "WordBoundary":
+                        # Offsets and durations are in 100-nanosecond ticks
+                        start = chunk["offset"] / 1e7
+                        words.append(
+                            {
+                                "text": chunk["text"],
+                                "start": start,
+                                "end": start + chunk["duration"] / 1e7,
+                            }
+                        )
+            return words
         except Exception as e:
             self.logger.error(f"Error in edge-tts generation: {e}")
             raise
 
+    def cache_key(self, text: str, voice: str) -> str:
+        """Cache key for an already-sanitized sentence and its voice/prosody settings."""
+        return tts_cache_key(text, voice, self.rate, self.volume, self.pitch)
+
+    async def _synthesize_into_cache(self, key: str, text: str, voice: str) -> None:
+        tmp_path = self.cache.reserve(key)
+        try:
+            with tracer.async_span(
+                "tts request", cat="tts", voice=voice, text=text[:60]
+            ):
+                words = await self._generate_audio_file(text, voice, tmp_path)
+        except BaseException:
+            self.cache.discard(tmp_path)
+            raise
+        tracer.count("tts.bytes", os.path.getsize(tmp_path))
+        self.word_cache.put_bytes(key, json.dumps(words).encode("utf-8"))
+        self.cache.commit(key, tmp_path)
+
+    async def _generate_cached(
+        self, text: str, voice: str, output_file: Optional[str]
+    ) -> str:
+        """
+        Serves the line from the TTS cache, synthesizing it first on a miss.
+        Identical lines in flight at the same time share one edge-tts request.
+
+        Returns:
+            str: ``output_file``, or the cache entry itself if it is None.
+        """
+        key = self.cache_key(text, voice)
+        if self.cache.get(key) is None or self.word_cache.get(key) is None:
+            with self._inflight_lock:
+                inflight = self._inflight.setdefault(asyncio.get_running_loop(), {})
+            shared = inflight.get(key)
+            if shared is None:
+                task = asyncio.ensure_future(
+                    self._synthesize_into_cache(key, text, voice)
+                )
+                shared = inflight[key] = {"task": task, "waiters": 0}
+                task.add_done_callback(
+                    lambda _, k=key, s=shared: inflight.get(k) is s and inflight.pop(k)
+                )
+            task = shared["task"]
+            shared["waiters"] += 1
+            try:
+                # Shielded so a timed-out waiter doesn't cancel a request others share
+                await asyncio.shield(task)
+            finally:
+                shared["waiters"] -= 1
+                if not shared["waiters"] and not task.done():
+                    # Nobody is waiting anymore: drop the request, so a retry
+                    # sends a new one, and hold the caller's semaphore slot
+                    # until it has really stopped
+                    if inflight.get(key) is shared:
+                        del inflight[key]
+                    task.cancel()
+                    await asyncio.wait([task])
+        else:
+            self.logger.info(f"Cache hit for '{output_file or text}'.")
+
+        if output_file is None:
+            return self.cache.path_for(key)
+        self.cache.materialize(key, output_file)
+        self.word_cache.materialize(key, Utils.word_timings_path(output_file))
+        return output_file
+
+    async def _generate_with_retries(
+        self,
+        semaphore: asyncio.Semaphore,
+        text: str,
+        voice: str,
+        output_file: Optional[str],
+    ) -> Optional[str]:
+        """
+        Runs one edge-tts request under the shared semaphore, with a per-attempt
+        timeout and jittered exponential backoff between retries.
+
+        Returns:
+            Optional[str]: The output path (the cache entry if ``output_file``
+                is None), or None if every attempt failed.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    return await asyncio.wait_for(
+                        self._generate_cached(text, voice, output_file),
+                        timeout=self.request_timeout,
+                    )
+            except Exception as e:
+                self.logger.warning(
+                    f"Attempt {attempt + 1}/{self.max_retries + 1} failed for "
+                    f"'{output_file or text}': {e!r}"
+                )
+                if attempt < self.max_retries:
+                    tracer.count("tts.retries")
+                    await asyncio.sleep(Utils.backoff_delay(attempt))
+
+        self.logger.error(f"Giving up on '{output_file or text}'.")
+        return None
+
+    async def _generate_batch_async(
+        self,
+        jobs: List[Tuple[str, str, Optional[str]]],
+        on_done: Optional[Callable[[int, Optional[str]], None]] = None,
+    ) -> List[Optional[str]]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop = asyncio.get_running_loop()
+
+        async def run(
+            position: int, job: Tuple[str, str, Optional[str]]
+        ) -> Optional[str]:
+            path = await self._generate_with_retries(semaphore, *job)
+            if on_done is not None:
+                # Off the loop, so a blocking callback can't stall other requests
+                await loop.run_in_executor(None, on_done, position, path)
+            return path
+
+        return await asyncio.gather(*(run(i, job) for i, job in enumerate(jobs)))
+
+    def generate_batch(
+        self,
+        items: List[Tuple[str, str, int]],
+        on_done: Optional[Callable[[int, Optional[str]], None]] = None,
+        output_dir: Optional[str] = None,
+    ) -> List[Optional[str]]:
+        """
+        Generates audio for many lines concurrently on a single event loop.
+
+        Args:
+            items (List[Tuple[str, str, int]]): (text, speaker, index) tuples, the
+                same arguments ``generate_audio`` takes.
+            on_done (Optional[Callable[[int, Optional[str]], None]]): Called with
+                (position in ``items``, output path or None) as each line
+                finishes, in completion order.
+            output_dir (Optional[str]): Where to write the files; the audio
+                assets directory if None.
+
+        Returns:
+            List[Optional[str]]: Output paths in the same order as ``items``;
+                None for lines that failed after all retries.
+        """
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        jobs = [
+            (
+                self.sanitize_text(text),
+                self.voice_for(speaker),
+                self.output_path_for(speaker, index, output_dir),
+            )
+            for text, speaker, index in items
+        ]
+
+        self.logger.info(
+            f"Generating {len(jobs)} audio files "
+            f"(concurrency={self.max_concurrency}, timeout={self.request_timeout}s, "
+            f"retries={self.max_retries})..."
+        )
+        results = asyncio.run(self._generate_batch_async(jobs, on_done))
+
+        failed = sum(1 for path in results if path is None)
+        self.logger.info(
+            f"Batch finished: {len(results) - failed} succeeded, {failed} failed. "
+            f"Cache: {self.cache.stats()}"
+        )
+        return results
+
+    def prefetch(
+        self,
+        items: List[Tuple[str, str]],
+        on_done: Optional[Callable[[int, Optional[str]], None]] = None,
+    ) -> List[Optional[str]]:
+        """
+        Synthesizes lines into the TTS cache only, without writing any output
+        file. Used to serve several scripts from one event loop; each script
+        then takes its lines out of the cache with ``materialize``.
+
+        Args:
+            items (List[Tuple[str, str]]): (text, speaker) pairs.
+            on_done (Optional[Callable[[int, Optional[str]], None]]): Called with
+                (position in ``items``, cache entry path or None) as each line
+                finishes.
+
+        Returns:
+            List[Optional[str]]: Cache entry paths in the same order as
+                ``items``; None for lines that failed after all retries.
+        """
+        jobs = [
+            (self.sanitize_text(text), self.voice_for(speaker), None)
+            for text, speaker in items
+        ]
+        self.logger.info(f"Prefetching {len(jobs)} lines into the TTS cache...")
+        return asyncio.run(self._generate_batch_async(jobs, on_done))
+
+    def materialize(self, text: str, speaker: str, output_file: str) -> Optional[str]:
+        """
+        Places an already-synthesized line (and its word timings) at
+        ``output_file``.
+
+        Returns:
+            Optional[str]: ``output_file``, or None if the line isn't cached.
+        """
+        key = self.cache_key(self.sanitize_text(text), self.voice_for(speaker))
+        if self.cache.get(key) is None or self.word_cache.get(key) is None:
+            return None
+        self.cache.materialize(key, output_file)
+        self.word_cache.materialize(key, Utils.word_timings_path(output_file))
+        return output_file
+
     def generate_audio(self, text: str, speaker: str, index: int) -> str:
         """
         Generates audio for a given text and speaker.
         Returns the path to the generated audio file.
         """
         try:
-            text = "".join(
-                c
-                for c in text
-                if (c.isalnum() or c in string.punctuation or c.isspace()) and c != "*"
-            )
-            # Select voice based on speaker name
-            voice = PETER_VOICE if speaker.lower() == "peter" else STEWIE_VOICE
-
-            filename = f"{speaker.lower()}_audio_{index}.mp3"
-            output_path = os.path.join(self.output_dir, filename)
+            text = self.sanitize_text(text)
+            voice = self.voice_for(speaker)
+            output_path = self.output_path_for(speaker, index)
 
             self.logger.info(
                 f"Generating audio for '{speaker}' using voice '{voice}'..."
             )
 
             # Run the async generation in a synchronous wrapper
-            asyncio.run(self._generate_audio_file(text, voice, output_path))
+            asyncio.run(self._generate_cached(text, voice, output_path))
 
             self.logger.info(f"Audio saved successfully at: {output_path}")
             return output_path